@@ -1,21 +1,100 @@
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import os
+from typing import Dict, Optional
 
 load_dotenv()
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DB_ECHO: bool = False # Logs every statement and its parameters; for local debugging only
+    DB_POOL_SIZE: int = 20 # Persistent connections; covers the outbox workers plus request handlers
+    DB_MAX_OVERFLOW: int = 20 # Extra connections opened during bursts and closed when returned
+    DB_POOL_TIMEOUT_SECONDS: float = 10 # Wait for a free connection before failing the checkout
+    DB_POOL_RECYCLE_SECONDS: int = 1800 # Replace connections before server/proxy idle timeouts close them
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 256 # asyncpg prepared statements cached per connection; 0 behind PgBouncer transaction pooling
     USER_MANAGEMENT_URL: str
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 2.0
+    HTTP_READ_TIMEOUT_SECONDS: float = 5.0
+    HTTP_POOL_TIMEOUT_SECONDS: float = 2.0
+    HTTP_ENABLE_HTTP2: bool = True
     AWS_ACCESS_KEY_ID: str
     AWS_SECRET_ACCESS_KEY: str
     AWS_REGION_NAME: str = "us-east-1"
+    SES_MAX_CONCURRENCY: int = 10
+    EMAIL_PROVIDER: str = "ses" # ses, smtp or fake (see app/providers)
+    SMS_PROVIDER: str = "fake" # http or fake
+    EMAIL_FROM_ADDRESS: str = "no-reply@rental-system.com" # Must be a verified SES identity when using ses
+    SMTP_HOST: str = "localhost"
+    SMTP_PORT: int = 1025 # Mailpit/MailHog default; 587 with SMTP_STARTTLS or 465 with SMTP_USE_SSL for a relay
+    SMTP_USERNAME: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+    SMTP_STARTTLS: bool = False
+    SMTP_USE_SSL: bool = False
+    SMTP_TIMEOUT_SECONDS: float = 10
+    SMTP_MAX_CONCURRENCY: int = 10
+    SMS_HTTP_URL: Optional[str] = None # Endpoint receiving {"to", "message"} when SMS_PROVIDER=http
+    SMS_HTTP_TOKEN: Optional[str] = None # Sent as a bearer token if set
+    FAKE_PROVIDER_LATENCY_MS: float = 100 # Median simulated send latency
+    FAKE_PROVIDER_LATENCY_SIGMA: float = 0.0 # Log-normal spread; 0 is a fixed delay, ~0.5-1 gives a realistic tail
+    FAKE_PROVIDER_ERROR_RATE: float = 0.0 # Fraction of sends that fail (transient errors)
+    FAKE_PROVIDER_PERMANENT_ERROR_RATE: float = 0.0 # Fraction of sends rejected outright (permanent errors)
+    FAKE_PROVIDER_OUTBOX_SIZE: int = 1000 # Accepted messages kept in memory
+    FAKE_PROVIDER_OVERRIDES: Dict[str, Dict[str, float]] = {} # Per channel, e.g. {"email": {"latency_ms": 250, "error_rate": 0.02}}
+    PROVIDER_SEND_RATES: Dict[str, Dict[str, float]] = {"ses": {"rate": 14, "burst": 14}} # Sends/second and burst per provider, shared by all replicas; set ses to the account's max send rate
+    PROVIDER_SEND_RATE_MAX_WAIT_SECONDS: float = 30 # Longest a send waits for a slot before failing (and being retried later)
+    PROVIDER_SEND_RATE_REDIS_ENABLED: bool = True # False paces each replica on its own
     JWT_SECRET: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CACHE_LOCAL_TTL_SECONDS: float = 60
+    AUTH_CACHE_SHARED_TTL_SECONDS: float = 900
+    AUTH_CACHE_REDIS_ENABLED: bool = False # False caches per replica: a revocation only reaches the replica that handled it, the others accept the token for up to AUTH_CACHE_LOCAL_TTL_SECONDS
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_LOCAL_TTL_SECONDS: float = 60
+    USER_CACHE_TTL_SECONDS: int = 3600
+    USER_NEGATIVE_CACHE_TTL_SECONDS: int = 300
+    USER_MANAGEMENT_BATCH_PATH: Optional[str] = None # e.g. "/api/v1/users/batch"; per-user fetches when unset
+    USER_MANAGEMENT_BATCH_SIZE: int = 100
+    USER_FETCH_CONCURRENCY: int = 10
     ADMIN_EMAIL: str = "admin@example.com"
+    RATE_LIMIT_WINDOW_SECONDS: int = 60
+    RATE_LIMIT_SEND_TIMES: int = 10
+    RATE_LIMIT_BATCH_ITEMS: int = 1000
+    NOTIFICATIONS_PAGE_SIZE: int = 50
+    NOTIFICATIONS_MAX_PAGE_SIZE: int = 500
+    EXPORT_BATCH_SIZE: int = 1000 # Rows fetched per server-side cursor round trip
+    EXPORT_CHUNK_ROWS: int = 500 # Rows per chunk written to the response
+    TEMPLATE_VERSIONS_RETAINED: int = 5 # Compiled versions kept in memory; older ones are restored from TEMPLATE_ARCHIVE_DIR
+    TEMPLATE_ARCHIVE_DIR: str = "archive/templates" # Every loaded templates file is kept here as <version>.json; empty disables
+    TEMPLATE_WATCH_INTERVAL_SECONDS: int = 30 # 0 disables the templates file watcher
+    STATS_TIMESERIES_MAX_BUCKETS: int = 1440 # Largest range /stats/timeseries answers in one request
+    STATS_ROLLUP_RETENTION_DAYS: int = 30
+    NOTIFICATION_PARTITIONS_AHEAD: int = 3 # Monthly partitions created ahead of the current month
+    NOTIFICATION_RETENTION_MONTHS: int = 12 # Older partitions are archived and dropped; 0 keeps everything
+    NOTIFICATION_ARCHIVE_DIR: str = "archive" # Where retired partitions are written as gzip NDJSON
+    RETRY_BATCH_SIZE: int = 100 # FAILED notifications claimed per retry batch
+    RETRY_CONCURRENCY: int = 10 # Retries delivered at once
+    RETRY_LEASE_SECONDS: int = 300 # How long a claimed retry is protected from other workers
+    RETRY_BASE_DELAY_SECONDS: float = 60 # Backoff before the first retry, doubled (by default) for each later one
+    RETRY_MAX_DELAY_SECONDS: float = 3600
+    RETRY_BACKOFF_MULTIPLIER: float = 2.0
+    RETRY_MAX_ATTEMPTS: int = 3
+    RETRY_POLICIES: Dict[str, Dict[str, float]] = {} # Per event type overrides, e.g. {"payment_failed": {"base_delay": 30, "max_attempts": 5}}
+    SCHEDULER_LEADER_ELECTION: bool = True # Run the sweep jobs on one replica at a time (Postgres advisory lock)
+    RETRY_JOB_TIMEOUT_SECONDS: float = 240 # Below the 5 minute interval, so a stuck run cannot meet the next one
+    MAINTENANCE_JOB_TIMEOUT_SECONDS: float = 3600 # Partition rotation/archival and rollup pruning
+    OUTBOX_WORKERS: int = 8
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 1.0
+    OUTBOX_LEASE_SECONDS: int = 300
 
     class Config:
         env_file = ".env"
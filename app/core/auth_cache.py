@@ -0,0 +1,95 @@
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import register_collector
+from app.utils.cache import TTLCache
+
+
+class VerifiedTokenCache:
+    """
+    Cache of principals returned by User Management's /auth/verify, keyed by a SHA-256 of the token.
+
+    Entries never outlive the token's `exp`. The in-process tier keeps a short TTL so that a revocation
+    made on another replica is picked up quickly; the optional Redis tier is shared by all replicas and
+    also records revocations. Redis failures degrade to the in-process tier instead of failing auth.
+    """
+
+    def __init__(self, maxsize: int, local_ttl: float, shared_ttl: float, redis_client: Optional[redis.Redis] = None):
+        self.local = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self.shared_ttl = shared_ttl
+        self.redis = redis_client
+
+    @staticmethod
+    def token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        token_hash = self.token_hash(token)
+        principal = self.local.get(token_hash)
+        if principal is not None or self.redis is None:
+            return principal
+
+        try:
+            cached, revoked = await self.redis.mget(f"auth_principal:{token_hash}", f"auth_revoked:{token_hash}")
+        except RedisError as e:
+            logger.warning("Verified token cache unavailable", error=str(e))
+            return None
+        if revoked or not cached:
+            return None
+        entry = json.loads(cached)
+        self.local.set(token_hash, entry["principal"], ttl=entry["exp"] - time.time() if entry.get("exp") else None)
+        return entry["principal"]
+
+    async def set(self, token: str, principal: Dict[str, Any], exp: Optional[int] = None):
+        token_hash = self.token_hash(token)
+        ttl = exp - time.time() if exp else self.shared_ttl
+        if ttl <= 0:
+            return
+        if self.redis is None:
+            self.local.set(token_hash, principal, ttl=ttl)
+            return
+        try:
+            # A verification that raced a revocation on another replica must not put the token back
+            if await self.redis.exists(f"auth_revoked:{token_hash}"):
+                return
+        except RedisError as e:
+            logger.warning("Verified token cache unavailable", error=str(e))
+        self.local.set(token_hash, principal, ttl=ttl)
+        try:
+            await self.redis.set(
+                f"auth_principal:{token_hash}",
+                json.dumps({"principal": principal, "exp": exp}),
+                ex=max(1, int(min(ttl, self.shared_ttl)))
+            )
+        except RedisError as e:
+            logger.warning("Failed to store verified token in shared cache", error=str(e))
+
+    async def revoke(self, token_hash: str, exp: Optional[int] = None):
+        """Drops a verified token from every tier and blocks it from being re-cached by other replicas."""
+        self.local.delete(token_hash)
+        if self.redis is None:
+            return
+        ttl = int(exp - time.time()) if exp else int(self.shared_ttl)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(f"auth_principal:{token_hash}")
+                pipe.set(f"auth_revoked:{token_hash}", "1", ex=max(1, ttl))
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Failed to record token revocation in shared cache", error=str(e))
+        logger.info("Verified token revoked", token_hash=token_hash)
+
+
+verified_token_cache = VerifiedTokenCache(
+    maxsize=settings.AUTH_CACHE_MAX_ENTRIES,
+    local_ttl=settings.AUTH_CACHE_LOCAL_TTL_SECONDS,
+    shared_ttl=settings.AUTH_CACHE_SHARED_TTL_SECONDS,
+    redis_client=redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0) if settings.AUTH_CACHE_REDIS_ENABLED else None,
+)
+
+register_collector("auth_cache", verified_token_cache.local.stats)
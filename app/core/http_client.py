@@ -0,0 +1,73 @@
+import httpx
+from typing import Any, Dict, Optional
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import register_collector
+
+# Process-wide client for calls to other services, owned by the app lifespan
+_http_client: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2 # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _build_http_client() -> httpx.AsyncClient:
+    http2 = settings.HTTP_ENABLE_HTTP2 and _http2_available()
+    if settings.HTTP_ENABLE_HTTP2 and not http2:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+    return httpx.AsyncClient(
+        http2=http2, # Negotiated via ALPN, so plain-HTTP or HTTP/1.1-only servers keep working
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            settings.HTTP_READ_TIMEOUT_SECONDS,
+            connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+            pool=settings.HTTP_POOL_TIMEOUT_SECONDS,
+        ),
+    )
+
+def init_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+        logger.info("Shared HTTP client created", max_connections=settings.HTTP_MAX_CONNECTIONS, max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS)
+    return _http_client
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it on first use outside the app lifespan (scripts, tests)."""
+    return init_http_client()
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("Shared HTTP client closed")
+
+def http_pool_stats() -> Dict[str, Any]:
+    if _http_client is None:
+        return {"open": False}
+    stats = {"open": not _http_client.is_closed, "max_connections": settings.HTTP_MAX_CONNECTIONS}
+    # httpx and httpcore do not expose pool state publicly; report what we can if their internals change
+    try:
+        pool = _http_client._transport._pool # httpcore.AsyncConnectionPool
+        connections = list(pool.connections)
+        requests = list(getattr(pool, "_requests", []))
+        stats.update({
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "http2_connections": sum(1 for c in connections if "HTTP/2" in repr(c)),
+            "in_flight_requests": len(requests),
+            "queued_requests": sum(1 for r in requests if getattr(r, "connection", None) is None),
+        })
+    except (AttributeError, TypeError):
+        stats["pool_stats_unavailable"] = True
+    return stats
+
+register_collector("http_pool", http_pool_stats)
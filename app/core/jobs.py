@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from sqlalchemy import text
+from app.core.logging import logger
+from app.core.metrics import register_collector
+from app.database import engine
+
+_runners: Dict[str, "JobRunner"] = {}
+
+
+def advisory_lock_key(name: str) -> int:
+    """Stable signed 64-bit key for pg_advisory_lock, derived from the job name."""
+    return int.from_bytes(hashlib.blake2b(f"job:{name}".encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+class JobRunner:
+    """
+    Wraps a periodic coroutine for the scheduler; schedule the bound `run` method.
+
+    A run is skipped while the previous one is still going, and cancelled after `timeout` seconds.
+    With `leader=True` the run first takes a session-level Postgres advisory lock on a dedicated
+    connection, so only one replica runs the job at a time; the lock is released with the run
+    (by discarding the connection if the unlock fails), or by Postgres if the replica dies. `fn` owns any database session it needs.
+    """
+
+    def __init__(self, name: str, fn: Callable[[], Awaitable[Any]], timeout: float, leader: bool = False):
+        self.name = name
+        self.fn = fn
+        self.timeout = timeout
+        self.leader = leader
+        self.lock_key = advisory_lock_key(name)
+        self._running = False
+        self.stats = {"runs": 0, "failures": 0, "timeouts": 0, "skipped_overlap": 0, "skipped_not_leader": 0, "last_duration_seconds": None}
+        _runners[name] = self
+
+    async def run(self):
+        if self._running:
+            self.stats["skipped_overlap"] += 1
+            logger.warning("Previous job run still in progress, skipping", job=self.name)
+            return
+        self._running = True
+        try:
+            if self.leader:
+                await self._run_as_leader()
+            else:
+                await self._run()
+        except Exception as e:
+            # Only the leader lock's own queries get here; the job's errors are handled in _run
+            self.stats["failures"] += 1
+            logger.error("Job leader election failed", job=self.name, error=str(e))
+        finally:
+            self._running = False
+
+    async def _run_as_leader(self):
+        async with engine.connect() as conn:
+            acquired = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key})).scalar()
+            await conn.commit() # The lock is session-level; do not sit idle in a transaction while the job runs
+            if not acquired:
+                self.stats["skipped_not_leader"] += 1
+                logger.info("Job is running on another replica, skipping", job=self.name)
+                return
+            try:
+                await self._run()
+            finally:
+                try:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+                    await conn.commit()
+                except BaseException:
+                    # The connection may still hold the lock; closing it instead of pooling it releases the lock
+                    await conn.invalidate()
+                    raise
+
+    async def _run(self):
+        started = time.monotonic()
+        self.stats["runs"] += 1
+        try:
+            await asyncio.wait_for(self.fn(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.error("Job run timed out and was cancelled", job=self.name, timeout=self.timeout)
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error("Job run failed", job=self.name, error=str(e))
+        finally:
+            self.stats["last_duration_seconds"] = round(time.monotonic() - started, 3)
+
+
+def job_stats() -> Dict[str, Dict[str, Optional[float]]]:
+    return {name: dict(runner.stats) for name, runner in _runners.items()}
+
+
+register_collector("scheduler_jobs", job_stats)
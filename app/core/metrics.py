@@ -0,0 +1,10 @@
+from typing import Any, Callable, Dict
+
+# Named callables returning a JSON-serialisable snapshot, exposed together on GET /metrics
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register_collector(name: str, collector: Callable[[], Dict[str, Any]]):
+    _collectors[name] = collector
+
+def collect_metrics() -> Dict[str, Any]:
+    return {name: collector() for name, collector in _collectors.items()}
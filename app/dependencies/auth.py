@@ -3,6 +3,8 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from app.config import settings
 import httpx
+from app.core.http_client import get_http_client
+from app.core.auth_cache import verified_token_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
@@ -20,22 +22,28 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
+    # Reuse a previous verification of this exact token while it is still valid
+    cached_user = await verified_token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
     # Verify token with User Management Microservice
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{settings.USER_MANAGEMENT_URL}/auth/verify",
-                headers={
-                    "Authorization": f"Bearer {token}"
-                }
-            )
-            response.raise_for_status()
-            user_data = response.json()
-            return user_data
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail="User verification failed")
-        except httpx.RequestError:
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="User management service unavailable")
+    client = get_http_client()
+    try:
+        response = await client.post(
+            f"{settings.USER_MANAGEMENT_URL}/auth/verify",
+            headers={
+                "Authorization": f"Bearer {token}"
+            }
+        )
+        response.raise_for_status()
+        user_data = response.json()
+        await verified_token_cache.set(token, user_data, exp=payload.get("exp"))
+        return user_data
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail="User verification failed")
+    except httpx.RequestError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="User management service unavailable")
 
 async def get_admin_user(current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "Admin":
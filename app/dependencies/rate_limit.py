@@ -0,0 +1,51 @@
+from typing import Callable, Optional
+from fastapi import Request, Response
+from fastapi_limiter import FastAPILimiter
+
+
+class WeightedRateLimiter:
+    """
+    Fixed-window rate limiter that charges a variable cost per request.
+
+    Shares fastapi-limiter's Redis connection, key prefix, identifier and callback contract,
+    but is invoked explicitly with the cost once it is known (e.g. the number of items in a batch).
+    """
+
+    lua_script = """local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local expire_time = ARGV[2]
+local cost = tonumber(ARGV[3])
+
+local current = tonumber(redis.call('get', key) or "0")
+if current + cost > limit then
+    local pttl = redis.call("PTTL", key)
+    if pttl <= 0 then
+        return tonumber(expire_time)
+    end
+    return pttl
+end
+if redis.call("INCRBY", key, cost) == cost then
+    redis.call("PEXPIRE", key, expire_time)
+end
+return 0"""
+
+    def __init__(self, times: int, seconds: int, identifier: Optional[Callable] = None, callback: Optional[Callable] = None):
+        self.times = times
+        self.milliseconds = 1000 * seconds
+        self.identifier = identifier
+        self.callback = callback
+        self._lua_sha: Optional[str] = None
+
+    async def __call__(self, request: Request, response: Response, cost: int = 1):
+        if not FastAPILimiter.redis:
+            raise Exception("You must call FastAPILimiter.init in startup event of fastapi!")
+        if self._lua_sha is None:
+            self._lua_sha = await FastAPILimiter.redis.script_load(self.lua_script)
+
+        identifier = self.identifier or FastAPILimiter.identifier
+        callback = self.callback or FastAPILimiter.http_callback
+        rate_key = await identifier(request)
+        key = f"{FastAPILimiter.prefix}:weighted:{rate_key}"
+        pexpire = await FastAPILimiter.redis.evalsha(self._lua_sha, 1, key, str(self.times), str(self.milliseconds), str(cost))
+        if pexpire != 0:
+            return await callback(request, response, pexpire)
@@ -1,17 +1,26 @@
-from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi import Depends, FastAPI, Request, Response, HTTPException
 from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 from app.core.logging import configure_logging, logger
-from app.routers import notifications
+from app.routers import notifications, auth
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from app.services.notification import retry_failed_notifications
+from app.services.notification import run_retry_job, template_registry
+from app.services.outbox import outbox_worker_pool
+from app.services.delivery_stats import prune_delivery_rollups
+from app.services.partitions import maintain_notification_partitions
+from app.providers import start_providers, close_providers
+from app.core.http_client import init_http_client, close_http_client
+from app.core.metrics import collect_metrics
+from app.dependencies.auth import get_admin_or_internal_user
+from app.core.jobs import JobRunner
 from fastapi_limiter import FastAPILimiter
 from redis.asyncio import Redis
 import os
-from app.database import AsyncSessionLocal # Import AsyncSessionLocal
+from datetime import datetime
+from app.database import get_db
 
 # Configure logging
 configure_logging()
@@ -28,33 +37,77 @@ async def lifespan(app: FastAPI):
     await FastAPILimiter.init(redis)
     logger.info("FastAPI-Limiter initialized.")
 
-    # Start scheduler
+    # Shared keep-alive HTTP client for User Management calls
+    init_http_client()
+
+    # Email/SMS providers selected by EMAIL_PROVIDER/SMS_PROVIDER (e.g. the shared SES transport)
+    await start_providers()
+
+    # Start outbox workers delivering PENDING notifications
+    await outbox_worker_pool.start()
+
+    # Start scheduler. Each job opens its own session per run (see JobRunner)
     scheduler.add_job(
-        retry_failed_notifications,
+        JobRunner("retry_failed_notifications", run_retry_job, timeout=settings.RETRY_JOB_TIMEOUT_SECONDS, leader=settings.SCHEDULER_LEADER_ELECTION).run,
         IntervalTrigger(minutes=5),
-        args=[AsyncSessionLocal()], # Pass a new session for the job
         id="retry_failed_notifications_job",
         name="Retry Failed Notifications",
-        misfire_grace_time=60 # seconds
+        misfire_grace_time=60, # seconds
+        coalesce=True,
+        max_instances=1
+    )
+    scheduler.add_job(
+        JobRunner("maintain_notification_partitions", maintain_notification_partitions, timeout=settings.MAINTENANCE_JOB_TIMEOUT_SECONDS, leader=settings.SCHEDULER_LEADER_ELECTION).run,
+        IntervalTrigger(hours=24),
+        next_run_time=datetime.now(), # Also run once at startup
+        id="maintain_notification_partitions_job",
+        name="Maintain Notification Partitions",
+        coalesce=True,
+        max_instances=1
     )
+    scheduler.add_job(
+        JobRunner("prune_delivery_rollups", prune_delivery_rollups, timeout=settings.MAINTENANCE_JOB_TIMEOUT_SECONDS, leader=settings.SCHEDULER_LEADER_ELECTION).run,
+        IntervalTrigger(hours=24),
+        id="prune_delivery_rollups_job",
+        name="Prune Delivery Rollups",
+        coalesce=True,
+        max_instances=1
+    )
+    if settings.TEMPLATE_WATCH_INTERVAL_SECONDS > 0:
+        scheduler.add_job(
+            template_registry.reload_if_changed,
+            IntervalTrigger(seconds=settings.TEMPLATE_WATCH_INTERVAL_SECONDS),
+            id="reload_notification_templates_job",
+            name="Reload Notification Templates",
+        )
     scheduler.start()
     logger.info("Scheduler started.")
 
     yield
 
     logger.info("Notification Microservice shutting down...")
+    # Stop outbox workers; leased rows are picked up again once their lease expires
+    await outbox_worker_pool.stop()
+    await close_providers()
+    await close_http_client()
+
     # Shut down scheduler
     scheduler.shutdown()
     logger.info("Scheduler shut down.")
 
-    # Close FastAPI-Limiter
-    await FastAPILimiter.shutdown()
+    # Close FastAPI-Limiter's Redis connection (fastapi-limiter 0.1.5 has close(), not shutdown())
+    await FastAPILimiter.close()
     logger.info("FastAPI-Limiter closed.")
 
 app = FastAPI(lifespan=lifespan, title="Notification Microservice", version="1.0.0")
 
 app.include_router(notifications.router)
+app.include_router(auth.router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics")
+async def metrics(current_user: dict = Depends(get_admin_or_internal_user)): # Pool, job and provider internals; scrape with an internal token
+    return collect_metrics()
@@ -0,0 +1,105 @@
+"""
+Applies the versioned SQL migrations in sql/migrations in order, recording each one in schema_migrations.
+
+    python -m app.migrate          # apply pending migrations
+    python -m app.migrate --seed   # ...then load sql/seed.sql
+"""
+import argparse
+import asyncio
+import hashlib
+import re
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+import asyncpg
+from sqlalchemy.engine import make_url
+from app.config import settings
+from app.core.logging import configure_logging, logger
+
+SQL_DIR = Path(__file__).parent.parent / "sql"
+MIGRATIONS_DIR = SQL_DIR / "migrations"
+SEED_FILE = SQL_DIR / "seed.sql"
+MIGRATIONS_LOCK_ID = 7_320_145 # pg_advisory_lock key serializing concurrent runners
+
+_MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    sql: str
+    checksum: str
+
+
+def discover_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = {}
+    for path in sorted(directory.glob("*.sql")):
+        match = _MIGRATION_FILE.match(path.name)
+        if not match:
+            raise ValueError(f"Migration file name must look like NNNN_description.sql: {path.name}")
+        version, name = match.groups()
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version}: {path.name}")
+        sql = path.read_text(encoding="utf-8")
+        migrations[version] = Migration(version, name, sql, hashlib.sha256(sql.encode("utf-8")).hexdigest())
+    return [migrations[version] for version in sorted(migrations)]
+
+
+async def apply_migrations(conn: asyncpg.Connection, migrations: Optional[List[Migration]] = None) -> List[str]:
+    """Applies every migration not yet in schema_migrations, each in its own transaction. Returns the applied versions."""
+    migrations = discover_migrations() if migrations is None else migrations
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(4) PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum CHAR(64) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_ID)
+    try:
+        applied = {row["version"]: row["checksum"] for row in await conn.fetch("SELECT version, checksum FROM schema_migrations")}
+        newly_applied = []
+        for migration in migrations:
+            if migration.version in applied:
+                if applied[migration.version] != migration.checksum:
+                    logger.warning("Applied migration changed on disk; add a new migration instead", version=migration.version, name=migration.name)
+                continue
+            async with conn.transaction():
+                await conn.execute(migration.sql)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3)",
+                    migration.version, migration.name, migration.checksum
+                )
+            newly_applied.append(migration.version)
+            logger.info("Migration applied", version=migration.version, name=migration.name)
+        return newly_applied
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_ID)
+
+
+def _asyncpg_dsn(database_url: str) -> str:
+    return make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def _run(seed: bool):
+    conn = await asyncpg.connect(_asyncpg_dsn(settings.DATABASE_URL))
+    try:
+        applied = await apply_migrations(conn)
+        logger.info("Database schema up to date", applied=applied)
+        if seed:
+            await conn.execute(SEED_FILE.read_text(encoding="utf-8"))
+            logger.info("Seed data loaded", path=str(SEED_FILE))
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations.")
+    parser.add_argument("--seed", action="store_true", help="load sql/seed.sql after migrating")
+    args = parser.parse_args()
+    configure_logging()
+    asyncio.run(_run(args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, TIMESTAMP, Integer
+from sqlalchemy import Column, String, Text, TIMESTAMP, Integer, BigInteger, Index, DDL, event, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -15,9 +15,86 @@ class Notification(Base):
     status = Column(String(20), nullable=False, default="PENDING")
     attempts = Column(Integer, default=0)
     context = Column(JSONB, nullable=False)
+    template_version = Column(String(50), nullable=True) # Template version used to render (and re-render on retry)
     sent_at = Column(TIMESTAMP, nullable=True)
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    locked_until = Column(TIMESTAMP, nullable=True) # Lease held by the worker delivering this row
+    next_attempt_at = Column(TIMESTAMP, nullable=True) # When a FAILED row is next due for retry; NULL once retries are exhausted
+    created_at = Column(TIMESTAMP, primary_key=True, default=datetime.utcnow) # Partition key, so part of the primary key
     updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), alone or after an equality filter
+        Index("idx_notifications_created_at_id", "created_at", "id"),
+        Index("idx_notifications_user_created", "user_id", "created_at", "id"),
+        Index("idx_notifications_event_created", "event_type", "created_at", "id"),
+        Index("idx_notifications_status_created", "status", "created_at", "id"),
+        Index("idx_notifications_event_status_created", "event_type", "status", "created_at", "id"),
+        # Outbox claims and the retry job only touch a small slice of the table
+        Index("idx_notifications_pending", "created_at", postgresql_where=text("status = 'PENDING'")),
+        Index("idx_notifications_next_attempt", "next_attempt_at", postgresql_where=text("status = 'FAILED' AND next_attempt_at IS NOT NULL")),
+        Index("idx_notifications_created_at_brin", "created_at", postgresql_using="brin"),
+        # Monthly range partitions; see sql/migrations/0003_partition_notifications.sql
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # The ORM identifies notifications by id alone, so session.get(Notification, id) keeps working
+    __mapper_args__ = {"primary_key": [id]}
+
     def __repr__(self):
         return f"<Notification(id='{self.id}', user_id='{self.user_id}', event_type='{self.event_type}', status='{self.status}')>"
+
+# Tables built with metadata.create_all (tests) only get the catch-all partition; migrated databases also get monthly
+# ones (sql/migrations/0003, 0007)
+event.listen(
+    Notification.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS notifications_default PARTITION OF notifications DEFAULT"),
+)
+
+
+class NotificationStatusCounter(Base):
+    """Per (event_type, status) notification counts, maintained by triggers on notifications (see sql/migrations)."""
+    __tablename__ = "notification_status_counters"
+
+    event_type = Column(String(50), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+class NotificationDeliveryRollup(Base):
+    """Per-minute delivery outcomes with a latency histogram, written by the delivery path."""
+    __tablename__ = "notification_delivery_rollups"
+
+    bucket_start = Column(TIMESTAMP, primary_key=True) # Minute the outcome was recorded in
+    event_type = Column(String(50), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    latency_le_ms = Column(Integer, primary_key=True) # Upper bound of the sent_at - created_at bucket
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+class NotificationDelivery(Base):
+    """One channel's delivery of a notification; notifications.status is SENT once every channel is SENT."""
+    __tablename__ = "notification_deliveries"
+
+    notification_id = Column(UUID(as_uuid=True), primary_key=True)
+    notification_created_at = Column(TIMESTAMP, nullable=False) # The parent's partition key; no FK, see sql/migrations/0005
+    channel = Column(String(20), primary_key=True) # "email" or "sms"
+    status = Column(String(20), nullable=False) # SENT, FAILED (retried) or REJECTED (permanent, never resent)
+    attempts = Column(Integer, nullable=False, default=1)
+    provider_message_id = Column(String(255), nullable=True)
+    last_error = Column(Text, nullable=True)
+    sent_at = Column(TIMESTAMP, nullable=True)
+    created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_notification_deliveries_notification_created_at", "notification_created_at"),
+    )
+
+
+class NotificationChannelCounter(Base):
+    """Per (channel, status) delivery counts, maintained by triggers on notification_deliveries."""
+    __tablename__ = "notification_channel_counters"
+
+    channel = Column(String(20), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
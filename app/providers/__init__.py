@@ -0,0 +1,7 @@
+"""
+Channel providers. `get_provider("email")` / `get_provider("sms")` return the implementation selected by
+EMAIL_PROVIDER / SMS_PROVIDER; new implementations subclass ChannelProvider and use `register_provider`.
+"""
+from app.providers.base import CHANNELS, ChannelProvider, register_provider, registered_providers, get_provider, start_providers, close_providers
+# Importing the implementations registers them
+from app.providers import fake, http_sms, ses, smtp # noqa: F401
@@ -0,0 +1,100 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from app.config import settings
+from app.core.logging import logger
+from app.core.metrics import register_collector
+from app.providers.rate_governor import SendRateGovernor, governor_for
+
+CHANNELS = ("email", "sms")
+
+_provider_classes: Dict[Tuple[str, str], Type["ChannelProvider"]] = {}
+_active_providers: Dict[str, "ChannelProvider"] = {}
+
+
+class ChannelProvider:
+    """
+    Sends messages over one channel. Subclasses implement `_send`; `start`/`close` hold any long-lived
+    resources and are called from the app lifespan. With a `governor`, every send first waits for a slot
+    in the provider's send rate quota.
+    """
+
+    name = ""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.governor: Optional[SendRateGovernor] = None
+        self.stats = {"sent": 0, "failed": 0}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def send(self, recipient: str, subject: str, body: str) -> str:
+        """Sends one message and returns the provider's message id; raises if the provider did not accept it."""
+        try:
+            if self.governor is not None:
+                await self.governor.acquire()
+            message_id = await self._send(recipient, subject, body)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        self.stats["sent"] += 1
+        return message_id
+
+    async def _send(self, recipient: str, subject: str, body: str) -> str:
+        raise NotImplementedError
+
+
+def register_provider(channel: str, name: str) -> Callable[[Type[ChannelProvider]], Type[ChannelProvider]]:
+    """Class decorator making a provider selectable as `name` for `channel`; stack it to serve several channels."""
+    def decorator(cls: Type[ChannelProvider]) -> Type[ChannelProvider]:
+        _provider_classes[(channel, name)] = cls
+        cls.name = name
+        return cls
+    return decorator
+
+
+def registered_providers(channel: str) -> List[str]:
+    return sorted(name for provider_channel, name in _provider_classes if provider_channel == channel)
+
+
+def _configured_provider(channel: str) -> str:
+    return {"email": settings.EMAIL_PROVIDER, "sms": settings.SMS_PROVIDER}[channel]
+
+
+def get_provider(channel: str) -> ChannelProvider:
+    """The process-wide provider for `channel`, created on first use from the configured name."""
+    provider = _active_providers.get(channel)
+    if provider is None:
+        name = _configured_provider(channel)
+        cls = _provider_classes.get((channel, name))
+        if cls is None:
+            raise ValueError(f"Unknown {channel} provider {name!r}; registered: {registered_providers(channel)}")
+        provider = _active_providers[channel] = cls(channel)
+        provider.governor = governor_for(channel, name)
+    return provider
+
+
+async def start_providers():
+    """Creates and starts the configured provider for every channel, so a bad setting fails at startup."""
+    for channel in CHANNELS:
+        provider = get_provider(channel)
+        await provider.start()
+        logger.info("Channel provider started", channel=channel, provider=provider.name, send_rate=provider.governor.rate if provider.governor else None)
+
+
+async def close_providers():
+    for channel, provider in list(_active_providers.items()):
+        await provider.close()
+        del _active_providers[channel]
+
+
+def provider_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        channel: {"provider": provider.name, **provider.stats, "send_rate": dict(provider.governor.stats) if provider.governor else None}
+        for channel, provider in _active_providers.items()
+    }
+
+
+register_collector("channel_providers", provider_stats)
@@ -0,0 +1,58 @@
+import asyncio
+import math
+import random
+from collections import deque
+from typing import Optional
+from uuid import uuid4
+from app.config import settings
+from app.core.logging import logger
+from app.providers.base import ChannelProvider, register_provider
+from app.utils.retry import PermanentError
+
+
+class FakeProviderError(Exception):
+    pass
+
+
+class FakeProviderRejection(PermanentError):
+    pass
+
+
+@register_provider("email", "fake")
+@register_provider("sms", "fake")
+class FakeProvider(ChannelProvider):
+    """
+    In-memory stand-in for local runs and load tests: nothing leaves the process. Each send waits a
+    log-normal latency (median FAKE_PROVIDER_LATENCY_MS, spread FAKE_PROVIDER_LATENCY_SIGMA; 0 is a fixed
+    delay), fails with probability FAKE_PROVIDER_ERROR_RATE and rejects the message outright (a permanent error)
+    with probability FAKE_PROVIDER_PERMANENT_ERROR_RATE. Accepted messages are kept in `outbox`.
+    FAKE_PROVIDER_OVERRIDES sets any of these per channel.
+    """
+
+    def __init__(self, channel: str, rng: Optional[random.Random] = None):
+        super().__init__(channel)
+        overrides = settings.FAKE_PROVIDER_OVERRIDES.get(channel, {})
+        self.latency_ms = overrides.get("latency_ms", settings.FAKE_PROVIDER_LATENCY_MS)
+        self.latency_sigma = overrides.get("latency_sigma", settings.FAKE_PROVIDER_LATENCY_SIGMA)
+        self.error_rate = overrides.get("error_rate", settings.FAKE_PROVIDER_ERROR_RATE)
+        self.permanent_error_rate = overrides.get("permanent_error_rate", settings.FAKE_PROVIDER_PERMANENT_ERROR_RATE)
+        self.outbox = deque(maxlen=settings.FAKE_PROVIDER_OUTBOX_SIZE)
+        self._random = rng or random.Random()
+
+    def sample_latency(self) -> float:
+        """One send's simulated latency in seconds."""
+        if self.latency_ms <= 0:
+            return 0.0
+        return self._random.lognormvariate(math.log(self.latency_ms), self.latency_sigma) / 1000
+
+    async def _send(self, recipient: str, subject: str, body: str) -> str:
+        await asyncio.sleep(self.sample_latency())
+        roll = self._random.random()
+        if roll < self.permanent_error_rate:
+            raise FakeProviderRejection(f"Simulated {self.channel} provider rejection")
+        if roll < self.permanent_error_rate + self.error_rate:
+            raise FakeProviderError(f"Simulated {self.channel} provider failure")
+        message_id = f"fake-{uuid4()}"
+        self.outbox.append({"message_id": message_id, "recipient": recipient, "subject": subject, "body": body})
+        logger.info("Fake provider accepted message", channel=self.channel, recipient=recipient, message_id=message_id)
+        return message_id
@@ -0,0 +1,42 @@
+from typing import Optional
+from uuid import uuid4
+import httpx
+from app.config import settings
+from app.core.http_client import get_http_client
+from app.providers.base import ChannelProvider, register_provider
+from app.utils.retry import PERMANENT, THROTTLED, ErrorClassification, register_error_classifier
+
+
+@register_provider("sms", "http")
+class HTTPSMSProvider(ChannelProvider):
+    """
+    Posts {"to", "message"} as JSON to SMS_HTTP_URL on the shared HTTP client, for SMS gateways with a
+    plain HTTP API or a local stand-in. The response's "message_id" (or "id") is the message id.
+    """
+
+    async def start(self):
+        if not settings.SMS_HTTP_URL:
+            raise ValueError("SMS_PROVIDER=http requires SMS_HTTP_URL")
+
+    async def _send(self, recipient: str, subject: str, body: str) -> str:
+        headers = {"Authorization": f"Bearer {settings.SMS_HTTP_TOKEN}"} if settings.SMS_HTTP_TOKEN else None
+        response = await get_http_client().post(settings.SMS_HTTP_URL, json={"to": recipient, "message": body}, headers=headers)
+        response.raise_for_status()
+        data = response.json() if response.content else {}
+        return str(data.get("message_id") or data.get("id") or uuid4())
+
+
+def classify_http_error(error: BaseException) -> Optional[ErrorClassification]:
+    """429 is throttling (honouring Retry-After in seconds); other 4xx except 408 are permanent; 5xx are transient."""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    status_code = error.response.status_code
+    if status_code == 429:
+        retry_after = error.response.headers.get("Retry-After", "")
+        return ErrorClassification(THROTTLED, float(retry_after) if retry_after.isdigit() else None)
+    if 400 <= status_code < 500 and status_code != 408:
+        return ErrorClassification(PERMANENT)
+    return None
+
+
+register_error_classifier(classify_http_error)
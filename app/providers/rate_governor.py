@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Optional
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from app.config import settings
+from app.core.logging import logger
+from app.utils.retry import ThrottledError
+
+# Shared by the governors of every provider; connections are only opened on first use
+governor_redis = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0)
+
+
+class SendRateExceeded(ThrottledError):
+    """The next free send slot is further away than the governor's max wait; the send is left for a later retry."""
+
+
+class SendRateGovernor:
+    """
+    GCRA rate limiter (a token bucket stored as a single "theoretical arrival time") allowing `rate` sends per
+    second with bursts of up to `burst`.
+
+    The state lives in Redis and is updated atomically by one Lua script on the Redis clock, so every replica
+    draws from the same provider quota. `acquire` reserves the next free slot and sleeps until it comes up, so
+    concurrent senders are spaced out to the quota instead of bursting into the provider's throttling.
+    Without Redis (or while it is unreachable) each replica paces itself in-process at the full rate.
+    """
+
+    lua_script = """local key = KEYS[1]
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local tat = tonumber(redis.call('GET', key) or now)
+if tat < now then
+    tat = now
+end
+local wait = tat - tolerance - now
+if wait > max_wait then
+    return -math.ceil(wait)
+end
+local new_tat = tat + interval
+redis.call('SET', key, string.format('%.0f', new_tat), 'PX', math.ceil((new_tat - now) / 1000) + 1000)
+if wait < 0 then
+    return 0
+end
+return math.ceil(wait)"""
+
+    def __init__(self, key: str, rate: float, burst: int = 1, max_wait: float = 30.0, redis_client: Optional[redis.Redis] = None):
+        self.key = key
+        self.rate = rate
+        self.burst = max(int(burst), 1)
+        self.max_wait = max_wait
+        # All times in microseconds
+        self.interval_us = 1_000_000 / rate
+        self.tolerance_us = self.interval_us * (self.burst - 1)
+        self.max_wait_us = max_wait * 1_000_000
+        self._script = redis_client.register_script(self.lua_script) if redis_client is not None else None
+        self._local_tat = 0.0
+        self.stats = {"rate": rate, "burst": self.burst, "acquired": 0, "delayed": 0, "wait_seconds_total": 0.0, "rejected": 0, "redis_errors": 0}
+
+    def _reserve_locally(self) -> int:
+        now = time.monotonic() * 1_000_000
+        tat = max(self._local_tat, now)
+        wait = tat - self.tolerance_us - now
+        if wait > self.max_wait_us:
+            return -max(1, int(wait))
+        self._local_tat = tat + self.interval_us
+        return max(0, int(wait))
+
+    async def _reserve(self) -> int:
+        """Microseconds to wait for the reserved slot; negative (minus the wait) if none is free within max_wait."""
+        if self._script is not None:
+            try:
+                # Whole microseconds keep the stored timestamp exact (Lua numbers print with 14 significant digits otherwise)
+                args = [round(self.interval_us), round(self.tolerance_us), round(self.max_wait_us)]
+                return int(await self._script(keys=[self.key], args=args))
+            except RedisError as e:
+                self.stats["redis_errors"] += 1
+                logger.warning("Shared send rate governor unavailable, pacing this replica only", key=self.key, error=str(e))
+        return self._reserve_locally()
+
+    async def acquire(self):
+        wait_us = await self._reserve()
+        if wait_us < 0:
+            self.stats["rejected"] += 1
+            raise SendRateExceeded(f"No send slot for {self.key} within {self.max_wait}s at {self.rate}/s", retry_after=-wait_us / 1_000_000)
+        self.stats["acquired"] += 1
+        if wait_us:
+            self.stats["delayed"] += 1
+            self.stats["wait_seconds_total"] += wait_us / 1_000_000
+            await asyncio.sleep(wait_us / 1_000_000)
+
+
+def governor_for(channel: str, provider_name: str) -> Optional[SendRateGovernor]:
+    """The governor for a provider with an entry in PROVIDER_SEND_RATES, or None if it is not rate limited."""
+    limit = settings.PROVIDER_SEND_RATES.get(provider_name)
+    if not limit:
+        return None
+    return SendRateGovernor(
+        f"send_rate:{channel}:{provider_name}",
+        rate=limit["rate"],
+        burst=limit.get("burst", 1),
+        max_wait=settings.PROVIDER_SEND_RATE_MAX_WAIT_SECONDS,
+        redis_client=governor_redis if settings.PROVIDER_SEND_RATE_REDIS_ENABLED else None,
+    )
@@ -0,0 +1,48 @@
+from typing import Optional
+from botocore.exceptions import ClientError
+from app.config import settings
+from app.providers.base import ChannelProvider, register_provider
+from app.services.email_transport import ses_transport
+from app.utils.retry import PERMANENT, THROTTLED, ErrorClassification, register_error_classifier
+
+# SES error codes for a message that will be rejected however often it is sent
+_PERMANENT_ERROR_CODES = {"MessageRejected", "InvalidParameterValue", "MailFromDomainNotVerified", "MailFromDomainNotVerifiedException"}
+# Send rate or daily quota exceeded
+_THROTTLING_ERROR_CODES = {"Throttling", "ThrottlingException", "TooManyRequestsException"}
+
+
+@register_provider("email", "ses")
+class SESEmailProvider(ChannelProvider):
+    """Amazon SES over the shared SESTransport (one boto3 client on a bounded thread pool)."""
+
+    async def start(self):
+        ses_transport.start()
+
+    async def close(self):
+        await ses_transport.close()
+
+    async def _send(self, recipient: str, subject: str, body: str) -> str:
+        response = await ses_transport.send_email(
+            Source=settings.EMAIL_FROM_ADDRESS,
+            Destination={'ToAddresses': [recipient]},
+            Message={
+                'Subject': {'Data': subject},
+                'Body': {'Text': {'Data': body}}
+            }
+        )
+        return response['MessageId']
+
+
+def classify_ses_error(error: BaseException) -> Optional[ErrorClassification]:
+    if not isinstance(error, ClientError):
+        return None
+    code = error.response.get("Error", {}).get("Code")
+    if code in _PERMANENT_ERROR_CODES:
+        return ErrorClassification(PERMANENT)
+    if code in _THROTTLING_ERROR_CODES:
+        retry_after = error.response.get("ResponseMetadata", {}).get("HTTPHeaders", {}).get("retry-after")
+        return ErrorClassification(THROTTLED, float(retry_after) if retry_after and retry_after.isdigit() else None)
+    return None
+
+
+register_error_classifier(classify_ses_error)
@@ -0,0 +1,54 @@
+import asyncio
+import smtplib
+from email.message import EmailMessage
+from email.utils import make_msgid
+from typing import Optional
+from app.config import settings
+from app.providers.base import ChannelProvider, register_provider
+from app.utils.retry import PERMANENT, ErrorClassification, register_error_classifier
+
+
+@register_provider("email", "smtp")
+class SMTPEmailProvider(ChannelProvider):
+    """
+    Any SMTP server: a relay in production, or Mailpit/MailHog on a laptop. smtplib is blocking, so each
+    message is sent on a worker thread over its own connection, at most SMTP_MAX_CONCURRENCY at a time.
+    """
+
+    def __init__(self, channel: str):
+        super().__init__(channel)
+        self._semaphore = asyncio.Semaphore(settings.SMTP_MAX_CONCURRENCY)
+
+    def _deliver(self, message: EmailMessage):
+        smtp_class = smtplib.SMTP_SSL if settings.SMTP_USE_SSL else smtplib.SMTP
+        with smtp_class(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS) as server:
+            if settings.SMTP_STARTTLS:
+                server.starttls()
+            if settings.SMTP_USERNAME:
+                server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD or "")
+            server.send_message(message)
+
+    async def _send(self, recipient: str, subject: str, body: str) -> str:
+        message = EmailMessage()
+        message["From"] = settings.EMAIL_FROM_ADDRESS
+        message["To"] = recipient
+        message["Subject"] = subject
+        message["Message-ID"] = make_msgid()
+        message.set_content(body)
+        async with self._semaphore:
+            await asyncio.to_thread(self._deliver, message)
+        return message["Message-ID"]
+
+
+def classify_smtp_error(error: BaseException) -> Optional[ErrorClassification]:
+    """5xx replies are permanent (unknown mailbox, rejected content); 4xx ones are retried as transient."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    elif isinstance(error, smtplib.SMTPResponseException):
+        codes = [error.smtp_code]
+    else:
+        return None
+    return ErrorClassification(PERMANENT) if codes and all(code >= 500 for code in codes) else None
+
+
+register_error_classifier(classify_smtp_error)
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, status
+from jose import JWTError, jwt
+from app.schemas.auth import TokenRevokeRequest
+from app.dependencies.auth import get_admin_or_internal_user
+from app.core.auth_cache import verified_token_cache
+
+router = APIRouter(prefix="/api/v1/auth", tags=["auth"])
+
+@router.post("/revoke", status_code=status.HTTP_200_OK)
+async def revoke_token_endpoint(
+    request: TokenRevokeRequest,
+    current_user: dict = Depends(get_admin_or_internal_user) # Called by User Management on logout/ban
+):
+    """Evict a token from the verified-token cache so it is checked against User Management again."""
+    try:
+        exp = jwt.get_unverified_claims(request.token).get("exp")
+    except JWTError:
+        exp = None
+    await verified_token_cache.revoke(verified_token_cache.token_hash(request.token), exp=exp)
+    return {"message": "Token revoked."}
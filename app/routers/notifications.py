@@ -1,56 +1,115 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
-from uuid import UUID
-from typing import List, Optional
-from app.schemas.notification import NotificationCreate, NotificationResponse, NotificationStatsResponse
-from app.services.notification import send_notification_service, get_notification_by_id, get_notifications_filtered, retry_failed_notifications, get_notification_stats
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from math import ceil
+from uuid import UUID, uuid4
+from typing import List, Optional, Literal
+from fastapi.responses import StreamingResponse
+from app.schemas.notification import NotificationCreate, NotificationResponse, NotificationStatsResponse, NotificationBatchCreate, NotificationBatchResponse, NotificationBatchItemResult, NotificationPageResponse, NotificationTimeseriesResponse
+from app.services.notification import enqueue_notification, enqueue_notifications_bulk, validate_notification_request, template_registry, get_notification_by_id, get_notifications_page, retry_failed_notifications, get_notification_stats
+from app.services.outbox import outbox_worker_pool
+from app.services.export import export_notifications
+from app.services.delivery_stats import get_delivery_timeseries, truncate_to_interval, INTERVAL_SECONDS
 from app.dependencies.auth import get_admin_or_internal_user, get_admin_user
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.main import get_db
+from app.database import get_db
 from fastapi_limiter.depends import RateLimiter
+from app.dependencies.rate_limit import WeightedRateLimiter
+from app.config import settings
 from app.core.logging import logger # Import logger
+from app.utils.pagination import encode_cursor, decode_cursor
+from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/api/v1/notifications", tags=["notifications"])
 
-async def rate_limit_callback(request: Request, exc: HTTPException):
+async def rate_limit_callback(request: Request, response: Response, pexpire: int):
     """Custom callback for rate limit exceeded."""
     client_ip = request.client.host if request.client else "unknown"
-    logger.warning("Rate limit exceeded", event="rate_limit_exceeded", ip=client_ip, path=request.url.path)
-    raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests")
+    logger.warning("Rate limit exceeded", event_name="rate_limit_exceeded", ip=client_ip, path=request.url.path)
+    raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests", headers={"Retry-After": str(ceil(pexpire / 1000))})
+
+# Batch sends are charged per item rather than per request
+batch_rate_limiter = WeightedRateLimiter(times=settings.RATE_LIMIT_BATCH_ITEMS, seconds=settings.RATE_LIMIT_WINDOW_SECONDS, callback=rate_limit_callback)
 
 @router.post("/send", response_model=NotificationResponse, status_code=status.HTTP_202_ACCEPTED,
-             dependencies=[Depends(RateLimiter(times=10, seconds=60, callback=rate_limit_callback))]) # Apply rate limiting here
+             dependencies=[Depends(RateLimiter(times=settings.RATE_LIMIT_SEND_TIMES, seconds=settings.RATE_LIMIT_WINDOW_SECONDS, callback=rate_limit_callback))]) # Apply rate limiting here
 async def send_notification_endpoint(
     notification: NotificationCreate,
     current_user: dict = Depends(get_admin_or_internal_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Send a notification (email/SMS) for a specific event to a user."""
+    """Queue a notification (email/SMS) for a specific event to a user. Delivery happens asynchronously."""
     try:
-        notification_record = await send_notification_service(db, notification.user_id, notification.event_type, notification.context)
-        return NotificationResponse.model_validate(notification_record)
+        validate_notification_request(notification.event_type, notification.context)
     except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    try:
+        notification_record = await enqueue_notification(db, notification.user_id, notification.event_type, notification.context)
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to send notification: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to queue notification: {e}")
+    outbox_worker_pool.notify()
+    return NotificationResponse.model_validate(notification_record)
 
-@router.get("/{id}", response_model=NotificationResponse)
-async def get_notification(id: UUID, current_user: dict = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
-    """Retrieve details of a specific notification by ID."""
-    notification = await get_notification_by_id(db, id)
-    if not notification:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notification not found")
-    return NotificationResponse.model_validate(notification)
+@router.post("/send-batch", response_model=NotificationBatchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def send_notification_batch_endpoint(
+    batch: NotificationBatchCreate,
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_admin_or_internal_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue many notifications with one request and one bulk insert. Returns a result per item, in request order."""
+    await batch_rate_limiter(request, response, cost=len(batch.items))
 
-@router.get("", response_model=List[NotificationResponse])
-async def get_notifications(
+    results = []
+    accepted = []
+    for index, item in enumerate(batch.items):
+        try:
+            validate_notification_request(item.event_type, item.context)
+        except ValueError as e:
+            results.append(NotificationBatchItemResult(index=index, status="REJECTED", error=str(e)))
+            continue
+        accepted.append((index, {"id": uuid4(), "user_id": item.user_id, "event_type": item.event_type, "context": item.context}))
+
+    try:
+        notification_records = await enqueue_notifications_bulk(db, [row for _, row in accepted])
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to queue notifications: {e}")
+    if notification_records:
+        outbox_worker_pool.notify()
+
+    records_by_id = {record.id: record for record in notification_records}
+    for index, row in accepted:
+        results.append(NotificationBatchItemResult(index=index, id=row["id"], status=records_by_id[row["id"]].status))
+    results.sort(key=lambda result: result.index)
+
+    return NotificationBatchResponse(accepted=len(accepted), rejected=len(batch.items) - len(accepted), results=results)
+
+@router.post("/templates/reload", status_code=status.HTTP_200_OK)
+async def reload_templates_endpoint(current_user: dict = Depends(get_admin_user)):
+    """Reload notification templates from disk without a restart. Previous versions stay available for retries."""
+    templates = template_registry.load()
+    return {"version": templates.version, "versions": template_registry.versions}
+
+@router.get("/export")
+async def export_notifications_endpoint(
     current_user: dict = Depends(get_admin_user),
-    db: AsyncSession = Depends(get_db),
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
     user_id: Optional[UUID] = Query(None),
-    event_type: Optional[str] = Query(None)
+    event_type: Optional[str] = Query(None),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None)
 ):
-    """Retrieve a list of notifications, with optional filtering by user_id and event_type."""
-    notifications = await get_notifications_filtered(db, user_id=user_id, event_type=event_type)
-    return [NotificationResponse.model_validate(n) for n in notifications]
+    """Stream every matching notification (oldest first) as NDJSON or CSV, in constant memory."""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_notifications(
+            format,
+            user_id=user_id, event_type=event_type, status=status_filter,
+            created_after=created_after, created_before=created_before
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="notifications.{format}"'}
+    )
 
 @router.get("/stats", response_model=NotificationStatsResponse)
 async def get_notifications_stats(
@@ -61,6 +120,61 @@ async def get_notifications_stats(
     stats = await get_notification_stats(db)
     return NotificationStatsResponse.model_validate(stats)
 
+@router.get("/stats/timeseries", response_model=NotificationTimeseriesResponse)
+async def get_notifications_timeseries(
+    current_user: dict = Depends(get_admin_user),
+    interval: Literal["minute", "hour"] = Query("minute"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    event_type: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Delivery counts, rates and latency percentiles per minute or hour (UTC). Defaults to the last 60 buckets."""
+    step = timedelta(seconds=INTERVAL_SECONDS[interval])
+    end = truncate_to_interval(end or datetime.utcnow(), interval) + step
+    start = truncate_to_interval(start, interval) if start else end - 60 * step
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="start must be before end.")
+    if (end - start) / step > settings.STATS_TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Range covers more than {settings.STATS_TIMESERIES_MAX_BUCKETS} {interval} buckets.")
+    buckets = await get_delivery_timeseries(db, interval, start, end, event_type=event_type)
+    return NotificationTimeseriesResponse(interval=interval, start=start, end=end, buckets=buckets)
+
+@router.get("/{id}", response_model=NotificationResponse)
+async def get_notification(id: UUID, current_user: dict = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
+    """Retrieve details of a specific notification by ID."""
+    notification = await get_notification_by_id(db, id)
+    if not notification:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notification not found")
+    return NotificationResponse.model_validate(notification)
+
+@router.get("", response_model=NotificationPageResponse)
+async def get_notifications(
+    current_user: dict = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+    user_id: Optional[UUID] = Query(None),
+    event_type: Optional[str] = Query(None),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    limit: int = Query(settings.NOTIFICATIONS_PAGE_SIZE, ge=1, le=settings.NOTIFICATIONS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None)
+):
+    """Retrieve a page of notifications (newest first), with optional filtering. Follow `next_cursor` for more."""
+    try:
+        decoded_cursor = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    notifications, last_key = await get_notifications_page(
+        db, limit, decoded_cursor,
+        user_id=user_id, event_type=event_type, status=status_filter,
+        created_after=created_after, created_before=created_before
+    )
+    return NotificationPageResponse(
+        items=[NotificationResponse.model_validate(n) for n in notifications],
+        next_cursor=encode_cursor(*last_key) if last_key else None
+    )
+
 @router.post("/retry", status_code=status.HTTP_200_OK)
 async def retry_notifications_endpoint(
     current_user: dict = Depends(get_admin_or_internal_user), # Can be called by internal services or admin
@@ -0,0 +1,4 @@
+from pydantic import BaseModel
+
+class TokenRevokeRequest(BaseModel):
+    token: str
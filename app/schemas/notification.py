@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
 from typing import Dict, Any, Optional, List
@@ -8,6 +8,22 @@ class NotificationCreate(BaseModel):
     event_type: str
     context: Dict[str, Any]
 
+MAX_BATCH_SIZE = 1000
+
+class NotificationBatchCreate(BaseModel):
+    items: List[NotificationCreate] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class NotificationBatchItemResult(BaseModel):
+    index: int # Position of the item in the request
+    id: Optional[UUID] = None
+    status: str # PENDING if queued, REJECTED otherwise
+    error: Optional[str] = None
+
+class NotificationBatchResponse(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[NotificationBatchItemResult]
+
 class NotificationResponse(BaseModel):
     id: UUID
     user_id: UUID
@@ -21,6 +37,10 @@ class NotificationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class NotificationPageResponse(BaseModel):
+    items: List[NotificationResponse]
+    next_cursor: Optional[str] = None # Pass as `cursor` to fetch the next page; null on the last page
+
 class NotificationStatsResponse(BaseModel):
     total_notifications: int
     total_sent: int
@@ -28,3 +48,18 @@ class NotificationStatsResponse(BaseModel):
     total_pending: int
     by_event_type: Dict[str, Dict[str, int]] # {event_type: {status: count}}
     by_status: Dict[str, int]
+    by_channel: Dict[str, Dict[str, int]] = {} # {channel: {status: count}} of the per-channel deliveries
+
+class NotificationTimeseriesBucket(BaseModel):
+    bucket_start: datetime
+    total: int
+    by_status: Dict[str, int]
+    by_event_type: Dict[str, Dict[str, int]] # {event_type: {status: count}}
+    rate_per_second: Dict[str, float] # {status: outcomes per second over the bucket}
+    latency_ms: Dict[str, Optional[float]] # {"p50"|"p95"|"p99": sent_at - created_at}, None when nothing was sent
+
+class NotificationTimeseriesResponse(BaseModel):
+    interval: str
+    start: datetime
+    end: datetime
+    buckets: List[NotificationTimeseriesBucket]
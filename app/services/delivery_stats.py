@@ -0,0 +1,155 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.core.logging import logger
+from app.database import AsyncSessionLocal
+from app.models.notification import Notification, NotificationDeliveryRollup
+
+# Upper bounds (ms) of the latency histogram kept per rollup row. Rows store the bound itself,
+# so the list can be refined later without invalidating existing data.
+LATENCY_BUCKETS_MS = (
+    100, 250, 500, 1_000, 2_500, 5_000, 10_000, 30_000, 60_000,
+    120_000, 300_000, 600_000, 1_800_000, 3_600_000, 21_600_000, 86_400_000,
+)
+LATENCY_OVERFLOW_MS = 2**31 - 1 # Anything slower than the last bound
+LATENCY_PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+
+INTERVAL_SECONDS = {"minute": 60, "hour": 3600}
+
+
+def latency_bucket(latency_ms: float) -> int:
+    index = bisect_left(LATENCY_BUCKETS_MS, latency_ms)
+    return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else LATENCY_OVERFLOW_MS
+
+
+def histogram_quantile(q: float, histogram: Dict[int, int]) -> Optional[float]:
+    """
+    Estimates the q-quantile from {upper_bound_ms: count}, interpolating linearly inside the bucket.
+    Observations in the overflow bucket are reported as the largest finite bound.
+    """
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    rank = q * total
+    seen = 0
+    for upper in sorted(histogram):
+        count = histogram[upper]
+        if count and seen + count >= rank:
+            if upper == LATENCY_OVERFLOW_MS:
+                return float(LATENCY_BUCKETS_MS[-1])
+            # The bucket spans (previous bound, upper], whether or not the previous bucket has observations
+            index = bisect_left(LATENCY_BUCKETS_MS, upper)
+            lower = LATENCY_BUCKETS_MS[index - 1] if index > 0 else 0
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+def truncate_to_interval(value: datetime, interval: str) -> datetime:
+    """Start of the minute/hour containing `value`, as a naive UTC datetime like the rollup table."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    value = value.replace(second=0, microsecond=0)
+    return value.replace(minute=0) if interval == "hour" else value
+
+
+async def record_delivery_outcome(db: AsyncSession, notification: Notification):
+    """
+    Adds the notification's delivery outcome to its per-minute rollup row.
+    Runs on the caller's session so it commits (or rolls back) together with the status change.
+    """
+    await record_delivery_outcomes(db, [notification])
+
+
+async def record_delivery_outcomes(db: AsyncSession, notifications: Iterable[Any]):
+    """
+    Batch form of `record_delivery_outcome`: outcomes sharing a rollup row are summed first, then written
+    with one multi-row upsert. Accepts anything with event_type, status, created_at and sent_at attributes.
+    """
+    counts: Dict[Tuple[datetime, str, str, int], int] = {}
+    now = datetime.utcnow()
+    for notification in notifications:
+        finished_at = notification.sent_at or now
+        created_at = notification.created_at or finished_at
+        latency_ms = max((finished_at - created_at).total_seconds() * 1000, 0)
+        key = (truncate_to_interval(finished_at, "minute"), notification.event_type, notification.status, latency_bucket(latency_ms))
+        counts[key] = counts.get(key, 0) + 1
+    if not counts:
+        return
+
+    stmt = insert(NotificationDeliveryRollup).values([
+        {"bucket_start": bucket_start, "event_type": event_type, "status": status, "latency_le_ms": latency_le_ms, "count": count}
+        for (bucket_start, event_type, status, latency_le_ms), count in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["bucket_start", "event_type", "status", "latency_le_ms"],
+        set_={"count": NotificationDeliveryRollup.count + stmt.excluded.count},
+    )
+    await db.execute(stmt)
+
+
+async def get_delivery_timeseries(
+    db: AsyncSession,
+    interval: str,
+    start: datetime,
+    end: datetime,
+    event_type: Optional[str] = None,
+) -> List[dict]:
+    """
+    Delivery outcomes between `start` and `end`, one entry per `interval` bucket (empty buckets included),
+    with counts per status and event type, per-second rates and p50/p95/p99 of sent_at - created_at.
+    Reads only the rollup table; minute rows are merged into hours in the query.
+    """
+    query = text(f"""
+        SELECT date_trunc(:interval, bucket_start) AS bucket, event_type, status, latency_le_ms, SUM(count) AS count
+        FROM notification_delivery_rollups
+        WHERE bucket_start >= :start AND bucket_start < :end
+        {"AND event_type = :event_type" if event_type else ""}
+        GROUP BY 1, 2, 3, 4
+    """)
+    params = {"interval": interval, "start": start, "end": end}
+    if event_type:
+        params["event_type"] = event_type
+    result = await db.execute(query, params)
+
+    step = timedelta(seconds=INTERVAL_SECONDS[interval])
+    buckets: Dict[datetime, dict] = {}
+    histograms: Dict[datetime, Dict[int, int]] = {}
+    cursor = start
+    while cursor < end:
+        buckets[cursor] = {"bucket_start": cursor, "total": 0, "by_status": {}, "by_event_type": {}}
+        histograms[cursor] = {}
+        cursor += step
+
+    for row in result:
+        bucket = buckets.get(row.bucket)
+        if bucket is None:
+            continue
+        count = int(row.count)
+        bucket["total"] += count
+        bucket["by_status"][row.status] = bucket["by_status"].get(row.status, 0) + count
+        event_counts = bucket["by_event_type"].setdefault(row.event_type, {})
+        event_counts[row.status] = event_counts.get(row.status, 0) + count
+        if row.status == "SENT":
+            histogram = histograms[row.bucket]
+            histogram[row.latency_le_ms] = histogram.get(row.latency_le_ms, 0) + count
+
+    for bucket_start, bucket in buckets.items():
+        bucket["rate_per_second"] = {status: count / step.total_seconds() for status, count in bucket["by_status"].items()}
+        bucket["latency_ms"] = {name: histogram_quantile(q, histograms[bucket_start]) for name, q in LATENCY_PERCENTILES.items()}
+
+    logger.info("Notification timeseries retrieved", interval=interval, start=start, end=end, buckets=len(buckets))
+    return list(buckets.values())
+
+
+async def prune_delivery_rollups():
+    """Drops rollup rows older than STATS_ROLLUP_RETENTION_DAYS."""
+    cutoff = datetime.utcnow() - timedelta(days=settings.STATS_ROLLUP_RETENTION_DAYS)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(delete(NotificationDeliveryRollup).where(NotificationDeliveryRollup.bucket_start < cutoff))
+        await db.commit()
+    logger.info("Pruned notification delivery rollups", cutoff=cutoff, rows=result.rowcount)
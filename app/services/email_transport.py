@@ -0,0 +1,52 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Optional
+import boto3
+from botocore.config import Config
+from app.config import settings
+from app.core.logging import logger
+
+
+class SESTransport:
+    """
+    Long-lived SES transport shared by the whole process.
+
+    boto3 is synchronous, so calls run on a bounded thread pool around a single reused client
+    instead of on the event loop. The client's HTTP connection pool is sized to the same limit,
+    so every worker thread keeps a warm connection to SES.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._client = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        if self._client is not None:
+            return
+        self._client = boto3.client(
+            "ses",
+            region_name=settings.AWS_REGION_NAME,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            config=Config(max_pool_connections=self.max_concurrency)
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ses")
+        logger.info("SES transport started", max_concurrency=self.max_concurrency)
+
+    async def close(self):
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._client = None
+        self._executor = None
+        logger.info("SES transport closed")
+
+    async def send_email(self, **kwargs) -> Dict[str, Any]:
+        """Runs `SES.Client.send_email(**kwargs)` off the event loop and returns its response."""
+        self.start() # Lazily start for callers outside the app lifespan (scripts, tests)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._client.send_email, **kwargs))
+
+
+ses_transport = SESTransport(max_concurrency=settings.SES_MAX_CONCURRENCY)
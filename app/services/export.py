@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Mapping
+from uuid import UUID
+from app.config import settings
+from app.core.logging import logger
+from app.database import AsyncSessionLocal
+from app.services.notification import stream_notification_rows
+
+EXPORT_COLUMNS = ["id", "user_id", "event_type", "status", "attempts", "template_version", "context", "sent_at", "created_at", "updated_at"]
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def notification_export_record(row: Mapping[str, Any]) -> Dict[str, Any]:
+    return {column: _export_value(row[column]) for column in EXPORT_COLUMNS}
+
+async def export_notifications(fmt: str, **filters) -> AsyncIterator[str]:
+    """
+    Yields the matching notifications as NDJSON lines or CSV, a chunk of EXPORT_CHUNK_ROWS rows at a time.
+    Owns its session, since the response body is produced after the request handler has returned.
+    """
+    exported = 0
+    chunk = io.StringIO()
+    writer = csv.DictWriter(chunk, fieldnames=EXPORT_COLUMNS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+
+    async with AsyncSessionLocal() as db:
+        async for row in stream_notification_rows(db, batch_size=settings.EXPORT_BATCH_SIZE, **filters):
+            record = notification_export_record(row)
+            if writer:
+                writer.writerow({**record, "context": json.dumps(record["context"], ensure_ascii=False)})
+            else:
+                chunk.write(json.dumps(record, ensure_ascii=False))
+                chunk.write("\n")
+            exported += 1
+            if exported % settings.EXPORT_CHUNK_ROWS == 0:
+                yield chunk.getvalue()
+                chunk.seek(0)
+                chunk.truncate()
+
+    if chunk.tell():
+        yield chunk.getvalue()
+    logger.info("Notifications exported", format=fmt, rows=exported)
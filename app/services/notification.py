@@ -1,349 +1,749 @@
 from uuid import UUID, uuid4
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models.notification import Notification
-from sqlalchemy import text, func
+from app.models.notification import Notification, NotificationDelivery
+from app.database import AsyncSessionLocal
+from sqlalchemy import text, func, or_, update, insert, tuple_, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
 from app.core.logging import logger
 from datetime import datetime, timedelta
-import boto3
-from botocore.exceptions import ClientError
 from app.config import settings
-from app.utils.retry import async_retry, CircuitBreaker, CircuitBreakerOpenException
+from app.utils.retry import async_retry, classify_error, record_retry_decision, BackoffPolicy, CircuitBreaker, CircuitBreakerOpenException, PERMANENT
+from app.providers import get_provider
+from app.services.templates import TemplateRegistry
+from app.services.delivery_stats import record_delivery_outcome, record_delivery_outcomes
 import asyncio
 import json
+from types import SimpleNamespace
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Tuple, AsyncIterator, Set
 import httpx
+from app.core.http_client import get_http_client
+from app.core.metrics import register_collector
+from app.utils.cache import TTLCache, SingleFlight
 import redis.asyncio as redis
 
-# Initialize Circuit Breaker for SES calls
-ses_circuit_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+# Initialize Circuit Breaker for email provider calls
+email_circuit_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
 
 # Initialize Redis client for caching
 redis_client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0)
 
-# Load notification templates from JSON file
-def load_notification_templates():
-    template_path = Path(__file__).parent.parent / "templates" / "notifications.json"
-    try:
-        with open(template_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.error("Failed to load notification templates", error=str(e))
-        return {}
-
-NOTIFICATION_TEMPLATES = load_notification_templates()
-
-
-# Mock SMS sending function
-async def send_sms_mock(phone_number: str, message: str):
-    logger.info("Mock SMS sent", event="mock_sms_sent", phone_number=phone_number, message=message)
-    await asyncio.sleep(0.1) # Simulate network delay
-    return {"status": "success", "message_id": str(uuid4())}
+# Hot user details are kept in-process in front of the Redis `user_details:{user_id}` keys
+user_details_cache = TTLCache(maxsize=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_LOCAL_TTL_SECONDS)
+user_details_flight = SingleFlight()
+_CACHE_MISS = object()
+register_collector("user_details_cache", lambda: {**user_details_cache.stats(), "inflight_fetches": len(user_details_flight)})
+
+# Backoff between scheduled retries, per event type (RETRY_POLICIES) on top of the RETRY_* defaults
+_default_retry_settings = {
+    "base_delay": settings.RETRY_BASE_DELAY_SECONDS,
+    "max_delay": settings.RETRY_MAX_DELAY_SECONDS,
+    "multiplier": settings.RETRY_BACKOFF_MULTIPLIER,
+    "max_attempts": settings.RETRY_MAX_ATTEMPTS,
+}
+default_retry_policy = BackoffPolicy(**_default_retry_settings)
+retry_policies = {event_type: BackoffPolicy(**{**_default_retry_settings, **overrides}) for event_type, overrides in settings.RETRY_POLICIES.items()}
+
+def retry_policy_for(event_type: str) -> BackoffPolicy:
+    return retry_policies.get(event_type, default_retry_policy)
+
+# Compiled, hot-reloadable notification templates (see POST /api/v1/notifications/templates/reload)
+template_registry = TemplateRegistry(
+    Path(__file__).parent.parent / "templates" / "notifications.json",
+    max_versions=settings.TEMPLATE_VERSIONS_RETAINED,
+    archive_dir=Path(settings.TEMPLATE_ARCHIVE_DIR) if settings.TEMPLATE_ARCHIVE_DIR else None,
+)
+template_registry.load()
+register_collector("templates", template_registry.stats)
+
+
+async def send_sms(phone_number: str, message: str) -> str:
+    return await get_provider("sms").send(phone_number, "", message)
 
 async def send_admin_alert_email(subject: str, body: str):
-    ses_client = boto3.client(
-        "ses",
-        region_name=settings.AWS_REGION_NAME,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-    )
     try:
-        response = ses_client.send_email(
-            Source="no-reply@rental-system.com",
-            Destination={'ToAddresses': [settings.ADMIN_EMAIL]},
-            Message={
-                'Subject': {'Data': subject},
-                'Body': {'Text': {'Data': body}}
-            }
-        )
-        message_id = response['MessageId']
-        logger.info("Admin alert email sent via SES", message_id=message_id, recipient=settings.ADMIN_EMAIL)
+        message_id = await get_provider("email").send(settings.ADMIN_EMAIL, subject, body)
+        logger.info("Admin alert email sent", message_id=message_id, recipient=settings.ADMIN_EMAIL)
         return message_id
-    except ClientError as e:
+    except Exception as e:
         logger.error("Admin alert email send failed", error=str(e), recipient=settings.ADMIN_EMAIL)
         # Do not re-raise, as this is an alert for another failure, we don't want to block the retry process
         return None
 
-@async_retry(tries=3, delay=2, backoff=2, circuit_breaker=ses_circuit_breaker)
-async def send_email_ses(recipient_email: str, subject: str, body: str) -> str:
-    ses_client = boto3.client(
-        "ses",
-        region_name=settings.AWS_REGION_NAME,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-    )
+@async_retry(tries=3, delay=2, backoff=2, circuit_breaker=email_circuit_breaker)
+async def send_email(recipient_email: str, subject: str, body: str) -> str:
+    provider = get_provider("email")
     try:
-        response = ses_client.send_email(
-            Source="no-reply@rental-system.com", # Replace with your verified SES email
-            Destination={'ToAddresses': [recipient_email]},
-            Message={
-                'Subject': {'Data': subject},
-                'Body': {'Text': {'Data': body}}
-            }
-        )
-        message_id = response['MessageId']
-        logger.info("Email sent via SES", message_id=message_id, recipient=recipient_email)
+        message_id = await provider.send(recipient_email, subject, body)
+        logger.info("Email sent", provider=provider.name, message_id=message_id, recipient=recipient_email)
         return message_id
-    except ClientError as e:
-        logger.error("SES Email send failed", error=str(e), recipient=recipient_email)
+    except Exception as e:
+        logger.error("Email send failed", provider=provider.name, error=str(e), recipient=recipient_email)
         raise # Re-raise to trigger retry
 
+async def _deliver_channels(user: Dict[str, Any], template: dict, skip: Set[str] = frozenset()) -> Dict[str, Dict[str, Any]]:
+    """
+    Sends over each of the user's channels concurrently, so a slow or retrying channel does not hold up the other,
+    and one failing does not hide the other's success. Channels in `skip` were already delivered and are not resent.
+    Returns each attempted channel's result: {"status": "SENT", "message_id": ...}, or {"status": "FAILED", "error": ...,
+    "retry_after": ...} for errors a retry may fix and {"status": "REJECTED", "error": ...} for permanent ones.
+    """
+    sends = {}
+    if user.get("email") and "email" not in skip:
+        sends["email"] = send_email(user["email"], template["subject"], template["body"])
+    if user.get("phone_number") and "sms" not in skip:
+        sends["sms"] = send_sms(user["phone_number"], template["body"])
+
+    channels = {}
+    for channel, result in zip(sends, await asyncio.gather(*sends.values(), return_exceptions=True)):
+        if isinstance(result, BaseException) or not result:
+            error = str(result) if result else "Provider did not accept the message"
+            classification = classify_error(result) if result else None
+            status = "REJECTED" if classification and classification.kind == PERMANENT else "FAILED"
+            logger.error("Channel delivery failed", channel=channel, error=error, status=status)
+            channels[channel] = {"status": status, "error": error, "retry_after": classification.retry_after if classification else None}
+        else:
+            channels[channel] = {"status": "SENT", "message_id": result}
+    return channels
+
+def _delivery_rows(notification: Any, channels: Dict[str, Dict[str, Any]], now: datetime) -> List[Dict[str, Any]]:
+    """notification_deliveries values for the channels attempted on a notification."""
+    return [{
+        "notification_id": notification.id, "notification_created_at": notification.created_at, "channel": channel,
+        "status": result["status"], "provider_message_id": result.get("message_id"), "last_error": result.get("error"),
+        "sent_at": now if result["status"] == "SENT" else None, "updated_at": now,
+    } for channel, result in channels.items()]
+
+def _channel_errors(channels: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    errors = [f"{channel}: {result['error']}" for channel, result in channels.items() if result["status"] != "SENT"]
+    return "; ".join(errors) or None
+
+def _rejected_only(channels: Dict[str, Dict[str, Any]]) -> bool:
+    """True when no failed channel can succeed on a retry: every failure was a permanent rejection."""
+    statuses = {result["status"] for result in channels.values()}
+    return "REJECTED" in statuses and "FAILED" not in statuses
+
+def _schedule_retry(event_type: str, attempts: int, channels: Dict[str, Dict[str, Any]], permanent: bool = False) -> Optional[datetime]:
+    """
+    next_attempt_at for a FAILED notification: None if it failed permanently or used up its attempts, otherwise the
+    event type's backoff, pushed back to any retry-after a throttling provider asked for. Counted in retry_decisions.
+    """
+    if permanent:
+        record_retry_decision("notifications", "permanent_not_rescheduled")
+        return None
+    next_attempt_at = retry_policy_for(event_type).next_attempt_at(attempts)
+    if next_attempt_at is None:
+        record_retry_decision("notifications", "attempts_exhausted")
+        return None
+    retry_after = max((result.get("retry_after") or 0 for result in channels.values() if result["status"] == "FAILED"), default=0)
+    if retry_after:
+        record_retry_decision("notifications", "throttled_rescheduled")
+        return max(next_attempt_at, datetime.utcnow() + timedelta(seconds=retry_after))
+    record_retry_decision("notifications", "rescheduled")
+    return next_attempt_at
+
 async def get_user_details_from_user_management(user_id: UUID) -> Optional[Dict[str, Any]]:
+    # In-process tier first; a cached None means User Management answered 404 recently
+    cached_user = user_details_cache.get(user_id, _CACHE_MISS)
+    if cached_user is not _CACHE_MISS:
+        return cached_user
+    # Concurrent misses for the same user share one Redis/User Management round trip
+    return await user_details_flight.do(user_id, lambda: _load_user_details(user_id))
+
+async def _load_user_details(user_id: UUID) -> Optional[Dict[str, Any]]:
     cache_key = f"user_details:{user_id}"
     cached_data = await redis_client.get(cache_key)
 
     if cached_data:
         logger.info("User details retrieved from cache", user_id=user_id)
-        return json.loads(cached_data)
+        user_data = json.loads(cached_data) # "null" marks a user that does not exist
+        _cache_user_details_locally(user_id, user_data)
+        return user_data
+
+    user_data, cacheable = await _fetch_user_details(user_id)
+    if cacheable:
+        await redis_client.setex(cache_key, _user_details_redis_ttl(user_data), json.dumps(user_data))
+        _cache_user_details_locally(user_id, user_data)
+        if user_data is not None:
+            logger.info("User details fetched from User Management service and cached", user_id=user_id)
+    return user_data
 
-    async with httpx.AsyncClient() as client:
+async def _fetch_user_details(user_id: UUID) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Fetches one user from User Management. Returns (user_data, cacheable): a 404 is a cacheable None,
+    any other failure is a non-cacheable None.
+    """
+    client = get_http_client()
+    try:
+        response = await client.get(f"{settings.USER_MANAGEMENT_URL}/api/v1/users/{user_id}")
+        response.raise_for_status()
+        return response.json(), True
+    except httpx.HTTPStatusError as e:
+        logger.warning("User not found in User Management service", user_id=user_id, status_code=e.response.status_code)
+        return None, e.response.status_code == 404
+    except httpx.RequestError as e:
+        logger.error("User Management service unavailable", user_id=user_id, error=str(e))
+        return None, False
+
+async def _fetch_users_details(user_ids: List[UUID]) -> Dict[UUID, Tuple[Optional[Dict[str, Any]], bool]]:
+    """
+    Fetches many users, with one call per chunk when User Management exposes a batch endpoint
+    (USER_MANAGEMENT_BATCH_PATH) and with bounded per-user concurrency otherwise.
+    """
+    results: Dict[UUID, Tuple[Optional[Dict[str, Any]], bool]] = {}
+    if not settings.USER_MANAGEMENT_BATCH_PATH:
+        semaphore = asyncio.Semaphore(settings.USER_FETCH_CONCURRENCY)
+        async def fetch(user_id: UUID):
+            async with semaphore:
+                results[user_id] = await _fetch_user_details(user_id)
+        await asyncio.gather(*[fetch(user_id) for user_id in user_ids])
+        return results
+
+    client = get_http_client()
+    for i in range(0, len(user_ids), settings.USER_MANAGEMENT_BATCH_SIZE):
+        chunk = user_ids[i:i + settings.USER_MANAGEMENT_BATCH_SIZE]
         try:
-            response = await client.get(f"{settings.USER_MANAGEMENT_URL}/api/v1/users/{user_id}")
+            # Expected response: {"<user_id>": {...user details...}}; ids missing from it do not exist
+            response = await client.post(
+                f"{settings.USER_MANAGEMENT_URL}{settings.USER_MANAGEMENT_BATCH_PATH}",
+                json={"user_ids": [str(user_id) for user_id in chunk]}
+            )
             response.raise_for_status()
-            user_data = response.json()
-            await redis_client.setex(cache_key, timedelta(hours=1), json.dumps(user_data))
-            logger.info("User details fetched from User Management service and cached", user_id=user_id)
-            return user_data
-        except httpx.HTTPStatusError as e:
-            logger.warning("User not found in User Management service", user_id=user_id, status_code=e.response.status_code)
-            return None
-        except httpx.RequestError as e:
-            logger.error("User Management service unavailable", user_id=user_id, error=str(e))
-            return None
-
-def get_notification_template(event_type: str, preferred_language: str, context: dict) -> dict:
-    template_data = NOTIFICATION_TEMPLATES.get(event_type)
-    if not template_data:
-        logger.warning("No template found for event_type, falling back to default", event_type=event_type)
-        template_data = NOTIFICATION_TEMPLATES.get("payment_success", {}) # Fallback to a default
+            users = response.json()
+            for user_id in chunk:
+                results[user_id] = (users.get(str(user_id)), True)
+        except (httpx.HTTPStatusError, httpx.RequestError) as e:
+            logger.error("User Management batch lookup failed", count=len(chunk), error=str(e))
+            for user_id in chunk:
+                results[user_id] = (None, False)
+    return results
+
+async def get_users_details_bulk(user_ids: Iterable[UUID]) -> Dict[UUID, Optional[Dict[str, Any]]]:
+    """
+    Resolves many users at once: in-process tier, then one Redis MGET, then a batched User Management
+    fetch for the rest, written back with one pipelined SETEX round trip. Unresolvable users map to None.
+    """
+    users: Dict[UUID, Optional[Dict[str, Any]]] = {}
+    missing = []
+    for user_id in set(user_ids):
+        cached_user = user_details_cache.get(user_id, _CACHE_MISS)
+        if cached_user is _CACHE_MISS:
+            missing.append(user_id)
+        else:
+            users[user_id] = cached_user
+    if not missing:
+        return users
+
+    to_fetch = []
+    cached_values = await redis_client.mget([f"user_details:{user_id}" for user_id in missing])
+    for user_id, cached_data in zip(missing, cached_values):
+        if cached_data:
+            users[user_id] = json.loads(cached_data)
+            _cache_user_details_locally(user_id, users[user_id])
+        else:
+            to_fetch.append(user_id)
+    if not to_fetch:
+        return users
+
+    fetched = await _fetch_users_details(to_fetch)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user_id, (user_data, cacheable) in fetched.items():
+            users[user_id] = user_data
+            if cacheable:
+                pipe.setex(f"user_details:{user_id}", _user_details_redis_ttl(user_data), json.dumps(user_data))
+                _cache_user_details_locally(user_id, user_data)
+        await pipe.execute()
+    logger.info("User details resolved in bulk", requested=len(users), redis_misses=len(to_fetch))
+    return users
+
+def _user_details_redis_ttl(user_data: Optional[Dict[str, Any]]) -> timedelta:
+    if user_data is None:
+        return timedelta(seconds=settings.USER_NEGATIVE_CACHE_TTL_SECONDS)
+    return timedelta(seconds=settings.USER_CACHE_TTL_SECONDS)
+
+def _cache_user_details_locally(user_id: UUID, user_data: Optional[Dict[str, Any]]):
+    ttl = settings.USER_NEGATIVE_CACHE_TTL_SECONDS if user_data is None else None
+    user_details_cache.set(user_id, user_data, ttl=ttl)
+
+def get_notification_template(event_type: str, preferred_language: str, context: dict, version: Optional[str] = None) -> dict:
+    # Raises TemplateNotFoundError / MissingTemplateContextError instead of rendering a wrong template
+    templates = template_registry.get(version)
+    return {**templates.render(event_type, preferred_language, context), "version": templates.version}
+
+# Hot statements, built once. Reusing the same statement objects skips per-call construction and hits
+# SQLAlchemy's compiled cache; the identical SQL then reuses asyncpg's per-connection prepared statement
+# (DB_STATEMENT_CACHE_SIZE) instead of being parsed and planned again. Per-call values are bind parameters.
+_notifications = Notification.__table__
+
+_INSERT_NOTIFICATION = insert(Notification).returning(Notification)
+
+_SELECT_NOTIFICATION_BY_ID = select(Notification).where(Notification.id == bindparam("notification_id"))
+
+_CLAIM_PENDING = (
+    update(_notifications)
+    .where(tuple_(_notifications.c.id, _notifications.c.created_at).in_(
+        select(_notifications.c.id, _notifications.c.created_at).where(
+            _notifications.c.status == "PENDING",
+            or_(_notifications.c.locked_until.is_(None), _notifications.c.locked_until < bindparam("now"))
+        ).order_by(_notifications.c.created_at).limit(bindparam("limit")).with_for_update(skip_locked=True)
+    ))
+    .values(locked_until=bindparam("lease_until"))
+    .returning(_notifications.c.id, _notifications.c.user_id, _notifications.c.locked_until)
+)
+
+# Writes a delivery outcome only while the caller still holds the lease it claimed (NULL for inline delivery);
+# if the lease expired and another worker re-claimed the row, that worker's outcome is the one that counts
+_SETTLE_NOTIFICATION = update(_notifications).where(
+    _notifications.c.id == bindparam("b_id"),
+    _notifications.c.created_at == bindparam("b_created_at"),
+    _notifications.c.locked_until.is_not_distinct_from(bindparam("b_claimed_lease")),
+)
+
+_CLAIM_RETRYABLE = (
+    update(_notifications)
+    .where(tuple_(_notifications.c.id, _notifications.c.created_at).in_(
+        select(_notifications.c.id, _notifications.c.created_at).where(
+            _notifications.c.status == "FAILED",
+            _notifications.c.next_attempt_at <= bindparam("now"),
+            or_(_notifications.c.locked_until.is_(None), _notifications.c.locked_until < bindparam("now"))
+        ).order_by(_notifications.c.next_attempt_at).limit(bindparam("limit")).with_for_update(skip_locked=True)
+    ))
+    .values(locked_until=bindparam("lease_until"), attempts=_notifications.c.attempts + 1, updated_at=bindparam("now"))
+    .returning(*_notifications.c)
+)
+
+_deliveries = NotificationDelivery.__table__
+
+# A channel attempted again counts one more attempt; its message id survives a later failure
+_upsert_deliveries = pg_insert(_deliveries)
+_UPSERT_DELIVERIES = _upsert_deliveries.on_conflict_do_update(
+    index_elements=[_deliveries.c.notification_id, _deliveries.c.channel],
+    set_={
+        "status": _upsert_deliveries.excluded.status,
+        "attempts": _deliveries.c.attempts + 1,
+        "provider_message_id": func.coalesce(_upsert_deliveries.excluded.provider_message_id, _deliveries.c.provider_message_id),
+        "last_error": _upsert_deliveries.excluded.last_error,
+        "sent_at": _upsert_deliveries.excluded.sent_at,
+        "updated_at": _upsert_deliveries.excluded.updated_at,
+    }
+)
+
+_SELECT_SETTLED_CHANNELS = select(_deliveries.c.notification_id, _deliveries.c.channel, _deliveries.c.status).where(
+    _deliveries.c.notification_id.in_(bindparam("notification_ids", expanding=True)),
+    _deliveries.c.status.in_(["SENT", "REJECTED"])
+)
+
+_NOTIFICATION_STATS = text("""
+    SELECT NULL AS channel, event_type, status, SUM(count) AS count, GROUPING(event_type, status) AS grouping_level
+    FROM notification_status_counters
+    GROUP BY GROUPING SETS ((event_type, status), (status), ())
+    UNION ALL
+    SELECT channel, NULL, status, count, 0 FROM notification_channel_counters
+""")
+
+async def enqueue_notification(db: AsyncSession, user_id: UUID, event_type: str, context: dict) -> Notification:
+    """
+    Durably records a PENDING notification (transactional outbox). Delivery is done by the outbox workers.
+    """
+    now = datetime.utcnow()
+    result = await db.scalars(_INSERT_NOTIFICATION, [{
+        "id": uuid4(),
+        "user_id": user_id,
+        "event_type": event_type,
+        "status": "PENDING",
+        "attempts": 0,
+        "context": context,
+        "template_version": template_registry.current.version,
+        "created_at": now,
+        "updated_at": now,
+    }])
+    # RETURNING loads the row as stored, so no refresh SELECT is needed after the commit
+    notification_record = result.one()
+    await db.commit()
+    logger.info("Notification enqueued", notification_id=notification_record.id, user_id=user_id, event_type=event_type)
+    return notification_record
 
-    lang = preferred_language if preferred_language in ["en", "am", "om"] else "en"
+def validate_notification_request(event_type: str, context: dict) -> None:
+    """
+    Raises ValueError if a notification for this event type cannot be rendered:
+    TemplateNotFoundError for an unknown event type, MissingTemplateContextError for missing placeholders.
+    """
+    template_registry.current.validate_context(event_type, context)
 
-    subject_template = template_data.get("subject", {}).get(lang, template_data.get("subject", {}).get("en", "Notification"))
-    body_template = template_data.get("body", {}).get(lang, template_data.get("body", {}).get("en", "No message provided."))
+async def enqueue_notifications_bulk(db: AsyncSession, notifications: List[Dict[str, Any]]) -> List[Notification]:
+    """
+    Records many PENDING notifications with multi-row INSERT ... RETURNING (batched by SQLAlchemy's insertmanyvalues).
+    Each item needs `user_id`, `event_type` and `context`; an `id` is generated unless provided.
+    """
+    if not notifications:
+        return []
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": item.get("id") or uuid4(),
+            "user_id": item["user_id"],
+            "event_type": item["event_type"],
+            "status": "PENDING",
+            "attempts": 0,
+            "context": item["context"],
+            "template_version": template_registry.current.version,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for item in notifications
+    ]
+    result = await db.scalars(_INSERT_NOTIFICATION, rows)
+    notification_records = list(result.all())
+    await db.commit()
+    logger.info("Notification batch enqueued", count=len(notification_records))
+    return notification_records
 
-    # Format the message with context, handling missing keys gracefully
-    formatted_subject = subject_template.format(**context)
-    formatted_body = body_template.format(**context)
+async def claim_pending_notifications(db: AsyncSession, limit: int, lease_seconds: int) -> List[Tuple[UUID, UUID, datetime]]:
+    """
+    Claims up to `limit` PENDING notifications whose lease is free or expired and leases them to the caller.
+    SKIP LOCKED lets several workers (or replicas) claim concurrently without handing out the same row twice;
+    selecting and leasing is a single statement. Returns (notification_id, user_id, lease_until) triples;
+    pass the lease on to `deliver_notification` so the outcome is only written while it is still held.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(_CLAIM_PENDING, {"now": now, "limit": limit, "lease_until": now + timedelta(seconds=lease_seconds)})
+    claimed = [(row.id, row.user_id, row.locked_until) for row in result]
+    await db.commit()
+    return claimed
 
-    return {"subject": formatted_subject, "body": formatted_body}
+async def deliver_notification(db: AsyncSession, notification: Notification, lease_until: Optional[datetime] = None) -> Optional[Notification]:
+    """
+    Delivers a recorded notification over email/SMS and persists the outcome.
+    `lease_until` is the lease the caller claimed the row with (None for a row that was never leased). The caller
+    must not hold a transaction open: nothing is read or written here until the sends are done, so no pooled
+    connection sits idle in transaction across the provider round trip. Returns None, writing nothing, if the
+    lease was lost meanwhile. Raises ValueError if the recipient no longer exists (the row is marked FAILED first).
+    """
+    if notification in db:
+        # The outcome is written by the lease-checked UPDATE below, never flushed from the ORM object
+        db.expunge(notification)
 
-async def send_notification_service(db: AsyncSession, user_id: UUID, event_type: str, context: dict) -> Notification:
-    notification_id = uuid4()
-    status = "PENDING"
-    attempts = 0
-    sent_at = None
-    
-    user = await get_user_details_from_user_management(user_id)
+    user = await get_user_details_from_user_management(notification.user_id)
     if not user:
-        logger.error("User not found for notification, marking as FAILED", user_id=user_id, event_type=event_type)
-        notification_record = Notification(
-            id=notification_id,
-            user_id=user_id,
-            event_type=event_type,
-            status="FAILED",
-            attempts=attempts,
-            context=context,
-            sent_at=None,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
-        )
-        db.add(notification_record)
-        await db.commit()
-        await db.refresh(notification_record)
-        raise ValueError(f"User with ID {user_id} not found.")
+        logger.error("User not found for notification, marking as FAILED", notification_id=notification.id, user_id=notification.user_id, event_type=notification.event_type)
+        notification.status = "FAILED"
+        notification.next_attempt_at = _schedule_retry(notification.event_type, notification.attempts or 0, {})
+        if await _settle_notification(db, notification, lease_until, {}):
+            raise ValueError(f"User with ID {notification.user_id} not found.")
+        return None
 
+    channels = {}
     try:
-        template = get_notification_template(event_type, user.get("preferred_language", "en"), context)
-        subject = template["subject"]
-        body = template["body"]
-        
-        ses_message_id = None
-        # Send email
-        if user.get("email"):
-            ses_message_id = await send_email_ses(user["email"], subject, body)
-
-        # Send SMS (mocked)
-        if user.get("phone_number"):
-            await send_sms_mock(user["phone_number"], body)
-
-        status = "SENT"
-        sent_at = datetime.utcnow()
-        if ses_message_id:
-            context["ses_message_id"] = ses_message_id
-        template_version = NOTIFICATION_TEMPLATES.get("version", "unknown")
-        logger.info("Notification successfully sent", notification_id=notification_id, user_id=user_id, event_type=event_type, template_version=template_version)
-
+        template = get_notification_template(notification.event_type, user.get("preferred_language", "en"), notification.context, version=notification.template_version)
+        notification.template_version = template["version"]
+        channels = await _deliver_channels(user, template)
+        error = _channel_errors(channels)
     except Exception as e:
-        status = "FAILED"
-        logger.error("Failed to send notification after retries", notification_id=notification_id, user_id=user_id, event_type=event_type, error=str(e))
-
-    notification_record = Notification(
-        id=notification_id,
-        user_id=user_id,
-        event_type=event_type,
-        status=status,
-        attempts=attempts,
-        context=context,
-        sent_at=sent_at,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow()
-    )
-    db.add(notification_record)
+        error = str(e)
+
+    if error is None:
+        notification.status = "SENT"
+        notification.sent_at = datetime.utcnow()
+        notification.next_attempt_at = None
+    else:
+        # Channels that went out (SENT) or were rejected for good (REJECTED) are skipped when the notification is retried;
+        # if rejections were the only failures there is nothing left to retry
+        notification.status = "FAILED"
+        notification.next_attempt_at = _schedule_retry(notification.event_type, notification.attempts or 0, channels, permanent=_rejected_only(channels))
+
+    if not await _settle_notification(db, notification, lease_until, channels):
+        return None
+    if error is None:
+        logger.info("Notification successfully sent", notification_id=notification.id, user_id=notification.user_id, event_type=notification.event_type, template_version=notification.template_version)
+    else:
+        logger.error("Failed to send notification after retries", notification_id=notification.id, user_id=notification.user_id, event_type=notification.event_type, error=error, next_attempt_at=notification.next_attempt_at)
+        if notification.next_attempt_at is None:
+            # The retry sweep only claims rows with a next attempt, so nothing else would report this one
+            await _alert_permanent_failure(notification, error)
+    return notification
+
+async def _settle_notification(db: AsyncSession, notification: Notification, lease_until: Optional[datetime], channels: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    Writes the notification's outcome, its channel deliveries and its rollup in one transaction, provided the row
+    is still leased with `lease_until`. Returns False (and writes nothing) if another worker has re-claimed it.
+    """
+    notification.locked_until = None
+    notification.updated_at = datetime.utcnow()
+    result = await db.execute(_SETTLE_NOTIFICATION, {
+        "b_id": notification.id, "b_created_at": notification.created_at, "b_claimed_lease": lease_until,
+        "status": notification.status, "sent_at": notification.sent_at, "next_attempt_at": notification.next_attempt_at,
+        "template_version": notification.template_version, "locked_until": None, "updated_at": notification.updated_at,
+    })
+    if result.rowcount == 0:
+        await db.rollback()
+        logger.warning("Notification lease lost during delivery, dropping outcome", notification_id=notification.id, status=notification.status, lease_until=lease_until)
+        return False
+    if channels:
+        await db.execute(_UPSERT_DELIVERIES, _delivery_rows(notification, channels, notification.updated_at))
+    await record_delivery_outcome(db, notification)
     await db.commit()
-    await db.refresh(notification_record)
-    return notification_record
+    return True
+
+async def send_notification_service(db: AsyncSession, user_id: UUID, event_type: str, context: dict) -> Notification:
+    """
+    Records and delivers a notification inline. The API goes through the outbox instead (see app.services.outbox).
+    """
+    notification_record = await enqueue_notification(db, user_id, event_type, context)
+    return await deliver_notification(db, notification_record)
 
 async def get_notification_by_id(db: AsyncSession, notification_id: UUID) -> Optional[Notification]:
-    result = await db.execute(select(Notification).filter(Notification.id == notification_id))
+    result = await db.execute(_SELECT_NOTIFICATION_BY_ID, {"notification_id": notification_id})
     return result.scalar_one_or_none()
 
-async def get_notifications_filtered(db: AsyncSession, user_id: Optional[UUID] = None, event_type: Optional[str] = None) -> List[Notification]:
-    query = select(Notification)
+def _apply_notification_filters(
+    query,
+    user_id: Optional[UUID] = None,
+    event_type: Optional[str] = None,
+    status: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
     if user_id:
         query = query.filter(Notification.user_id == user_id)
     if event_type:
         query = query.filter(Notification.event_type == event_type)
+    if status:
+        query = query.filter(Notification.status == status)
+    if created_after:
+        query = query.filter(Notification.created_at >= created_after)
+    if created_before:
+        query = query.filter(Notification.created_at < created_before)
+    return query
+
+async def get_notifications_page(
+    db: AsyncSession,
+    limit: int,
+    cursor: Optional[Tuple[datetime, UUID]] = None,
+    **filters,
+) -> Tuple[List[Notification], Optional[Tuple[datetime, UUID]]]:
+    """
+    Returns one page of notifications, newest first, using keyset pagination on (created_at, id),
+    and the (created_at, id) of the last row if there are more pages.
+    """
+    query = _apply_notification_filters(select(Notification), **filters)
+    if cursor:
+        query = query.filter(tuple_(Notification.created_at, Notification.id) < tuple_(*cursor))
+    query = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1)
     result = await db.execute(query)
-    return result.scalars().all()
+    notifications = list(result.scalars().all())
+    if len(notifications) <= limit:
+        return notifications, None
+    notifications = notifications[:limit]
+    return notifications, (notifications[-1].created_at, notifications[-1].id)
 
-async def retry_failed_notifications(db: AsyncSession):
-    logger.info("Attempting to retry failed notifications...")
-    stmt = select(Notification).filter(
-        Notification.status == "FAILED",
-        Notification.attempts < 3
-    ).limit(10)
-
-    result = await db.execute(stmt)
-    failed_notifications = result.scalars().all()
-
-    for notification in failed_notifications:
-        # Idempotency check: if already sent and MessageId exists, skip
-        if notification.context.get("ses_message_id"):
-            if notification.status == "SENT":
-                logger.info("Notification already sent and has SES MessageId, skipping retry", notification_id=notification.id)
-                continue
-            elif notification.status == "FAILED":
-                # If SES MessageId exists but status is FAILED, it means the email was sent but DB update failed.
-                # Mark as SENT and skip resending.
-                notification.status = "SENT"
-                notification.sent_at = datetime.utcnow()
-                notification.updated_at = datetime.utcnow()
-                db.add(notification)
-                await db.commit()
-                await db.refresh(notification)
-                logger.info("Notification found with SES MessageId but FAILED status, updated to SENT", notification_id=notification.id)
-                continue
+async def stream_notification_rows(db: AsyncSession, batch_size: int = 1000, **filters) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streams matching notifications as plain row mappings (oldest first) through a server-side cursor.
+    Rows are not loaded as ORM objects, so nothing accumulates in the session's identity map.
+    """
+    query = _apply_notification_filters(select(Notification.__table__), **filters)
+    query = query.order_by(Notification.created_at, Notification.id).execution_options(yield_per=batch_size)
+    result = await db.stream(query)
+    async for row in result:
+        yield row._mapping
+
+async def claim_retryable_notifications(db: AsyncSession, limit: int, lease_seconds: int) -> List[Row]:
+    """
+    Claims up to `limit` FAILED notifications whose next_attempt_at is due and whose lease is free or expired, most overdue first.
+    One statement leases the rows and counts the attempt; SKIP LOCKED keeps concurrent replicas from claiming
+    the same rows. Returns plain rows, which stay readable after the commit.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(_CLAIM_RETRYABLE, {"now": now, "limit": limit, "lease_until": now + timedelta(seconds=lease_seconds)})
+    claimed = result.all()
+    await db.commit()
+    return claimed
 
-        notification.attempts += 1
-        notification.updated_at = datetime.utcnow()
-        db.add(notification)
-        await db.commit()
-        await db.refresh(notification)
+async def _alert_permanent_failure(notification: Row, reason: str):
+    logger.critical("Notification permanently failed after retries", notification_id=notification.id, attempts=notification.attempts, reason=reason)
+    try:
+        await send_admin_alert_email(
+            subject=f"CRITICAL: Notification {notification.id} permanently failed",
+            body=f"Notification {notification.id} for user {notification.user_id} (event: {notification.event_type}) permanently failed after {notification.attempts} retries. Reason: {reason}"
+        )
+    except Exception as e:
+        logger.error("Failed to send permanent failure alert", notification_id=notification.id, error=str(e))
 
+async def _retry_notification(
+    notification: Row, user: Optional[Dict[str, Any]], semaphore: asyncio.Semaphore, settled_channels: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Re-delivers one claimed notification without touching the database, skipping the channels in `settled_channels`
+    (channel -> SENT or REJECTED). Returns the values to persist, with the attempted channels under "deliveries".
+    A FAILED outcome is rescheduled by the event type's backoff policy, or left unscheduled (next_attempt_at NULL)
+    once its attempts are used up or when its only failures are permanent rejections.
+    """
+    settled_channels = settled_channels or {}
+    outcome = {
+        "b_id": notification.id, "b_created_at": notification.created_at, "status": "SENT", "sent_at": datetime.utcnow(),
+        "template_version": notification.template_version, "locked_until": None, "next_attempt_at": None, "deliveries": [],
+    }
+    failed = {**outcome, "status": "FAILED", "sent_at": None}
+
+    if not user:
+        logger.error("User not found during retry, cannot send notification", notification_id=notification.id)
+        next_attempt_at = _schedule_retry(notification.event_type, notification.attempts, {})
+        if next_attempt_at is None:
+            await _alert_permanent_failure(notification, "User not found.")
+        return {**failed, "next_attempt_at": next_attempt_at}
+
+    async with semaphore:
         logger.info("Retrying notification", notification_id=notification.id, attempts=notification.attempts)
         try:
-            user = await get_user_details_from_user_management(notification.user_id)
-            if not user:
-                logger.error("User not found during retry, cannot send notification", notification_id=notification.id)
-                if notification.attempts >= 3:
-                    logger.critical("Notification permanently failed after 3 retries due to user not found", notification_id=notification.id)
-                    await send_admin_alert_email(
-                        subject=f"CRITICAL: Notification {notification.id} permanently failed",
-                        body=f"Notification {notification.id} for user {notification.user_id} (event: {notification.event_type}) permanently failed after 3 retries. Reason: User not found."
-                    )
-                continue
+            # Re-render with the version the notification was originally queued with
+            template = get_notification_template(notification.event_type, user.get("preferred_language", "en"), notification.context, version=notification.template_version)
+            channels = await _deliver_channels(user, template, skip=set(settled_channels))
+            error = _channel_errors(channels)
+        except Exception as e:
+            template, channels, error = None, {}, str(e)
+
+    now = datetime.utcnow()
+    deliveries = _delivery_rows(notification, channels, now)
+    rejected_before = sorted(channel for channel, status in settled_channels.items() if status == "REJECTED")
+    permanent = _rejected_only(channels)
+    if error is None and rejected_before:
+        # Everything left went out, but a channel rejected earlier never will
+        error, permanent = f"Rejected earlier on {', '.join(rejected_before)}", True
+    if error:
+        next_attempt_at = _schedule_retry(notification.event_type, notification.attempts, channels, permanent=permanent)
+        logger.error("Failed to resend notification", notification_id=notification.id, error=error, next_attempt_at=next_attempt_at)
+        if next_attempt_at is None:
+            await _alert_permanent_failure(notification, error)
+        return {**failed, "next_attempt_at": next_attempt_at, "deliveries": deliveries}
+
+    # No channels left to send means they all went out before and only the status update was lost
+    logger.info("Notification successfully resent", notification_id=notification.id, channels=sorted(channels), already_sent=sorted(settled_channels))
+    return {**outcome, "sent_at": now, "template_version": template["version"], "deliveries": deliveries}
+
+async def _persist_retry_outcomes(db: AsyncSession, claimed: List[Row], outcomes: List[Dict[str, Any]]):
+    """Writes a batch of retry outcomes, their channel deliveries and their delivery rollups in one transaction."""
+    now = datetime.utcnow()
+    notifications = Notification.__table__
+    rows = [{**outcome, "updated_at": now} for outcome in outcomes]
+    deliveries = [delivery for row in rows for delivery in row.pop("deliveries")]
+    await db.execute(
+        update(notifications).where(notifications.c.id == bindparam("b_id"), notifications.c.created_at == bindparam("b_created_at")),
+        rows
+    )
+    if deliveries:
+        await db.execute(_UPSERT_DELIVERIES, deliveries)
+    by_id = {notification.id: notification for notification in claimed}
+    await record_delivery_outcomes(db, [
+        SimpleNamespace(event_type=by_id[outcome["b_id"]].event_type, status=outcome["status"], created_at=outcome["b_created_at"], sent_at=outcome["sent_at"])
+        for outcome in outcomes
+    ])
+    await db.commit()
 
-            template = get_notification_template(notification.event_type, user.get("preferred_language", "en"), notification.context)
-            subject = template["subject"]
-            body = template["body"]
-            
-            ses_message_id = None
-            if user.get("email"):
-                ses_message_id = await send_email_ses(user["email"], subject, body)
-            if user.get("phone_number"):
-                await send_sms_mock(user["phone_number"], body)
-
-            notification.status = "SENT"
-            notification.sent_at = datetime.utcnow()
-            notification.updated_at = datetime.utcnow()
-            if ses_message_id:
-                notification.context["ses_message_id"] = ses_message_id
-            db.add(notification)
-            await db.commit()
-            await db.refresh(notification)
-            logger.info("Notification successfully resent", notification_id=notification.id)
+async def _settled_channels_by_notification(db: AsyncSession, notification_ids: List[UUID]) -> Dict[UUID, Dict[str, str]]:
+    """Channels already delivered (SENT) or rejected for good (REJECTED), per notification, so a retry only resends the others."""
+    settled: Dict[UUID, Dict[str, str]] = {}
+    for row in await db.execute(_SELECT_SETTLED_CHANNELS, {"notification_ids": notification_ids}):
+        settled.setdefault(row.notification_id, {})[row.channel] = row.status
+    return settled
 
-        except Exception as e:
-            logger.error("Failed to resend notification", notification_id=notification.id, error=str(e))
-            if notification.attempts >= 3:
-                logger.critical("Notification permanently failed after 3 retries", notification_id=notification.id)
-                await send_admin_alert_email(
-                    subject=f"CRITICAL: Notification {notification.id} permanently failed",
-                    body=f"Notification {notification.id} for user {notification.user_id} (event: {notification.event_type}) permanently failed after 3 retries. Reason: {e}"
-                )
+async def retry_failed_notifications(db: AsyncSession):
+    """
+    Claims retryable notifications in leased batches of RETRY_BATCH_SIZE, re-delivers each batch concurrently
+    (at most RETRY_CONCURRENCY sends in flight) and commits the batch's outcomes together.
+    Keeps claiming until a batch comes back short, so several replicas drain the backlog in parallel.
+    """
+    logger.info("Attempting to retry failed notifications...")
+    semaphore = asyncio.Semaphore(settings.RETRY_CONCURRENCY)
+    retried = 0
+    while True:
+        claimed = await claim_retryable_notifications(db, settings.RETRY_BATCH_SIZE, settings.RETRY_LEASE_SECONDS)
+        if not claimed:
+            break
+        users = await get_users_details_bulk({notification.user_id for notification in claimed})
+        settled_channels = await _settled_channels_by_notification(db, [notification.id for notification in claimed])
+        await db.commit() # Do not sit idle in transaction while the batch is being sent
+        results = await asyncio.gather(
+            *(_retry_notification(notification, users.get(notification.user_id), semaphore, settled_channels.get(notification.id)) for notification in claimed),
+            return_exceptions=True
+        )
+        outcomes = []
+        for notification, result in zip(claimed, results):
+            if isinstance(result, BaseException):
+                # Left leased; picked up again once the lease expires
+                logger.error("Unexpected error retrying notification", notification_id=notification.id, error=str(result))
+                continue
+            outcomes.append(result)
+        if outcomes:
+            await _persist_retry_outcomes(db, claimed, outcomes)
+        retried += len(claimed)
+        if len(claimed) < settings.RETRY_BATCH_SIZE:
+            break
 
-    logger.info("Finished attempting to retry failed notifications.")
+    logger.info("Finished attempting to retry failed notifications.", retried=retried)
+
+async def run_retry_job():
+    """Scheduler entry point: each run gets its own session, closed (and rolled back if unfinished) when it ends."""
+    async with AsyncSessionLocal() as db:
+        await retry_failed_notifications(db)
 
 async def get_notification_stats(db: AsyncSession) -> dict:
     """
     Retrieves aggregated statistics about notifications.
+    Reads the trigger-maintained notification_status_counters (one row per event_type/status) and
+    notification_channel_counters (one row per channel/status) tables in one query, so the cost does not
+    grow with the number of notifications.
     """
     logger.info("Fetching notification stats")
 
-    # Main stats query
-    main_stats_query = text("""
-        SELECT
-            COUNT(*) AS total_notifications,
-            COUNT(*) FILTER (WHERE status = 'SENT') AS total_sent,
-            COUNT(*) FILTER (WHERE status = 'FAILED') AS total_failed,
-            COUNT(*) FILTER (WHERE status = 'PENDING') AS total_pending
-        FROM notifications
-    """)
-    main_stats_result = await db.execute(main_stats_query)
-    main_stats = main_stats_result.first()
-
-    # Stats by status
-    by_status_query = text("""
-        SELECT status, COUNT(*) as count
-        FROM notifications
-        GROUP BY status
-    """)
-    by_status_result = await db.execute(by_status_query)
-    by_status = {row.status: row.count for row in by_status_result}
-
-    # Stats by event type and status
-    by_event_type_query = text("""
-        SELECT event_type, status, COUNT(*) as count
-        FROM notifications
-        GROUP BY event_type, status
-    """)
-    by_event_type_result = await db.execute(by_event_type_query)
+    stats_result = await db.execute(_NOTIFICATION_STATS)
 
+    total_notifications = 0
+    by_status = {}
     by_event_type = {}
-    for row in by_event_type_result:
-        if row.event_type not in by_event_type:
-            by_event_type[row.event_type] = {"SENT": 0, "FAILED": 0, "PENDING": 0}
-        by_event_type[row.event_type][row.status] = row.count
-
-    # Ensure all event types have all statuses
-    all_event_types_query = text("SELECT DISTINCT event_type FROM notifications")
-    all_event_types_result = await db.execute(all_event_types_query)
-    all_event_types = [row.event_type for row in all_event_types_result]
-
-    for event_type in all_event_types:
-        if event_type not in by_event_type:
-            by_event_type[event_type] = {"SENT": 0, "FAILED": 0, "PENDING": 0}
+    by_channel = {}
+    for row in stats_result:
+        count = int(row.count or 0)
+        if row.channel is not None: # (channel, status) of the per-channel deliveries
+            by_channel.setdefault(row.channel, {"SENT": 0, "FAILED": 0, "REJECTED": 0})[row.status] = count
+        elif row.grouping_level == 0: # (event_type, status)
+            if row.event_type not in by_event_type:
+                by_event_type[row.event_type] = {"SENT": 0, "FAILED": 0, "PENDING": 0}
+            by_event_type[row.event_type][row.status] = count
+        elif row.grouping_level == 2: # (status)
+            by_status[row.status] = count
+        else: # grand total
+            total_notifications = count
 
     stats = {
-        "total_notifications": main_stats.total_notifications or 0,
-        "total_sent": main_stats.total_sent or 0,
-        "total_failed": main_stats.total_failed or 0,
-        "total_pending": main_stats.total_pending or 0,
+        "total_notifications": total_notifications,
+        "total_sent": by_status.get("SENT", 0),
+        "total_failed": by_status.get("FAILED", 0),
+        "total_pending": by_status.get("PENDING", 0),
         "by_status": by_status,
         "by_event_type": by_event_type,
+        "by_channel": by_channel,
     }
-    
+
     logger.info("Notification stats retrieved", **stats)
-    return stats
\ No newline at end of file
+    return stats
+
+async def rebuild_notification_counters(db: AsyncSession):
+    """
+    Recomputes notification_status_counters and notification_channel_counters with one grouped scan of
+    notifications and notification_deliveries. Only needed to backfill or repair drift; the triggers keep the counters current.
+    """
+    await db.execute(text("LOCK TABLE notification_status_counters, notification_channel_counters IN EXCLUSIVE MODE"))
+    await db.execute(text("DELETE FROM notification_status_counters"))
+    await db.execute(text("""
+        INSERT INTO notification_status_counters (event_type, status, count)
+        SELECT event_type, status, COUNT(*) FROM notifications GROUP BY event_type, status
+    """))
+    await db.execute(text("DELETE FROM notification_channel_counters"))
+    await db.execute(text("""
+        INSERT INTO notification_channel_counters (channel, status, count)
+        SELECT channel, status, COUNT(*) FROM notification_deliveries GROUP BY channel, status
+    """))
+    await db.commit()
+    logger.info("Notification counters rebuilt")
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+from app.config import settings
+from app.core.logging import logger
+from app.database import AsyncSessionLocal
+from app.services.notification import claim_pending_notifications, deliver_notification, get_notification_by_id, get_users_details_bulk
+
+
+class OutboxWorkerPool:
+    """
+    In-process worker pool draining the notifications outbox.
+
+    A single dispatcher claims leased batches of PENDING rows and hands their ids to `workers`
+    delivery tasks through a bounded queue, so no more rows are leased than can be worked on.
+    """
+
+    def __init__(self, workers: int, batch_size: int, poll_interval: float, lease_seconds: int):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.workers * 2)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatch_loop(), name="outbox-dispatcher")]
+        self._tasks += [asyncio.create_task(self._worker_loop(), name=f"outbox-worker-{i}") for i in range(self.workers)]
+        logger.info("Outbox worker pool started", workers=self.workers, batch_size=self.batch_size)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Outbox worker pool stopped")
+
+    def notify(self):
+        """Wakes the dispatcher so freshly enqueued notifications do not wait for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                async with AsyncSessionLocal() as db:
+                    claimed = await claim_pending_notifications(db, self.batch_size, self.lease_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Failed to claim pending notifications", error=str(e))
+                claimed = []
+
+            if claimed:
+                await self._prefetch_users({user_id for _, user_id, _ in claimed})
+            for notification_id, _, lease_until in claimed:
+                await self._queue.put((notification_id, lease_until))
+
+            if len(claimed) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _prefetch_users(self, user_ids):
+        # Warms the user-details cache for the whole batch so workers resolve recipients in-process
+        try:
+            await get_users_details_bulk(user_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Failed to prefetch user details for outbox batch", error=str(e))
+
+    async def _worker_loop(self):
+        while True:
+            notification_id, lease_until = await self._queue.get()
+            try:
+                await self._deliver(notification_id, lease_until)
+            except asyncio.CancelledError:
+                raise
+            except ValueError as e:
+                logger.warning("Outbox notification not delivered", notification_id=notification_id, error=str(e))
+            except Exception as e:
+                logger.error("Outbox worker failed to deliver notification", notification_id=notification_id, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, notification_id: UUID, lease_until: datetime):
+        # The read's session is closed before sending, so no connection is held (idle in transaction) meanwhile
+        async with AsyncSessionLocal() as db:
+            notification = await get_notification_by_id(db, notification_id)
+        if not notification or notification.status != "PENDING":
+            return
+        if notification.locked_until != lease_until:
+            # The lease expired while queued and the row was claimed again; that claim delivers it
+            logger.warning("Outbox lease lost before delivery, skipping", notification_id=notification_id)
+            return
+        async with AsyncSessionLocal() as db:
+            await deliver_notification(db, notification, lease_until)
+
+
+outbox_worker_pool = OutboxWorkerPool(
+    workers=settings.OUTBOX_WORKERS,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL_SECONDS,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+)
@@ -0,0 +1,133 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.core.logging import logger
+from app.database import AsyncSessionLocal
+from app.services.export import notification_export_record
+
+_PARTITION_NAME = re.compile(r"^notifications_(\d{4})_(\d{2})$")
+
+
+class NotificationPartition(NamedTuple):
+    name: str
+    month: date
+    attached: bool
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def expired_partitions(partitions: List[NotificationPartition], today: date, retention_months: int) -> List[NotificationPartition]:
+    """Partitions whose whole month is older than the retention window (the current month counts as one)."""
+    cutoff = add_months(today.replace(day=1), -(retention_months - 1))
+    return [partition for partition in partitions if partition.month < cutoff]
+
+
+async def ensure_notification_partitions(db: AsyncSession, months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """
+    Creates the partitions for the current month and the next `months_ahead` months if missing, moving any of
+    their rows out of the default partition (see sql/migrations/0007).
+    """
+    month = (today or datetime.utcnow().date()).replace(day=1)
+    names = []
+    for offset in range(months_ahead + 1):
+        result = await db.execute(text("SELECT create_notification_partition(:month)"), {"month": add_months(month, offset)})
+        names.append(result.scalar_one())
+    await db.commit()
+    return names
+
+
+async def list_notification_partitions(db: AsyncSession) -> List[NotificationPartition]:
+    """Monthly partition tables, attached or detached-but-not-yet-dropped, oldest first."""
+    result = await db.execute(text("""
+        SELECT c.relname AS name, c.relispartition AS attached
+        FROM pg_class c
+        WHERE c.relkind = 'r' AND c.relname ~ '^notifications_[0-9]{4}_[0-9]{2}$' AND pg_table_is_visible(c.oid)
+    """))
+    partitions = []
+    for row in result:
+        year, month = _PARTITION_NAME.match(row.name).groups()
+        partitions.append(NotificationPartition(row.name, date(int(year), int(month), 1), row.attached))
+    return sorted(partitions, key=lambda partition: partition.month)
+
+
+async def archive_partition(db: AsyncSession, name: str, archive_dir: Path, batch_size: int = 1000) -> int:
+    """
+    Writes every row of a partition table to `<archive_dir>/<name>.ndjson.gz`, in the export record format.
+    The file is written under a temporary name and renamed once complete. Returns the number of rows.
+    """
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{name}.ndjson.gz"
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    archived = 0
+    lines = []
+    result = await db.stream(text(f'SELECT * FROM "{name}" ORDER BY created_at, id').execution_options(yield_per=batch_size))
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        async for row in result:
+            lines.append(json.dumps(notification_export_record(row._mapping), ensure_ascii=False) + "\n")
+            archived += 1
+            if len(lines) >= batch_size:
+                await asyncio.to_thread(f.writelines, lines)
+                lines = []
+        if lines:
+            await asyncio.to_thread(f.writelines, lines)
+    os.replace(tmp_path, path)
+    logger.info("Notification partition archived", partition=name, rows=archived, path=str(path))
+    return archived
+
+
+async def retire_partition(db: AsyncSession, partition: NotificationPartition, archive_dir: Path):
+    """
+    Detaches an expired partition, archives it and drops it along with its channel deliveries. Each step is safe
+    to repeat, so a run that fails half-way is finished by the next one.
+    """
+    if partition.attached:
+        # Detaching bypasses the counter triggers, so take the partition's rows out of the counters in the same transaction
+        await db.execute(text(f'ALTER TABLE notifications DETACH PARTITION "{partition.name}"'))
+        await db.execute(text(f"""
+            UPDATE notification_status_counters c SET count = c.count - p.count
+            FROM (SELECT event_type, status, COUNT(*) AS count FROM "{partition.name}" GROUP BY event_type, status) p
+            WHERE c.event_type = p.event_type AND c.status = p.status
+        """))
+        await db.commit()
+        logger.info("Notification partition detached", partition=partition.name)
+
+    if not (archive_dir / f"{partition.name}.ndjson.gz").exists():
+        await archive_partition(db, partition.name, archive_dir, batch_size=settings.EXPORT_BATCH_SIZE)
+    # Per-channel deliveries have no foreign key to the partition; their triggers take them out of the channel counters
+    await db.execute(
+        text("DELETE FROM notification_deliveries WHERE notification_created_at >= :start AND notification_created_at < :end"),
+        {"start": partition.month, "end": add_months(partition.month, 1)}
+    )
+    await db.execute(text(f'DROP TABLE "{partition.name}"'))
+    await db.commit()
+    logger.info("Notification partition dropped", partition=partition.name)
+
+
+async def maintain_notification_partitions():
+    """Scheduled job: creates upcoming partitions and retires the ones past NOTIFICATION_RETENTION_MONTHS."""
+    async with AsyncSessionLocal() as db:
+        created = await ensure_notification_partitions(db, settings.NOTIFICATION_PARTITIONS_AHEAD)
+        logger.info("Notification partitions ensured", partitions=created)
+        if settings.NOTIFICATION_RETENTION_MONTHS <= 0:
+            return
+
+        partitions = await list_notification_partitions(db)
+        today = datetime.utcnow().date()
+        for partition in expired_partitions(partitions, today, settings.NOTIFICATION_RETENTION_MONTHS):
+            try:
+                await retire_partition(db, partition, Path(settings.NOTIFICATION_ARCHIVE_DIR))
+            except Exception as e:
+                await db.rollback()
+                logger.error("Failed to retire notification partition", partition=partition.name, error=str(e))
@@ -0,0 +1,242 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from string import Formatter
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
+from urllib.parse import quote
+from app.core.logging import logger
+
+DEFAULT_LANGUAGE = "en"
+DEFAULT_SUBJECT = "Notification"
+
+_SIMPLE_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_FIELD_ROOT = re.compile(r"^[^.\[]*")
+
+
+class TemplateNotFoundError(ValueError):
+    pass
+
+
+class MissingTemplateContextError(ValueError):
+    pass
+
+
+class CompiledFormatter:
+    """
+    A `str.format` template parsed once into literal chunks and fields.
+    Plain `{name}` fields render by lookup and join; anything fancier falls back to `str.format_map`.
+    """
+
+    __slots__ = ("source", "fields", "_parts", "_simple")
+
+    def __init__(self, source: str):
+        self.source = source
+        parts: List[Union[str, Tuple[str, str, str]]] = []
+        fields = set()
+        simple = True
+        for literal, field_name, format_spec, conversion in Formatter().parse(source):
+            if literal:
+                parts.append(literal)
+            if field_name is None:
+                continue
+            if not field_name or field_name.isdigit():
+                raise ValueError(f"Positional placeholders are not supported in templates: {source!r}")
+            fields.add(_FIELD_ROOT.match(field_name).group(0))
+            if not _SIMPLE_FIELD.match(field_name) or format_spec or conversion:
+                simple = False
+            parts.append((field_name, format_spec, conversion))
+        self.fields: FrozenSet[str] = frozenset(fields)
+        self._parts = parts
+        self._simple = simple
+
+    def render(self, context: Dict[str, Any]) -> str:
+        if not self._simple:
+            return self.source.format_map(context)
+        return "".join(part if isinstance(part, str) else str(context[part[0]]) for part in self._parts)
+
+
+class CompiledTemplate:
+    __slots__ = ("event_type", "language", "subject", "body", "placeholders")
+
+    def __init__(self, event_type: str, language: str, subject: str, body: str):
+        self.event_type = event_type
+        self.language = language
+        self.subject = CompiledFormatter(subject)
+        self.body = CompiledFormatter(body)
+        self.placeholders: FrozenSet[str] = self.subject.fields | self.body.fields
+
+    def render(self, context: Dict[str, Any]) -> Dict[str, str]:
+        missing = self.placeholders - context.keys()
+        if missing:
+            raise MissingTemplateContextError(f"Missing context keys for '{self.event_type}' template: {', '.join(sorted(missing))}")
+        return {"subject": self.subject.render(context), "body": self.body.render(context)}
+
+
+class TemplateIndex:
+    """
+    Notification templates compiled once into a flat index keyed by (event_type, language).
+
+    Accepts the notifications.json layout: per event type, the body per language code at the top
+    level (or under "body") and a "subject" mapping per language.
+    """
+
+    def __init__(self, raw_templates: Dict[str, Any]):
+        self.version = str(raw_templates.get("version", "unknown"))
+        self._templates: Dict[Tuple[str, str], CompiledTemplate] = {}
+        self._placeholders: Dict[str, FrozenSet[str]] = {}
+
+        for event_type, template_data in raw_templates.items():
+            if event_type == "version" or not isinstance(template_data, dict):
+                continue
+            subjects = template_data.get("subject", {})
+            bodies = template_data.get("body") or {
+                language: body for language, body in template_data.items() if language != "subject" and isinstance(body, str)
+            }
+            placeholders = set()
+            for language, body in bodies.items():
+                subject = subjects.get(language, subjects.get(DEFAULT_LANGUAGE, DEFAULT_SUBJECT))
+                template = CompiledTemplate(event_type, language, subject, body)
+                self._templates[(event_type, language)] = template
+                placeholders |= template.placeholders
+            # The recipient's language is only known at delivery time, so a context must satisfy every language
+            self._placeholders[event_type] = frozenset(placeholders)
+
+    @property
+    def event_types(self) -> FrozenSet[str]:
+        return frozenset(self._placeholders)
+
+    def get(self, event_type: str, language: str) -> CompiledTemplate:
+        template = self._templates.get((event_type, language)) or self._templates.get((event_type, DEFAULT_LANGUAGE))
+        if template is None:
+            raise TemplateNotFoundError(f"No template found for event_type '{event_type}'.")
+        return template
+
+    def placeholders(self, event_type: str) -> FrozenSet[str]:
+        if event_type not in self._placeholders:
+            raise TemplateNotFoundError(f"No template found for event_type '{event_type}'.")
+        return self._placeholders[event_type]
+
+    def validate_context(self, event_type: str, context: Dict[str, Any]):
+        missing = self.placeholders(event_type) - context.keys()
+        if missing:
+            raise MissingTemplateContextError(f"Missing context keys for '{event_type}' template: {', '.join(sorted(missing))}")
+
+    def render(self, event_type: str, language: str, context: Dict[str, Any]) -> Dict[str, str]:
+        return self.get(event_type, language).render(context)
+
+
+class TemplateRegistry:
+    """
+    Versioned, hot-reloadable store of compiled templates.
+
+    Each version found in the templates file is compiled once and kept in memory (up to
+    `max_versions`), so notifications can be re-rendered with the version they were queued with.
+    With an `archive_dir`, every loaded file is also kept there as `<version>.json`, and versions
+    no longer in memory (evicted, or loaded before a restart) are compiled again from it.
+    Reloads build new objects and swap references; readers never take a lock.
+    """
+
+    def __init__(self, path: Path, max_versions: int, archive_dir: Optional[Path] = None):
+        self.path = Path(path)
+        self.max_versions = max_versions
+        self.archive_dir = Path(archive_dir) if archive_dir else None
+        self.current = TemplateIndex({})
+        self._versions: "OrderedDict[str, TemplateIndex]" = OrderedDict()
+        self._mtime: Optional[float] = None
+        self.restored = 0
+        self.misses = 0
+
+    @property
+    def versions(self) -> List[str]:
+        return list(self._versions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"current_version": self.current.version, "versions_retained": len(self._versions), "versions_restored": self.restored, "version_misses": self.misses}
+
+    def _archive_path(self, version: str) -> Path:
+        return self.archive_dir / f"{quote(version, safe='')}.json"
+
+    def _archive(self, index: TemplateIndex, source: str):
+        path = self._archive_path(index.version)
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(source, encoding="utf-8")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error("Failed to archive notification templates", error=str(e), version=index.version, path=str(path))
+
+    def _remember(self, index: TemplateIndex):
+        versions = OrderedDict(self._versions)
+        versions.pop(index.version, None)
+        versions[index.version] = index
+        while len(versions) > self.max_versions:
+            versions.popitem(last=False)
+        self._versions = versions
+
+    def load(self) -> TemplateIndex:
+        """(Re)loads the templates file and makes it the current version. A broken file leaves the current version live."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r", encoding="utf-8") as f:
+                source = f.read()
+            index = TemplateIndex(json.loads(source))
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load notification templates", error=str(e), path=str(self.path))
+            return self.current
+
+        if index.version in self._versions and mtime != self._mtime:
+            logger.warning("Templates file changed without a version bump, replacing compiled version", version=index.version)
+        if self.archive_dir is not None:
+            self._archive(index, source)
+        self._remember(index)
+        self.current = index
+        self._mtime = mtime
+        logger.info("Notification templates loaded", version=index.version, versions=self.versions)
+        return index
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logger.error("Failed to stat notification templates", error=str(e), path=str(self.path))
+            return False
+        if mtime == self._mtime:
+            return False
+        self.load()
+        return True
+
+    def _restore(self, version: str) -> Optional[TemplateIndex]:
+        if self.archive_dir is None:
+            return None
+        path = self._archive_path(version)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = TemplateIndex(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error("Failed to restore archived notification templates", error=str(e), version=version, path=str(path))
+            return None
+        if index.version != version:
+            return None
+        self._remember(index)
+        self.restored += 1
+        logger.info("Notification templates restored from archive", version=version)
+        return index
+
+    def get(self, version: Optional[str] = None) -> TemplateIndex:
+        """
+        Returns the requested version, from memory or the archive. An unknown version is counted as a miss
+        and served with the current one.
+        """
+        if version is None:
+            return self.current
+        index = self._versions.get(version) or self._restore(version)
+        if index is None:
+            self.misses += 1
+            logger.warning("Template version not available, using current version", requested_version=version, current_version=self.current.version)
+            return self.current
+        return index
@@ -1,7 +1,11 @@
 import asyncio
+import random
 import structlog
+from collections import defaultdict
 from functools import wraps
 from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+from app.core.metrics import register_collector
 
 logger = structlog.get_logger()
 
@@ -16,17 +20,17 @@ class CircuitBreaker:
     def _open(self):
         self.state = "OPEN"
         self.last_failure_time = datetime.utcnow()
-        logger.warning("Circuit Breaker OPEN", event="circuit_breaker_state_change", state=self.state, service="SES")
+        logger.warning("Circuit Breaker OPEN", event_name="circuit_breaker_state_change", state=self.state, service="SES")
 
     def _half_open(self):
         self.state = "HALF_OPEN"
-        logger.info("Circuit Breaker HALF-OPEN", event="circuit_breaker_state_change", state=self.state, service="SES")
+        logger.info("Circuit Breaker HALF-OPEN", event_name="circuit_breaker_state_change", state=self.state, service="SES")
 
     def _close(self):
         self.state = "CLOSED"
         self.failures = 0
         self.last_failure_time = None
-        logger.info("Circuit Breaker CLOSED", event="circuit_breaker_state_change", state=self.state, service="SES")
+        logger.info("Circuit Breaker CLOSED", event_name="circuit_breaker_state_change", state=self.state, service="SES")
 
     def __call__(self, func):
         @wraps(func)
@@ -35,7 +39,7 @@ class CircuitBreaker:
                 if (datetime.utcnow() - self.last_failure_time).total_seconds() > self.reset_timeout:
                     self._half_open()
                 else:
-                    logger.warning("Circuit Breaker OPEN, blocking call", event="circuit_breaker_blocked", service="SES")
+                    logger.warning("Circuit Breaker OPEN, blocking call", event_name="circuit_breaker_blocked", service="SES")
                     raise CircuitBreakerOpenException("Circuit breaker is open")
 
             try:
@@ -44,9 +48,11 @@ class CircuitBreaker:
                     self._close()
                 return result
             except Exception as e:
+                if classify_error(e).kind != TRANSIENT:
+                    raise # The provider answered; a rejected message or a full send quota says nothing about its health
                 self.failures += 1
                 self.last_failure_time = datetime.utcnow()
-                logger.warning("Circuit Breaker failure recorded", event="circuit_breaker_failure", failures=self.failures, state=self.state, service="SES")
+                logger.warning("Circuit Breaker failure recorded", event_name="circuit_breaker_failure", failures=self.failures, state=self.state, service="SES")
                 if self.state == "HALF_OPEN" or self.failures >= self.failure_threshold:
                     self._open()
                 raise e
@@ -55,35 +61,128 @@ class CircuitBreaker:
 class CircuitBreakerOpenException(Exception):
     pass
 
-def async_retry(tries=3, delay=1, backoff=2, exceptions=(Exception,), circuit_breaker: CircuitBreaker = None):
+# Error classes for retry decisions
+PERMANENT = "permanent" # Retrying cannot help (e.g. rejected message, invalid address): fail fast, do not reschedule
+THROTTLED = "throttled" # The provider asked us to slow down; wait as long as it says if it says
+TRANSIENT = "transient" # Anything else (timeouts, 5xx, connection errors): jittered exponential backoff
+
+
+class ErrorClassification(NamedTuple):
+    kind: str
+    retry_after: Optional[float] = None # Seconds the provider asked us to wait, for THROTTLED errors
+
+
+class PermanentError(Exception):
+    """Raised by senders for failures that no retry can fix."""
+
+
+class ThrottledError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Callables mapping an exception to its classification, or None if they do not recognise it
+_error_classifiers: List[Callable[[BaseException], Optional[ErrorClassification]]] = []
+
+def register_error_classifier(classifier: Callable[[BaseException], Optional[ErrorClassification]]):
+    _error_classifiers.append(classifier)
+
+def classify_error(error: BaseException) -> ErrorClassification:
+    if isinstance(error, PermanentError):
+        return ErrorClassification(PERMANENT)
+    if isinstance(error, ThrottledError):
+        return ErrorClassification(THROTTLED, error.retry_after)
+    for classifier in _error_classifiers:
+        classification = classifier(error)
+        if classification is not None:
+            return classification
+    return ErrorClassification(TRANSIENT)
+
+
+# {scope: {decision: count}} for every retry decision, exposed on GET /metrics
+_retry_decisions: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+def record_retry_decision(scope: str, decision: str):
+    _retry_decisions[scope][decision] += 1
+
+def retry_decision_stats() -> Dict[str, Dict[str, int]]:
+    return {scope: dict(decisions) for scope, decisions in _retry_decisions.items()}
+
+register_collector("retry_decisions", retry_decision_stats)
+
+
+def async_retry(tries=3, delay=1, backoff=2, max_delay=30, exceptions=(Exception,), circuit_breaker: CircuitBreaker = None):
+    """
+    Retries a coroutine up to `tries` times, by error class (see classify_error):
+    permanent errors are raised at once; throttling waits the provider's retry-after when it gives one;
+    transient errors wait between half and all of delay * backoff ** n. A wait longer than `max_delay`
+    is not slept in-process: the error is raised for the caller's own, longer-term retry schedule.
+    Decisions are counted under the function's name in the `retry_decisions` metric.
+    """
     def deco(func):
+        call = circuit_breaker(func) if circuit_breaker else func
+        scope = func.__name__
+
         @wraps(func)
         async def f_retry(*args, **kwargs):
             if circuit_breaker and circuit_breaker.state == "OPEN":
                 if (datetime.utcnow() - circuit_breaker.last_failure_time).total_seconds() > circuit_breaker.reset_timeout:
                     circuit_breaker._half_open()
                 else:
-                    logger.warning("Circuit Breaker OPEN, blocking retry attempt", event="circuit_breaker_blocked_retry", service="SES")
+                    logger.warning("Circuit Breaker OPEN, blocking retry attempt", event_name="circuit_breaker_blocked_retry", service="SES")
+                    record_retry_decision(scope, "circuit_open")
                     raise CircuitBreakerOpenException("Circuit breaker is open, blocking retry")
 
-            mtries, mdelay = tries, delay
-            while mtries > 1:
+            for attempt in range(tries):
                 try:
-                    if circuit_breaker:
-                        return await circuit_breaker(func)(*args, **kwargs)
-                    else:
-                        return await func(*args, **kwargs)
-                except exceptions as e:
-                    logger.warning("Exception during retry", event="retry_exception", error=str(e), delay=mdelay, error_type=type(e).__name__, service="SES")
-                    await asyncio.sleep(mdelay)
-                    mtries -= 1
-                    mdelay *= backoff
+                    return await call(*args, **kwargs)
                 except CircuitBreakerOpenException:
+                    record_retry_decision(scope, "circuit_open")
                     raise # Re-raise if circuit breaker opens during a retry loop
-            
-            if circuit_breaker:
-                return await circuit_breaker(func)(*args, **kwargs)
-            else:
-                return await func(*args, **kwargs) # Last attempt
+                except exceptions as e:
+                    classification = classify_error(e)
+                    if classification.kind == PERMANENT:
+                        record_retry_decision(scope, "permanent_fail_fast")
+                        raise
+                    if attempt == tries - 1:
+                        record_retry_decision(scope, f"{classification.kind}_exhausted")
+                        raise
+                    if classification.kind == THROTTLED and classification.retry_after is not None:
+                        wait = classification.retry_after
+                    else:
+                        full_delay = delay * backoff ** attempt
+                        wait = full_delay / 2 + random.uniform(0, full_delay / 2)
+                    if wait > max_delay:
+                        record_retry_decision(scope, f"{classification.kind}_deferred")
+                        raise
+                    record_retry_decision(scope, f"{classification.kind}_retry")
+                    logger.warning("Retrying after error", function=scope, error=str(e), error_type=type(e).__name__, error_class=classification.kind, attempt=attempt + 1, delay=round(wait, 3))
+                    await asyncio.sleep(wait)
         return f_retry
     return deco
+
+class BackoffPolicy:
+    """
+    Exponential backoff with jitter for retries spread across scheduler runs.
+    The n-th retry waits between half and all of min(base_delay * multiplier ** n, max_delay).
+    """
+
+    def __init__(self, base_delay: float = 60, max_delay: float = 3600, multiplier: float = 2.0, max_attempts: int = 3):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_attempts = max_attempts
+
+    def next_delay(self, attempts: int) -> Optional[float]:
+        """Seconds to wait after `attempts` retries have been made, or None once they are used up."""
+        if attempts >= self.max_attempts:
+            return None
+        delay = min(self.base_delay * self.multiplier ** attempts, self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def next_attempt_at(self, attempts: int, now: Optional[datetime] = None) -> Optional[datetime]:
+        delay = self.next_delay(attempts)
+        if delay is None:
+            return None
+        return (now or datetime.utcnow()) + timedelta(seconds=delay)
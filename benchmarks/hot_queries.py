@@ -0,0 +1,90 @@
+"""
+Microbenchmark for the notification hot queries against a local Postgres (DATABASE_URL, migrated).
+
+    python -m benchmarks.hot_queries [--iterations 2000]
+
+Compares, per call:
+  - lookup by id: a freshly built select() without asyncpg's statement cache vs the prebuilt statement with it
+  - enqueue: ORM add + flush + refresh vs the prebuilt INSERT ... RETURNING
+Rows inserted by the benchmark are deleted at the end.
+"""
+import argparse
+import asyncio
+import time
+from uuid import uuid4
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.config import settings
+from app.models.notification import Notification
+from app.services.notification import _INSERT_NOTIFICATION, _SELECT_NOTIFICATION_BY_ID
+
+
+def _engine(statement_cache_size: int):
+    return create_async_engine(settings.DATABASE_URL, pool_size=1, max_overflow=0, connect_args={"prepared_statement_cache_size": statement_cache_size})
+
+
+async def _timed(label: str, iterations: int, fn) -> float:
+    await fn(0) # Warm up the connection and the caches
+    started = time.perf_counter()
+    for i in range(iterations):
+        await fn(i)
+    per_call_us = (time.perf_counter() - started) / iterations * 1_000_000
+    print(f"{label:<48} {per_call_us:>10.1f} µs/call")
+    return per_call_us
+
+
+async def _bench_lookup(uncached: AsyncSession, cached: AsyncSession, notification_id, iterations: int):
+    async def built_per_call(_):
+        await uncached.execute(select(Notification).where(Notification.id == notification_id))
+
+    async def prebuilt(_):
+        await cached.execute(_SELECT_NOTIFICATION_BY_ID, {"notification_id": notification_id})
+
+    before = await _timed("lookup: select() per call, no statement cache", iterations, built_per_call)
+    after = await _timed("lookup: prebuilt statement, statement cache", iterations, prebuilt)
+    print(f"{'  saving':<48} {before - after:>10.1f} µs/call")
+
+
+async def _bench_enqueue(uncached: AsyncSession, cached: AsyncSession, user_id, iterations: int):
+    def row():
+        return {"id": uuid4(), "user_id": user_id, "event_type": "payment_success", "status": "PENDING", "attempts": 0, "context": {"amount": 1}}
+
+    async def add_and_refresh(_):
+        notification = Notification(**row())
+        uncached.add(notification)
+        await uncached.flush()
+        await uncached.refresh(notification)
+
+    async def insert_returning(_):
+        (await cached.scalars(_INSERT_NOTIFICATION, [row()])).one()
+
+    before = await _timed("enqueue: add + flush + refresh, no statement cache", iterations, add_and_refresh)
+    after = await _timed("enqueue: INSERT ... RETURNING, statement cache", iterations, insert_returning)
+    print(f"{'  saving':<48} {before - after:>10.1f} µs/call")
+
+
+async def main(iterations: int):
+    uncached_engine = _engine(0)
+    cached_engine = _engine(settings.DB_STATEMENT_CACHE_SIZE or 256)
+    user_id = uuid4() # Marks every row the benchmark inserts
+    try:
+        async with AsyncSession(uncached_engine, expire_on_commit=False) as uncached, AsyncSession(cached_engine, expire_on_commit=False) as cached:
+            seed = (await cached.scalars(_INSERT_NOTIFICATION, [{"id": uuid4(), "user_id": user_id, "event_type": "payment_success", "status": "PENDING", "attempts": 0, "context": {}}])).one()
+            await cached.commit()
+
+            await _bench_lookup(uncached, cached, seed.id, iterations)
+            await _bench_enqueue(uncached, cached, user_id, iterations)
+            await uncached.commit()
+            await cached.commit()
+
+            await cached.execute(delete(Notification).where(Notification.user_id == user_id))
+            await cached.commit()
+    finally:
+        await uncached_engine.dispose()
+        await cached_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the cached notification hot queries.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    asyncio.run(main(parser.parse_args().iterations))
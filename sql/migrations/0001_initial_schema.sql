@@ -0,0 +1,82 @@
+-- Baseline schema (formerly sql/schema.sql). Idempotent so databases created by the old migrate.sh can adopt it.
+
+CREATE TABLE IF NOT EXISTS Notifications (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    event_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('PENDING', 'SENT', 'FAILED')),
+    attempts INTEGER DEFAULT 0,
+    context JSONB NOT NULL,
+    template_version VARCHAR(50),
+    sent_at TIMESTAMP,
+    locked_until TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON Notifications(user_id);
+CREATE INDEX IF NOT EXISTS idx_notifications_event_type ON Notifications(event_type);
+CREATE INDEX IF NOT EXISTS idx_notifications_status ON Notifications(status);
+
+-- Outbox: lease column for databases created before it existed, and an index for claiming PENDING rows
+ALTER TABLE Notifications ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_notifications_pending ON Notifications(created_at) WHERE status = 'PENDING';
+
+-- Template version each notification is rendered with
+ALTER TABLE Notifications ADD COLUMN IF NOT EXISTS template_version VARCHAR(50);
+
+-- Keyset pagination on (created_at, id) for GET /api/v1/notifications, alone or after an equality filter
+CREATE INDEX IF NOT EXISTS idx_notifications_created_at_id ON Notifications(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON Notifications(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_notifications_event_created ON Notifications(event_type, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_notifications_status_created ON Notifications(status, created_at, id);
+
+-- Materialized per (event_type, status) counters for GET /stats, kept current by triggers
+CREATE TABLE IF NOT EXISTS notification_status_counters (
+    event_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (event_type, status)
+);
+
+CREATE OR REPLACE FUNCTION notification_status_counters_apply() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE notification_status_counters SET count = count - 1
+        WHERE event_type = OLD.event_type AND status = OLD.status;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO notification_status_counters (event_type, status, count) VALUES (NEW.event_type, NEW.status, 1)
+        ON CONFLICT (event_type, status) DO UPDATE SET count = notification_status_counters.count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notification_counters_insert_delete ON Notifications;
+CREATE TRIGGER trg_notification_counters_insert_delete
+    AFTER INSERT OR DELETE ON Notifications
+    FOR EACH ROW EXECUTE FUNCTION notification_status_counters_apply();
+
+DROP TRIGGER IF EXISTS trg_notification_counters_update ON Notifications;
+CREATE TRIGGER trg_notification_counters_update
+    AFTER UPDATE OF status, event_type ON Notifications
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.event_type IS DISTINCT FROM NEW.event_type)
+    EXECUTE FUNCTION notification_status_counters_apply();
+
+-- Backfill counters for rows that existed before the triggers
+INSERT INTO notification_status_counters (event_type, status, count)
+SELECT event_type, status, COUNT(*) FROM Notifications
+WHERE NOT EXISTS (SELECT 1 FROM notification_status_counters)
+GROUP BY event_type, status;
+
+-- Per-minute delivery outcomes with a latency histogram, upserted by the delivery path
+CREATE TABLE IF NOT EXISTS notification_delivery_rollups (
+    bucket_start TIMESTAMP NOT NULL,
+    event_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    latency_le_ms INTEGER NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_start, event_type, status, latency_le_ms)
+);
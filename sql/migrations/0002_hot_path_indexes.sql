@@ -0,0 +1,11 @@
+-- Listings, exports and stats filtered by event type and status over a time range.
+-- (user_id, created_at) is already served by idx_notifications_user_created (user_id, created_at, id).
+CREATE INDEX IF NOT EXISTS idx_notifications_event_status_created ON Notifications(event_type, status, created_at, id);
+
+-- created_at follows insertion order, so a BRIN index answers wide time-range scans for a few pages
+CREATE INDEX IF NOT EXISTS idx_notifications_created_at_brin ON Notifications USING BRIN (created_at);
+
+-- The single-column indexes are leading prefixes of the composite ones and only cost writes
+DROP INDEX IF EXISTS idx_notifications_user_id;
+DROP INDEX IF EXISTS idx_notifications_event_type;
+DROP INDEX IF EXISTS idx_notifications_status;
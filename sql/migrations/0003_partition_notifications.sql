@@ -0,0 +1,68 @@
+-- Range-partition Notifications by month on created_at (PostgreSQL 13+).
+-- The primary key must include the partition key, so it becomes (id, created_at).
+-- Partitions are named notifications_YYYY_MM; app/services/partitions.py creates them ahead of time
+-- and detaches/archives expired ones.
+
+ALTER TABLE Notifications RENAME TO notifications_unpartitioned;
+
+CREATE TABLE notifications (
+    id UUID NOT NULL,
+    user_id UUID NOT NULL,
+    event_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('PENDING', 'SENT', 'FAILED')),
+    attempts INTEGER DEFAULT 0,
+    context JSONB NOT NULL,
+    template_version VARCHAR(50),
+    sent_at TIMESTAMP,
+    locked_until TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE OR REPLACE FUNCTION create_notification_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    start_at DATE := date_trunc('month', month_start)::date;
+    partition_name TEXT := 'notifications_' || to_char(start_at, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF notifications FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_at, (start_at + INTERVAL '1 month')::date
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- One partition per month from the oldest existing row (or last month) to three months ahead
+SELECT create_notification_partition(month_start::date)
+FROM generate_series(
+    date_trunc('month', LEAST((SELECT MIN(created_at) FROM notifications_unpartitioned), CURRENT_TIMESTAMP - INTERVAL '1 month')),
+    date_trunc('month', CURRENT_TIMESTAMP + INTERVAL '3 months'),
+    INTERVAL '1 month'
+) AS month_start;
+
+-- Copy before the counter triggers exist: notification_status_counters already counts these rows
+INSERT INTO notifications (id, user_id, event_type, status, attempts, context, template_version, sent_at, locked_until, created_at, updated_at)
+SELECT id, user_id, event_type, status, attempts, context, template_version, sent_at, locked_until, created_at, updated_at
+FROM notifications_unpartitioned;
+
+DROP TABLE notifications_unpartitioned;
+
+-- Indexes on the parent are created on every partition, current and future
+CREATE INDEX idx_notifications_created_at_id ON notifications(created_at, id);
+CREATE INDEX idx_notifications_user_created ON notifications(user_id, created_at, id);
+CREATE INDEX idx_notifications_event_created ON notifications(event_type, created_at, id);
+CREATE INDEX idx_notifications_status_created ON notifications(status, created_at, id);
+CREATE INDEX idx_notifications_event_status_created ON notifications(event_type, status, created_at, id);
+CREATE INDEX idx_notifications_pending ON notifications(created_at) WHERE status = 'PENDING';
+CREATE INDEX idx_notifications_created_at_brin ON notifications USING BRIN (created_at);
+
+CREATE TRIGGER trg_notification_counters_insert_delete
+    AFTER INSERT OR DELETE ON notifications
+    FOR EACH ROW EXECUTE FUNCTION notification_status_counters_apply();
+
+CREATE TRIGGER trg_notification_counters_update
+    AFTER UPDATE OF status, event_type ON notifications
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.event_type IS DISTINCT FROM NEW.event_type)
+    EXECUTE FUNCTION notification_status_counters_apply();
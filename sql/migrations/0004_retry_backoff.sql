@@ -0,0 +1,11 @@
+-- When a FAILED notification is next due for retry (exponential backoff with jitter, set by the app).
+-- NULL means it is not scheduled: delivered, pending, or out of attempts.
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP;
+
+-- Rows the old attempts < 3 rule would still retry are due immediately
+UPDATE notifications SET next_attempt_at = CURRENT_TIMESTAMP WHERE status = 'FAILED' AND attempts < 3;
+
+-- The retry job only reads due rows, most overdue first. This is the only index it needs: it covers every
+-- retryable row without baking the attempt limit (which varies per event type) into the predicate.
+CREATE INDEX IF NOT EXISTS idx_notifications_next_attempt ON notifications(next_attempt_at)
+    WHERE status = 'FAILED' AND next_attempt_at IS NOT NULL;
@@ -0,0 +1,63 @@
+-- One row per channel (email, SMS) a notification was attempted on, with that channel's own status, attempts
+-- and provider message id. notifications.status stays the overall outcome: SENT once every channel is SENT.
+-- No foreign key to the partitioned notifications table, so expired partitions can still be detached;
+-- app/services/partitions.py deletes a retired month's deliveries (notification_created_at) itself.
+CREATE TABLE IF NOT EXISTS notification_deliveries (
+    notification_id UUID NOT NULL,
+    notification_created_at TIMESTAMP NOT NULL,
+    channel VARCHAR(20) NOT NULL CHECK (channel IN ('email', 'sms')),
+    status VARCHAR(20) NOT NULL CHECK (status IN ('SENT', 'FAILED')),
+    attempts INTEGER NOT NULL DEFAULT 1,
+    provider_message_id VARCHAR(255),
+    last_error TEXT,
+    sent_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (notification_id, channel)
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_deliveries_notification_created_at ON notification_deliveries(notification_created_at);
+
+-- Per (channel, status) counts for GET /stats, kept current by triggers like notification_status_counters
+CREATE TABLE IF NOT EXISTS notification_channel_counters (
+    channel VARCHAR(20) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (channel, status)
+);
+
+CREATE OR REPLACE FUNCTION notification_channel_counters_apply() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE notification_channel_counters SET count = count - 1
+        WHERE channel = OLD.channel AND status = OLD.status;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO notification_channel_counters (channel, status, count) VALUES (NEW.channel, NEW.status, 1)
+        ON CONFLICT (channel, status) DO UPDATE SET count = notification_channel_counters.count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_notification_channel_counters_insert_delete
+    AFTER INSERT OR DELETE ON notification_deliveries
+    FOR EACH ROW EXECUTE FUNCTION notification_channel_counters_apply();
+
+CREATE TRIGGER trg_notification_channel_counters_update
+    AFTER UPDATE OF status, channel ON notification_deliveries
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.channel IS DISTINCT FROM NEW.channel)
+    EXECUTE FUNCTION notification_channel_counters_apply();
+
+-- Before this table, a stored SES MessageId was the only per-channel record: the email went out
+INSERT INTO notification_deliveries (notification_id, notification_created_at, channel, status, provider_message_id, sent_at, created_at, updated_at)
+SELECT id, created_at, 'email', 'SENT', context->>'ses_message_id', COALESCE(sent_at, updated_at), created_at, updated_at
+FROM notifications
+WHERE context ? 'ses_message_id'
+ON CONFLICT (notification_id, channel) DO NOTHING;
+
+-- The old retry job marked FAILED rows with an SES MessageId as SENT without resending (the MessageId was only
+-- stored once every channel had gone out); settle them here, as the retry job now goes by notification_deliveries
+UPDATE notifications SET status = 'SENT', sent_at = COALESCE(sent_at, updated_at), next_attempt_at = NULL
+WHERE status = 'FAILED' AND context ? 'ses_message_id';
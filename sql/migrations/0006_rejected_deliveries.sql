@@ -0,0 +1,4 @@
+-- A channel the provider rejected for good (invalid address, rejected content) is REJECTED rather than FAILED:
+-- it is never resent, and a notification whose only failures are rejections is not rescheduled (next_attempt_at NULL).
+ALTER TABLE notification_deliveries DROP CONSTRAINT IF EXISTS notification_deliveries_status_check;
+ALTER TABLE notification_deliveries ADD CONSTRAINT notification_deliveries_status_check CHECK (status IN ('SENT', 'FAILED', 'REJECTED'));
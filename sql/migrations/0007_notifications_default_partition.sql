@@ -0,0 +1,39 @@
+-- Catch-all partition for rows outside every monthly partition (a clock far ahead, a backdated import, or the
+-- partition job falling behind) so an insert is never rejected for lack of a partition.
+CREATE TABLE IF NOT EXISTS notifications_default PARTITION OF notifications DEFAULT;
+
+-- A month the default partition already holds rows for cannot be attached over it (the default's constraint
+-- check fails), so the partition is built as a plain table, the month's rows are moved into it, and it is
+-- attached afterwards.
+CREATE OR REPLACE FUNCTION create_notification_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    start_at DATE := date_trunc('month', month_start)::date;
+    end_at DATE := (start_at + INTERVAL '1 month')::date;
+    partition_name TEXT := 'notifications_' || to_char(start_at, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    -- Keep new rows for the month out of the default partition until the new partition is attached
+    LOCK TABLE notifications_default IN EXCLUSIVE MODE;
+    EXECUTE format('CREATE TABLE %I (LIKE notifications INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM notifications_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        start_at, end_at, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE notifications ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_at, end_at
+    );
+    -- The delete took the moved rows out of notification_status_counters and attaching fires no triggers
+    EXECUTE format(
+        'INSERT INTO notification_status_counters (event_type, status, count) '
+        'SELECT event_type, status, COUNT(*) FROM %I GROUP BY event_type, status '
+        'ON CONFLICT (event_type, status) DO UPDATE SET count = notification_status_counters.count + EXCLUDED.count',
+        partition_name
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
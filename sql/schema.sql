@@ -1,17 +0,0 @@
-
-
-CREATE TABLE IF NOT EXISTS Notifications (
-    id UUID PRIMARY KEY,
-    user_id UUID NOT NULL,
-    event_type VARCHAR(50) NOT NULL,
-    status VARCHAR(20) NOT NULL CHECK (status IN ('PENDING', 'SENT', 'FAILED')),
-    attempts INTEGER DEFAULT 0,
-    context JSONB NOT NULL,
-    sent_at TIMESTAMP,
-    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE INDEX idx_notifications_user_id ON Notifications(user_id);
-CREATE INDEX idx_notifications_event_type ON Notifications(event_type);
-CREATE INDEX idx_notifications_status ON Notifications(status);
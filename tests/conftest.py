@@ -1,5 +1,6 @@
 import pytest
-from httpx import AsyncClient
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.main import app, get_db
@@ -14,7 +15,8 @@ TEST_DATABASE_URL = settings.DATABASE_URL.replace("public", "test_notifications"
 def anyio_backend():
     return "asyncio"
 
-@pytest.fixture(scope="session")
+# Function-scoped so the engine's connections live on the test's own event loop
+@pytest_asyncio.fixture
 async def db_engine():
     engine = create_async_engine(TEST_DATABASE_URL, echo=True)
     async with engine.begin() as conn:
@@ -24,20 +26,33 @@ async def db_engine():
         await conn.run_sync(Base.metadata.drop_all)
     await engine.dispose()
 
-@pytest.fixture(scope="function")
+@pytest_asyncio.fixture
 async def db_session(db_engine):
     async_session = sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
     async with async_session() as session:
         yield session
         await session.rollback() # Rollback after each test to ensure clean state
 
-@pytest.fixture(scope="function")
+@pytest_asyncio.fixture
 async def client(db_session):
     app.dependency_overrides[get_db] = lambda: db_session
-    async with AsyncClient(app=app, base_url="http://test") as ac:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
         yield ac
     app.dependency_overrides.clear()
 
+@pytest.fixture
+def mock_db_session(mocker):
+    # AsyncSession stand-in for service tests that do not need the database; INSERT ... RETURNING echoes the inserted rows
+    from app.models.notification import Notification
+    session = mocker.MagicMock(spec=AsyncSession)
+
+    def returning(statement, rows=None, *args, **kwargs):
+        notifications = [Notification(**row) for row in rows or []]
+        return mocker.Mock(one=lambda: notifications[0], all=lambda: notifications)
+
+    session.scalars.side_effect = returning
+    return session
+
 @pytest.fixture
 def mock_user_management_verify(mocker):
     # Mock the httpx.AsyncClient.post call for user management verification
@@ -83,5 +98,5 @@ def mock_ses_send_email(mocker):
 
 @pytest.fixture
 def mock_sms_send(mocker):
-    mock_sms = mocker.patch("app.services.notification.send_sms_mock", return_value=True)
+    mock_sms = mocker.patch("app.services.notification.send_sms", return_value="mock-sms-id")
     return mock_sms
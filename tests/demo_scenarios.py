@@ -2,7 +2,7 @@ import pytest
 from uuid import uuid4, UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.notification import send_notification_service, retry_failed_notifications
-from app.models.notification import Notification
+from app.models.notification import Notification, NotificationDelivery
 from datetime import datetime
 from sqlalchemy import select
 import logging
@@ -40,10 +40,13 @@ async def test_send_notification_ses_failure(db_session: AsyncSession, mocker):
     Tests that a notification is marked as FAILED if AWS SES fails to send the email.
     """
     # Mock the SES client to raise an exception
-    mocker.patch("app.services.notification.send_email_ses", side_effect=Exception("Rate limit exceeded"))
+    mocker.patch("app.services.notification.send_email", side_effect=Exception("Rate limit exceeded"))
 
     # Use a valid user ID from conftest.py
     user_id = UUID("123e4567-e89b-12d3-a456-426614174000")
+    mocker.patch("app.services.notification.get_user_details_from_user_management", return_value={
+        "email": "test@example.com", "phone_number": "+251911123456", "preferred_language": "en"
+    })
 
     notification = await send_notification_service(
         db_session,
@@ -61,7 +64,9 @@ async def test_retry_notification_permanent_failure(db_session: AsyncSession, mo
     Tests that a notification permanently fails after 3 retry attempts.
     """
     # Mock the SES client to always fail
-    mocker.patch("app.services.notification.send_email_ses", side_effect=Exception("Permanent SES failure"))
+    mocker.patch("app.services.notification.send_email", side_effect=Exception("Permanent SES failure"))
+    mocker.patch("app.utils.retry.asyncio.sleep") # Skip the in-process retry backoff
+    mock_alert = mocker.patch("app.services.notification.send_admin_alert_email")
 
     # Create a failed notification with 2 attempts already
     user_id = UUID("123e4567-e89b-12d3-a456-426614174000")
@@ -71,183 +76,198 @@ async def test_retry_notification_permanent_failure(db_session: AsyncSession, mo
         event_type="payment_failed",
         status="FAILED",
         attempts=2,
-        context={"amount": 500}
+        context={"amount": 500},
+        next_attempt_at=datetime.utcnow() # Due for retry
     )
     db_session.add(failed_notification)
     await db_session.commit()
     await db_session.refresh(failed_notification)
+    mocker.patch("app.services.notification.get_users_details_bulk", return_value={user_id: {
+        "email": "test@example.com", "phone_number": "+251911123456", "preferred_language": "en"
+    }})
 
     await retry_failed_notifications(db_session)
 
     # Verify the notification is still FAILED and attempts is now 3
-    updated_notification = await db_session.get(Notification, failed_notification.id)
+    updated_notification = await db_session.get(Notification, failed_notification.id, populate_existing=True)
     assert updated_notification.status == "FAILED"
     assert updated_notification.attempts == 3
+    assert updated_notification.next_attempt_at is None # Out of attempts: not scheduled again
+    mock_alert.assert_awaited_once()
 
 @pytest.mark.asyncio
-async def test_idempotency_retry_with_ses_message_id_updates_status(db_session: AsyncSession, mocker):
+async def test_idempotency_retry_with_sent_deliveries_updates_status(db_session: AsyncSession, mocker):
     """
-    Tests that if a notification has an ses_message_id in its context but is marked as FAILED,
-    the retry mechanism updates its status to SENT without re-sending the email.
-    This simulates a scenario where SES sent successfully, but the DB update failed.
+    Tests that if every channel of a FAILED notification already has a SENT delivery,
+    the retry mechanism updates its status to SENT without re-sending anything.
+    This simulates a scenario where the providers accepted the messages, but the status update failed.
     """
     user_id = UUID("123e4567-e89b-12d3-a456-426614174000")
     mock_ses_message_id = "mock-ses-message-id-123"
 
-    # Create a notification that was 'SENT' by SES but marked as 'FAILED' in our DB
+    # Create a notification that was sent on both channels but is marked as 'FAILED' in our DB
     notification_id = uuid4()
+    created_at = datetime.utcnow()
     failed_but_sent_notification = Notification(
         id=notification_id,
         user_id=user_id,
         event_type="payment_success",
         status="FAILED",
         attempts=0,
-        context={"amount": 1000, "ses_message_id": mock_ses_message_id}, # SES ID exists
-        created_at=datetime.utcnow()
+        context={"amount": 1000, "property_title": "Apartment", "location": "Bole"},
+        created_at=created_at,
+        next_attempt_at=created_at # Due for retry
     )
     db_session.add(failed_but_sent_notification)
+    db_session.add_all([
+        NotificationDelivery(notification_id=notification_id, notification_created_at=created_at, channel="email", status="SENT", provider_message_id=mock_ses_message_id),
+        NotificationDelivery(notification_id=notification_id, notification_created_at=created_at, channel="sms", status="SENT", provider_message_id="mock-sms-id"),
+    ])
     await db_session.commit()
-    await db_session.refresh(failed_but_sent_notification)
 
-    # Mock SES and SMS to ensure they are NOT called
-    mock_ses = mocker.patch("app.services.notification.send_email_ses")
-    mock_sms = mocker.patch("app.services.notification.send_sms_mock")
+    # Mock email and SMS to ensure they are NOT called
+    mock_email = mocker.patch("app.services.notification.send_email")
+    mock_sms = mocker.patch("app.services.notification.send_sms")
     
-    # Mock get_user_details_from_user_management to succeed
-    mocker.patch("app.services.notification.get_user_details_from_user_management", return_value={
+    # Mock the bulk user lookup used by the retry job to succeed
+    mocker.patch("app.services.notification.get_users_details_bulk", return_value={user_id: {
         "email": "test@example.com", "phone_number": "+251911123456", "preferred_language": "en"
-    })
+    }})
 
     await retry_failed_notifications(db_session)
 
-    # Verify SES and SMS were NOT called
-    mock_ses.assert_not_called()
+    # Verify email and SMS were NOT called
+    mock_email.assert_not_called()
     mock_sms.assert_not_called()
 
     # Verify notification status is updated to SENT
-    updated_notification = await db_session.get(Notification, notification_id)
+    updated_notification = await db_session.get(Notification, notification_id, populate_existing=True)
     assert updated_notification.status == "SENT"
     assert updated_notification.attempts == 1 # Attempts should still increment
-    assert updated_notification.context.get("ses_message_id") == mock_ses_message_id
     assert updated_notification.sent_at is not None
 
 @pytest.mark.asyncio
 async def test_idempotency_retry_skips_already_sent(db_session: AsyncSession, mocker):
     """
-    Tests that if a notification has an ses_message_id in its context and is already SENT,
-    the retry mechanism skips it entirely.
+    Tests that a notification that is already SENT is never claimed by the retry mechanism.
     """
     user_id = UUID("123e4567-e89b-12d3-a456-426614174000")
     mock_ses_message_id = "mock-ses-message-id-456"
 
-    # Create a notification that is already SENT and has an SES ID
+    # Create a notification that is already SENT on its email channel
     notification_id = uuid4()
+    created_at = datetime.utcnow()
     already_sent_notification = Notification(
         id=notification_id,
         user_id=user_id,
         event_type="listing_approved",
         status="SENT",
         attempts=0,
-        context={"property_title": "Test Property", "ses_message_id": mock_ses_message_id},
-        created_at=datetime.utcnow(),
+        context={"property_title": "Test Property", "location": "Bole"},
+        created_at=created_at,
         sent_at=datetime.utcnow()
     )
     db_session.add(already_sent_notification)
+    db_session.add(NotificationDelivery(notification_id=notification_id, notification_created_at=created_at, channel="email", status="SENT", provider_message_id=mock_ses_message_id))
     await db_session.commit()
-    await db_session.refresh(already_sent_notification)
 
-    # Mock SES and SMS to ensure they are NOT called
-    mock_ses = mocker.patch("app.services.notification.send_email_ses")
-    mock_sms = mocker.patch("app.services.notification.send_sms_mock")
+    # Mock email and SMS to ensure they are NOT called
+    mock_email = mocker.patch("app.services.notification.send_email")
+    mock_sms = mocker.patch("app.services.notification.send_sms")
     
-    # Mock get_user_details_from_user_management to succeed
-    mocker.patch("app.services.notification.get_user_details_from_user_management", return_value={
+    # Mock the bulk user lookup used by the retry job to succeed
+    mocker.patch("app.services.notification.get_users_details_bulk", return_value={user_id: {
         "email": "test@example.com", "phone_number": "+251911123456", "preferred_language": "en"
-    })
+    }})
 
     await retry_failed_notifications(db_session)
 
-    # Verify SES and SMS were NOT called
-    mock_ses.assert_not_called()
+    # Verify email and SMS were NOT called
+    mock_email.assert_not_called()
     mock_sms.assert_not_called()
 
     # Verify notification status and attempts remain unchanged
-    updated_notification = await db_session.get(Notification, notification_id)
+    updated_notification = await db_session.get(Notification, notification_id, populate_existing=True)
     assert updated_notification.status == "SENT"
     assert updated_notification.attempts == 0
-    assert updated_notification.context.get("ses_message_id") == mock_ses_message_id
 
 @pytest.mark.asyncio
 async def test_circuit_breaker_logging(mocker, caplog):
-    from app.services.notification import send_email_ses, ses_circuit_breaker
+    from app.services.notification import send_email, email_circuit_breaker
     from app.utils.retry import CircuitBreakerOpenException
     from botocore.exceptions import ClientError
     from datetime import datetime, timedelta
 
     # Reset circuit breaker state for this test
-    ses_circuit_breaker.failures = 0
-    ses_circuit_breaker.state = "CLOSED"
-    ses_circuit_breaker.last_failure_time = None
+    email_circuit_breaker.failures = 0
+    email_circuit_breaker.state = "CLOSED"
+    email_circuit_breaker.last_failure_time = None
 
-    # Mock SES client to always fail
-    mocker.patch("boto3.client.send_email", side_effect=ClientError({"Error": {"Code": "Throttling"}}, "SendEmail"))
+    # Mock the email provider to always fail with a transient error (throttling and rejections do not trip the breaker)
+    provider = mocker.Mock()
+    provider.name = "ses"
+    provider.send = mocker.AsyncMock(side_effect=ClientError({"Error": {"Code": "ServiceUnavailable"}}, "SendEmail"))
+    mocker.patch("app.services.notification.get_provider", return_value=provider)
+    mocker.patch("app.utils.retry.asyncio.sleep") # Skip the in-process retry backoff
 
     recipient = "test@example.com"
     subject = "Test"
     body = "Body"
 
     with caplog.at_level(logging.WARNING):
-        # Trigger failures to open the circuit
-        for i in range(ses_circuit_breaker.failure_threshold):
-            with pytest.raises(ClientError):
-                await send_email_ses(recipient, subject, body)
+        # Trigger failures to open the circuit; each call makes up to three attempts
+        with pytest.raises(ClientError):
+            await send_email(recipient, subject, body)
+        with pytest.raises(CircuitBreakerOpenException):
+            await send_email(recipient, subject, body)
         
         # Check for OPEN state log
         assert "Circuit Breaker OPEN" in caplog.text
-        assert "event='circuit_breaker_state_change'" in caplog.text
-        assert "state='OPEN'" in caplog.text
-        assert "service='SES'" in caplog.text
+        assert "event_name=circuit_breaker_state_change" in caplog.text
+        assert "state=OPEN" in caplog.text
+        assert "service=SES" in caplog.text
         
         caplog.clear()
 
         # Advance time to trigger HALF_OPEN
-        ses_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=ses_circuit_breaker.reset_timeout + 1)
+        email_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=email_circuit_breaker.reset_timeout + 1)
         
-        # Attempt call, should go HALF_OPEN and fail again
-        with pytest.raises(ClientError):
-            await send_email_ses(recipient, subject, body)
+        # Attempt call, should go HALF_OPEN, fail again and block the in-process retry
+        with caplog.at_level(logging.INFO):
+            with pytest.raises(CircuitBreakerOpenException):
+                await send_email(recipient, subject, body)
         
         # Check for HALF_OPEN and then OPEN state logs
         assert "Circuit Breaker HALF-OPEN" in caplog.text
-        assert "event='circuit_breaker_state_change'" in caplog.text
-        assert "state='HALF_OPEN'" in caplog.text
-        assert "service='SES'" in caplog.text
+        assert "event_name=circuit_breaker_state_change" in caplog.text
+        assert "state=HALF_OPEN" in caplog.text
+        assert "service=SES" in caplog.text
         assert "Circuit Breaker OPEN" in caplog.text # Re-opened
-        assert "state='OPEN'" in caplog.text
+        assert "state=OPEN" in caplog.text
         
         caplog.clear()
 
         # Test blocking call log
         with pytest.raises(CircuitBreakerOpenException):
-            await send_email_ses(recipient, subject, body)
-        assert "Circuit Breaker OPEN, blocking call" in caplog.text
-        assert "event='circuit_breaker_blocked'" in caplog.text
-        assert "service='SES'" in caplog.text
+            await send_email(recipient, subject, body)
+        assert "Circuit Breaker OPEN, blocking" in caplog.text
+        assert "event_name=circuit_breaker_blocked_retry" in caplog.text
+        assert "service=SES" in caplog.text
 
-    # Reset circuit breaker and mock SES to succeed for CLOSE state test
-    ses_circuit_breaker.failures = ses_circuit_breaker.failure_threshold
-    ses_circuit_breaker.state = "OPEN"
-    ses_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=ses_circuit_breaker.reset_timeout + 1)
-    mocker.patch("boto3.client.send_email", return_value={'MessageId': 'mock-success-id'})
+    # Reset circuit breaker and make the provider succeed for the CLOSE state test
+    email_circuit_breaker.failures = email_circuit_breaker.failure_threshold
+    email_circuit_breaker.state = "OPEN"
+    email_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=email_circuit_breaker.reset_timeout + 1)
+    provider.send = mocker.AsyncMock(return_value="mock-success-id")
 
     with caplog.at_level(logging.INFO):
-        await send_email_ses(recipient, subject, body)
+        await send_email(recipient, subject, body)
         # Check for HALF_OPEN and then CLOSED state logs
         assert "Circuit Breaker HALF-OPEN" in caplog.text
-        assert "state='HALF_OPEN'" in caplog.text
+        assert "state=HALF_OPEN" in caplog.text
         assert "Circuit Breaker CLOSED" in caplog.text
-        assert "state='CLOSED'" in caplog.text
-        assert "service='SES'" in caplog.text
+        assert "state=CLOSED" in caplog.text
+        assert "service=SES" in caplog.text
 
 @pytest.mark.asyncio
 async def test_rate_limit_exceeded_scenario(mocker, client, caplog):
@@ -255,14 +275,21 @@ async def test_rate_limit_exceeded_scenario(mocker, client, caplog):
     Tests that the rate limiting mechanism correctly triggers a 429 Too Many Requests
     response and logs the event.
     """
-    # Mock the rate limiter to allow only 1 request per minute for this test
-    mocker.patch("fastapi_limiter.depends.RateLimiter.__call__", return_value=RateLimiter(times=1, seconds=60))
+    from fastapi_limiter import FastAPILimiter
+    from redis.asyncio import Redis
+    from app.config import settings
+    from app.dependencies.auth import get_admin_or_internal_user
+    from app.routers import notifications as notifications_router
+
+    # The app lifespan does not run under the test client: initialise the limiter with a fresh key prefix
+    await FastAPILimiter.init(Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT), prefix=f"demo-{uuid4()}")
+
+    # Allow only 1 request per minute on the send endpoint for this test
+    send_route = next(route for route in notifications_router.router.routes if getattr(route, "path", None) == "/api/v1/notifications/send")
+    mocker.patch.object(send_route.dependencies[0].dependency, "times", 1)
     
     # Mock authentication to allow access
-    mocker.patch("app.dependencies.auth.get_admin_or_internal_user", return_value={"role": "Admin"})
-    
-    # Mock send_notification_service to prevent actual sending
-    mocker.patch("app.services.notification.send_notification_service", return_value=mocker.AsyncMock(id=uuid4()))
+    app.dependency_overrides[get_admin_or_internal_user] = lambda: {"role": "Admin"}
 
     notification_data = {
         "user_id": str(UUID("123e4567-e89b-12d3-a456-426614174000")),
@@ -280,4 +307,4 @@ async def test_rate_limit_exceeded_scenario(mocker, client, caplog):
         assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
         assert "Too Many Requests" in response.json()["detail"]
         assert "Rate limit exceeded" in caplog.text
-        assert "event='rate_limit_exceeded'" in caplog.text
\ No newline at end of file
+        assert "event_name=rate_limit_exceeded" in caplog.text
\ No newline at end of file
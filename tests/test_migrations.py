@@ -0,0 +1,108 @@
+"""
+Migration tests: sql/migrations applied to a throwaway schema, both from scratch and over existing rows
+(the data-moving steps). Needs the test database.
+"""
+import json
+import uuid
+import asyncpg
+import pytest
+import pytest_asyncio
+from app.config import settings
+from app.migrate import _asyncpg_dsn, apply_migrations, discover_migrations
+
+TEST_DATABASE_URL = settings.DATABASE_URL.replace("public", "test_notifications")
+
+
+@pytest_asyncio.fixture
+async def migration_conn():
+    try:
+        conn = await asyncpg.connect(_asyncpg_dsn(TEST_DATABASE_URL), timeout=5)
+    except (OSError, asyncpg.PostgresError) as e:
+        pytest.skip(f"Test database not available: {e}")
+    schema = f"migrations_{uuid.uuid4().hex[:8]}"
+    await conn.execute(f"CREATE SCHEMA {schema}")
+    await conn.execute(f"SET search_path TO {schema}")
+    try:
+        yield conn
+    finally:
+        await conn.execute(f"DROP SCHEMA {schema} CASCADE")
+        await conn.close()
+
+
+async def _insert_notification(conn, status, context, attempts=0, sent=False):
+    notification_id = uuid.uuid4()
+    await conn.execute(
+        """
+        INSERT INTO notifications (id, user_id, event_type, status, attempts, context, sent_at, created_at, updated_at)
+        VALUES ($1, $2, 'payment_success', $3, $4, $5::jsonb, CASE WHEN $6 THEN now() END, now(), now())
+        """,
+        notification_id, uuid.uuid4(), status, attempts, json.dumps(context), sent,
+    )
+    return notification_id
+
+
+@pytest.mark.asyncio
+async def test_migrations_apply_to_an_empty_database(migration_conn):
+    migrations = discover_migrations()
+    assert await apply_migrations(migration_conn) == [migration.version for migration in migrations]
+    assert await apply_migrations(migration_conn) == [] # Idempotent
+
+    notification_id = await _insert_notification(migration_conn, "FAILED", {})
+    await migration_conn.execute(
+        "INSERT INTO notification_deliveries (notification_id, notification_created_at, channel, status) VALUES ($1, now(), 'email', 'REJECTED')",
+        notification_id,
+    )
+    counters = await migration_conn.fetch("SELECT channel, status, count FROM notification_channel_counters")
+    assert [tuple(row) for row in counters] == [("email", "REJECTED", 1)]
+    assert await migration_conn.fetchval("SELECT count FROM notification_status_counters WHERE status = 'FAILED'") == 1
+
+
+@pytest.mark.asyncio
+async def test_migrations_backfill_deliveries_from_existing_rows(migration_conn):
+    migrations = discover_migrations()
+    await apply_migrations(migration_conn, [migration for migration in migrations if migration.version < "0005"])
+
+    # What the released builds wrote: an SES MessageId in context once every channel had gone out
+    sent = await _insert_notification(migration_conn, "SENT", {"ses_message_id": "ses-sent"}, attempts=1, sent=True)
+    status_lost = await _insert_notification(migration_conn, "FAILED", {"ses_message_id": "ses-lost"}, attempts=1)
+    failed = await _insert_notification(migration_conn, "FAILED", {"amount": 1}, attempts=1)
+    pending = await _insert_notification(migration_conn, "PENDING", {"amount": 1})
+    await migration_conn.execute("UPDATE notifications SET next_attempt_at = now() WHERE status = 'FAILED'")
+
+    await apply_migrations(migration_conn)
+
+    deliveries = await migration_conn.fetch("SELECT notification_id, channel, status, provider_message_id FROM notification_deliveries")
+    assert sorted((row["notification_id"], row["channel"], row["status"], row["provider_message_id"]) for row in deliveries) == sorted([
+        (sent, "email", "SENT", "ses-sent"),
+        (status_lost, "email", "SENT", "ses-lost"),
+    ])
+    rows = {row["id"]: row for row in await migration_conn.fetch("SELECT id, status, sent_at, next_attempt_at FROM notifications")}
+    assert rows[status_lost]["status"] == "SENT" and rows[status_lost]["sent_at"] is not None and rows[status_lost]["next_attempt_at"] is None
+    assert rows[failed]["status"] == "FAILED" and rows[failed]["next_attempt_at"] is not None # Still retried
+    assert rows[pending]["status"] == "PENDING"
+
+    # The trigger-maintained counters agree with a recount after the backfill
+    status_counts = await migration_conn.fetch("SELECT status, SUM(count) AS count FROM notification_status_counters GROUP BY status")
+    assert {row["status"]: row["count"] for row in status_counts if row["count"]} == {"SENT": 2, "FAILED": 1, "PENDING": 1}
+    channel_counts = await migration_conn.fetch("SELECT channel, status, count FROM notification_channel_counters WHERE count > 0")
+    assert [tuple(row) for row in channel_counts] == [("email", "SENT", 2)]
+
+
+@pytest.mark.asyncio
+async def test_new_partition_takes_its_rows_from_the_default_partition(migration_conn):
+    await apply_migrations(migration_conn)
+    notification_id = uuid.uuid4()
+    await migration_conn.execute(
+        """
+        INSERT INTO notifications (id, user_id, event_type, status, context, created_at, updated_at)
+        VALUES ($1, $2, 'payment_success', 'PENDING', '{}'::jsonb, '2099-05-15', now())
+        """,
+        notification_id, uuid.uuid4(),
+    )
+    assert await migration_conn.fetchval("SELECT tableoid::regclass::text FROM notifications WHERE id = $1", notification_id) == "notifications_default"
+
+    assert await migration_conn.fetchval("SELECT create_notification_partition('2099-05-01')") == "notifications_2099_05"
+    assert await migration_conn.fetchval("SELECT tableoid::regclass::text FROM notifications WHERE id = $1", notification_id) == "notifications_2099_05"
+    assert await migration_conn.fetchval("SELECT count(*) FROM notifications_default") == 0
+    assert await migration_conn.fetchval("SELECT count FROM notification_status_counters WHERE status = 'PENDING'") == 1
+    assert await migration_conn.fetchval("SELECT create_notification_partition('2099-05-01')") == "notifications_2099_05" # Idempotent
@@ -1,3 +1,12 @@
+import pytest
+import json
+import logging
+import asyncio
+import time
+from uuid import UUID, uuid4
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+
 @pytest.mark.asyncio
 async def test_get_user_details_from_user_management_and_cache(mocker):
     user_id = UUID("123e4567-e89b-12d3-a456-426614174000")
@@ -9,12 +18,14 @@ async def test_get_user_details_from_user_management_and_cache(mocker):
     mock_httpx_response.json.return_value = mock_user_data
     mocker.patch("httpx.AsyncClient.get", return_value=mock_httpx_response)
 
-    # Mock redis client
-    mock_redis_get = mocker.patch("redis.asyncio.Redis.get", return_value=None)
-    mock_redis_setex = mocker.patch("redis.asyncio.Redis.setex")
+    # Mock the module's redis client
+    mock_redis = mocker.patch("app.services.notification.redis_client")
+    mock_redis_get = mock_redis.get = mocker.AsyncMock(return_value=None)
+    mock_redis_setex = mock_redis.setex = mocker.AsyncMock()
 
     # First call: should fetch from user management and cache
-    from app.services.notification import get_user_details_from_user_management
+    from app.services.notification import get_user_details_from_user_management, user_details_cache
+    user_details_cache.clear()
     user = await get_user_details_from_user_management(user_id)
 
     assert user == mock_user_data
@@ -22,7 +33,9 @@ async def test_get_user_details_from_user_management_and_cache(mocker):
     mock_redis_get.assert_called_once_with(f"user_details:{user_id}")
     mock_redis_setex.assert_called_once()
 
-    # Reset mocks for second call
+    # Reset mocks and the in-process tier for second call
+    from app.services.notification import user_details_cache
+    user_details_cache.clear()
     mock_httpx_response.json.reset_mock()
     mock_redis_get.reset_mock()
     mock_redis_setex.reset_mock()
@@ -36,52 +49,63 @@ async def test_get_user_details_from_user_management_and_cache(mocker):
     mock_redis_get.assert_called_once_with(f"user_details:{user_id}")
     mock_redis_setex.assert_not_called()
 
+def _mock_email_provider(mocker, **send):
+    provider = mocker.Mock()
+    provider.name = "ses"
+    provider.send = mocker.AsyncMock(**send)
+    mocker.patch("app.services.notification.get_provider", return_value=provider)
+    mocker.patch("app.utils.retry.asyncio.sleep") # Skip the in-process retry backoff
+    return provider
+
 @pytest.mark.asyncio
 async def test_circuit_breaker_open_and_block(mocker, caplog):
-    from app.services.notification import send_email_ses, ses_circuit_breaker
+    from app.services.notification import send_email, email_circuit_breaker
     from app.utils.retry import CircuitBreakerOpenException
     from botocore.exceptions import ClientError
 
     # Reset circuit breaker state for this test
-    ses_circuit_breaker.failures = 0
-    ses_circuit_breaker.state = "CLOSED"
-    ses_circuit_breaker.last_failure_time = None
+    email_circuit_breaker.failures = 0
+    email_circuit_breaker.state = "CLOSED"
+    email_circuit_breaker.last_failure_time = None
 
-    # Mock SES client to always fail
-    mocker.patch("boto3.client.send_email", side_effect=ClientError({"Error": {"Code": "Throttling"}}, "SendEmail"))
+    # Provider always fails with a transient error (throttling and rejections do not count against the breaker)
+    provider = _mock_email_provider(mocker, side_effect=ClientError({"Error": {"Code": "ServiceUnavailable"}}, "SendEmail"))
 
     recipient = "test@example.com"
     subject = "Test"
     body = "Body"
 
     with caplog.at_level(logging.WARNING):
-        for i in range(ses_circuit_breaker.failure_threshold):
-            with pytest.raises(ClientError):
-                await send_email_ses(recipient, subject, body)
-        assert ses_circuit_breaker.state == "OPEN"
+        # Each call makes up to three attempts; the fifth failure opens the circuit and blocks the next in-process retry
+        with pytest.raises(ClientError):
+            await send_email(recipient, subject, body)
+        assert email_circuit_breaker.state == "CLOSED" and email_circuit_breaker.failures == 3
+        with pytest.raises(CircuitBreakerOpenException):
+            await send_email(recipient, subject, body)
+        assert email_circuit_breaker.state == "OPEN"
+        assert provider.send.await_count == email_circuit_breaker.failure_threshold
         assert "Circuit Breaker OPEN" in caplog.text
 
     caplog.clear()
 
-    # Next call should be blocked by the open circuit
+    # Next call should be blocked by the open circuit without reaching the provider
     with caplog.at_level(logging.WARNING):
         with pytest.raises(CircuitBreakerOpenException):
-            await send_email_ses(recipient, subject, body)
-        assert "Circuit Breaker OPEN, blocking call" in caplog.text
+            await send_email(recipient, subject, body)
+        assert "Circuit Breaker OPEN, blocking" in caplog.text
+    assert provider.send.await_count == email_circuit_breaker.failure_threshold
 
 @pytest.mark.asyncio
 async def test_circuit_breaker_half_open_and_close(mocker, caplog):
-    from app.services.notification import send_email_ses, ses_circuit_breaker
-    from app.utils.retry import CircuitBreakerOpenException
-    from botocore.exceptions import ClientError
+    from app.services.notification import send_email, email_circuit_breaker
 
     # Set circuit breaker to OPEN state, but past reset_timeout
-    ses_circuit_breaker.failures = ses_circuit_breaker.failure_threshold
-    ses_circuit_breaker.state = "OPEN"
-    ses_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=ses_circuit_breaker.reset_timeout + 1)
+    email_circuit_breaker.failures = email_circuit_breaker.failure_threshold
+    email_circuit_breaker.state = "OPEN"
+    email_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=email_circuit_breaker.reset_timeout + 1)
 
-    # Mock SES client to succeed for the half-open trial
-    mock_ses_send_email_success = mocker.patch("boto3.client.send_email", return_value={'MessageId': 'mock-success-id'})
+    # Provider succeeds for the half-open trial
+    provider = _mock_email_provider(mocker, return_value="mock-success-id")
 
     recipient = "test@example.com"
     subject = "Test"
@@ -89,59 +113,60 @@ async def test_circuit_breaker_half_open_and_close(mocker, caplog):
 
     with caplog.at_level(logging.INFO):
         # First call should transition to HALF-OPEN and succeed
-        message_id = await send_email_ses(recipient, subject, body)
+        message_id = await send_email(recipient, subject, body)
         assert message_id == 'mock-success-id'
-        assert ses_circuit_breaker.state == "CLOSED"
+        assert email_circuit_breaker.state == "CLOSED"
         assert "Circuit Breaker HALF-OPEN" in caplog.text
         assert "Circuit Breaker CLOSED" in caplog.text
-        mock_ses_send_email_success.assert_called_once()
+        provider.send.assert_awaited_once()
 
     caplog.clear()
-    mock_ses_send_email_success.reset_mock()
+    provider.send.reset_mock()
 
     # Subsequent calls should now succeed with circuit closed
-    message_id = await send_email_ses(recipient, subject, body)
+    message_id = await send_email(recipient, subject, body)
     assert message_id == 'mock-success-id'
-    assert ses_circuit_breaker.state == "CLOSED"
-    mock_ses_send_email_success.assert_called_once()
+    assert email_circuit_breaker.state == "CLOSED"
+    provider.send.assert_awaited_once()
 
 @pytest.mark.asyncio
 async def test_circuit_breaker_half_open_and_reopen(mocker, caplog):
-    from app.services.notification import send_email_ses, ses_circuit_breaker
+    from app.services.notification import send_email, email_circuit_breaker
     from app.utils.retry import CircuitBreakerOpenException
     from botocore.exceptions import ClientError
 
     # Set circuit breaker to OPEN state, but past reset_timeout
-    ses_circuit_breaker.failures = ses_circuit_breaker.failure_threshold
-    ses_circuit_breaker.state = "OPEN"
-    ses_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=ses_circuit_breaker.reset_timeout + 1)
+    email_circuit_breaker.failures = email_circuit_breaker.failure_threshold
+    email_circuit_breaker.state = "OPEN"
+    email_circuit_breaker.last_failure_time = datetime.utcnow() - timedelta(seconds=email_circuit_breaker.reset_timeout + 1)
 
-    # Mock SES client to fail again for the half-open trial
-    mocker.patch("boto3.client.send_email", side_effect=ClientError({"Error": {"Code": "Throttling"}}, "SendEmail"))
+    # Provider fails again for the half-open trial
+    provider = _mock_email_provider(mocker, side_effect=ClientError({"Error": {"Code": "ServiceUnavailable"}}, "SendEmail"))
 
     recipient = "test@example.com"
     subject = "Test"
     body = "Body"
 
     with caplog.at_level(logging.WARNING):
-        # First call should transition to HALF-OPEN and then immediately reopen due to failure
-        with pytest.raises(ClientError):
-            await send_email_ses(recipient, subject, body)
-        assert ses_circuit_breaker.state == "OPEN"
-        assert "Circuit Breaker HALF-OPEN" in caplog.text
+        # The half-open trial fails and reopens the circuit, which then blocks the in-process retry
+        with pytest.raises(CircuitBreakerOpenException):
+            await send_email(recipient, subject, body)
+        assert email_circuit_breaker.state == "OPEN"
         assert "Circuit Breaker OPEN" in caplog.text # Re-opened
+        provider.send.assert_awaited_once()
 
     caplog.clear()
 
     # Next call should be blocked by the re-opened circuit
     with caplog.at_level(logging.WARNING):
         with pytest.raises(CircuitBreakerOpenException):
-            await send_email_ses(recipient, subject, body)
-        assert "Circuit Breaker OPEN, blocking call" in caplog.text
+            await send_email(recipient, subject, body)
+        assert "Circuit Breaker OPEN, blocking" in caplog.text
+    provider.send.assert_awaited_once()
 
 @pytest.mark.asyncio
 async def test_template_version_logged_on_send(mocker, caplog, mock_db_session):
-    from app.services.notification import send_notification_service, NOTIFICATION_TEMPLATES
+    from app.services.notification import send_notification_service, template_registry
     from app.schemas.notification import NotificationCreate
     from uuid import UUID
     import logging
@@ -150,11 +175,11 @@ async def test_template_version_logged_on_send(mocker, caplog, mock_db_session):
     mocker.patch("app.services.notification.get_user_details_from_user_management", return_value={
         "email": "test@example.com", "phone_number": "+251911123456", "preferred_language": "en"
     })
-    mocker.patch("app.services.notification.send_email_ses", return_value="mock-ses-id")
-    mocker.patch("app.services.notification.send_sms_mock", return_value=True)
+    mocker.patch("app.services.notification.send_email", return_value="mock-ses-id")
+    mocker.patch("app.services.notification.send_sms", return_value=True)
 
     # Ensure template version is set for the test
-    NOTIFICATION_TEMPLATES["version"] = "1.0"
+    assert template_registry.current.version == "1.0"
 
     notification_data = NotificationCreate(
         user_id=UUID("123e4567-e89b-12d3-a456-426614174000"),
@@ -174,44 +199,39 @@ async def test_retry_failure_alerts_admin(mocker, caplog, mock_db_session):
     from datetime import datetime
     import logging
 
-    # Mock SES client to always fail for resend attempts
-    mocker.patch("app.services.notification.send_email_ses", side_effect=ClientError({"Error": {"Code": "Throttling"}}, "SendEmail"))
-    mocker.patch("app.services.notification.send_sms_mock", return_value=False) # SMS also fails
-    
+    # Email always fails for resend attempts
+    mocker.patch("app.services.notification.send_email", side_effect=ClientError({"Error": {"Code": "Throttling"}}, "SendEmail"))
+    mocker.patch("app.services.notification.send_sms", return_value="sms-id")
+    mocker.patch("app.services.notification.record_delivery_outcomes")
+
     # Mock the admin alert email function
     mock_send_admin_alert_email = mocker.patch("app.services.notification.send_admin_alert_email", return_value="mock-admin-ses-id")
 
-    # Create a failed notification that has reached its retry limit (attempts = 2, so next will be 3)
+    # A failed notification on its last attempt (claiming it counted the third)
     failed_notification = Notification(
         id=UUID("a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a99"),
         user_id=UUID("123e4567-e89b-12d3-a456-426614174000"),
         event_type="payment_failed",
         status="FAILED",
-        attempts=2,
+        attempts=3,
         context={"property_title": "Failed Property", "location": "Addis Ababa", "amount": 500},
+        template_version="1.0",
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
-    mock_db_session.add(failed_notification)
-    await mock_db_session.commit()
-    await mock_db_session.refresh(failed_notification)
-
-    # Mock the select query to return our failed notification
-    mocker.patch("sqlalchemy.ext.asyncio.AsyncSession.execute", return_value=mocker.AsyncMock(
-        scalars=mocker.Mock(all=mocker.Mock(return_value=[failed_notification]))
-    ))
-    
-    # Mock get_user_details_from_user_management to succeed
-    mocker.patch("app.services.notification.get_user_details_from_user_management", return_value={
+    mocker.patch("app.services.notification.claim_retryable_notifications", return_value=[failed_notification])
+
+    # Mock the bulk user lookup to succeed
+    mocker.patch("app.services.notification.get_users_details_bulk", return_value={failed_notification.user_id: {
         "email": "test@example.com", "phone_number": "+251911123456", "preferred_language": "en"
-    })
+    }})
 
     with caplog.at_level(logging.CRITICAL):
         await retry_failed_notifications(mock_db_session)
         
         # Assert critical log is present
-        assert "Notification permanently failed after 3 retries" in caplog.text
-        assert f"notification_id={failed_notification.id}" in caplog.text
+        assert "Notification permanently failed after retries" in caplog.text
+        assert str(failed_notification.id) in caplog.text
         
         # Assert admin alert email was sent
         mock_send_admin_alert_email.assert_called_once_with(
@@ -219,22 +239,1050 @@ async def test_retry_failure_alerts_admin(mocker, caplog, mock_db_session):
             body=mocker.ANY # Check content more specifically if needed
         )
     
-    # Verify notification status is still FAILED after max attempts
-    await mock_db_session.refresh(failed_notification)
-    assert failed_notification.status == "FAILED"
-    assert failed_notification.attempts == 3
+    # The notification stays FAILED and is not scheduled again
+    update_call = next(call for call in mock_db_session.execute.call_args_list if "UPDATE notifications" in str(call.args[0]))
+    [outcome] = update_call.args[1]
+    assert outcome["b_id"] == failed_notification.id
+    assert outcome["status"] == "FAILED" and outcome["next_attempt_at"] is None
 
 @pytest.mark.asyncio
-async def test_mock_sms_logging(mocker, caplog):
-    from app.services.notification import send_sms_mock
-    import logging
+async def test_fake_provider_samples_latency_and_errors_and_keeps_outbox(mocker):
+    import random
+    from app.config import settings
+    from app.providers.fake import FakeProvider, FakeProviderError
 
-    phone_number = "+251911123456"
-    message = "Test SMS message"
+    mocker.patch("app.providers.fake.asyncio.sleep")
+    mocker.patch.dict(settings.FAKE_PROVIDER_OVERRIDES, {"sms": {"latency_ms": 50, "latency_sigma": 0.8, "error_rate": 0.2}})
+    provider = FakeProvider("sms", rng=random.Random(42))
 
-    with caplog.at_level(logging.INFO):
-        result = await send_sms_mock(phone_number, message)
-        assert result["status"] == "success"
-        assert "mock_sms_sent" in caplog.text
-        assert f"phone_number={phone_number}" in caplog.text
-        assert f"message={message}" in caplog.text
\ No newline at end of file
+    latencies = sorted(provider.sample_latency() for _ in range(2000))
+    assert 0.045 <= latencies[1000] <= 0.055 # Median is latency_ms
+    assert latencies[1980] > 3 * latencies[1000] # Long tail
+
+    outcomes = []
+    for i in range(500):
+        try:
+            outcomes.append(await provider.send(f"+2519000000{i:02d}", "", "Test SMS message"))
+        except FakeProviderError:
+            outcomes.append(None)
+    failures = outcomes.count(None)
+    assert 60 <= failures <= 140
+    assert provider.stats == {"sent": 500 - failures, "failed": failures}
+    assert [message["message_id"] for message in provider.outbox] == [message_id for message_id in outcomes if message_id]
+    assert provider.outbox[0]["body"] == "Test SMS message"
+
+@pytest.mark.asyncio
+async def test_outbox_worker_pool_delivers_claimed_notifications(mocker):
+    from app.services.outbox import OutboxWorkerPool
+    from app.models.notification import Notification
+
+    pending_notification = Notification(
+        id=uuid4(),
+        user_id=UUID("123e4567-e89b-12d3-a456-426614174000"),
+        event_type="payment_success",
+        status="PENDING",
+        attempts=0,
+        context={"property_title": "Outbox Property", "location": "Addis Ababa", "amount": 1000}
+    )
+
+    mock_session = mocker.AsyncMock()
+    mock_session.__aenter__.return_value = mock_session
+    mocker.patch("app.services.outbox.AsyncSessionLocal", return_value=mock_session)
+    pending_notification.locked_until = lease_until = datetime.utcnow() + timedelta(seconds=60)
+    mock_claim = mocker.patch("app.services.outbox.claim_pending_notifications", side_effect=[[(pending_notification.id, pending_notification.user_id, lease_until)]] + [[]] * 1000)
+    mock_prefetch = mocker.patch("app.services.outbox.get_users_details_bulk", return_value={})
+    mocker.patch("app.services.outbox.get_notification_by_id", return_value=pending_notification)
+    delivered = asyncio.Event()
+    mock_deliver = mocker.patch("app.services.outbox.deliver_notification", side_effect=lambda db, n, lease: delivered.set())
+
+    pool = OutboxWorkerPool(workers=2, batch_size=10, poll_interval=0.01, lease_seconds=60)
+    await pool.start()
+    try:
+        await asyncio.wait_for(delivered.wait(), timeout=1)
+    finally:
+        await pool.stop()
+
+    mock_claim.assert_any_call(mock_session, 10, 60)
+    mock_deliver.assert_called_once_with(mock_session, pending_notification, lease_until)
+    mock_prefetch.assert_called_once_with({pending_notification.user_id})
+    assert not pool.running
+
+@pytest.mark.asyncio
+async def test_ses_transport_reuses_client_off_event_loop(mocker):
+    from app.services.email_transport import SESTransport
+    import threading
+
+    calling_threads = []
+    mock_ses_client = mocker.Mock()
+    mock_ses_client.send_email.side_effect = lambda **kwargs: calling_threads.append(threading.current_thread().name) or {'MessageId': 'mock-message-id'}
+    mock_boto_client = mocker.patch("boto3.client", return_value=mock_ses_client)
+
+    transport = SESTransport(max_concurrency=4)
+    try:
+        responses = await asyncio.gather(*[
+            transport.send_email(Source="no-reply@rental-system.com", Destination={'ToAddresses': ["test@example.com"]}, Message={})
+            for _ in range(8)
+        ])
+    finally:
+        await transport.close()
+
+    assert all(r['MessageId'] == 'mock-message-id' for r in responses)
+    mock_boto_client.assert_called_once()
+    assert mock_ses_client.send_email.call_count == 8
+    assert all(name.startswith("ses") for name in calling_threads)
+
+@pytest.mark.asyncio
+async def test_send_batch_returns_per_item_results_and_charges_item_count(mocker):
+    import httpx
+    from app.main import app
+    from app.database import get_db
+    from app.dependencies.auth import get_admin_or_internal_user
+    from app.models.notification import Notification
+    from app.routers import notifications as notifications_router
+
+    async def fake_bulk_insert(db, rows):
+        return [Notification(status="PENDING", **row) for row in rows]
+
+    mock_bulk_insert = mocker.patch("app.routers.notifications.enqueue_notifications_bulk", side_effect=fake_bulk_insert)
+    mock_rate_limit = mocker.patch("app.routers.notifications.batch_rate_limiter", new=mocker.AsyncMock())
+    mock_notify = mocker.patch.object(notifications_router.outbox_worker_pool, "notify")
+
+    app.dependency_overrides[get_admin_or_internal_user] = lambda: {"role": "Internal"}
+    app.dependency_overrides[get_db] = lambda: mocker.AsyncMock()
+    user_id = "123e4567-e89b-12d3-a456-426614174000"
+    payload = {"items": [
+        {"user_id": user_id, "event_type": "payment_success", "context": {"property_title": "A", "location": "Bole", "amount": 100}},
+        {"user_id": user_id, "event_type": "unknown_event", "context": {}},
+        {"user_id": user_id, "event_type": "listing_approved", "context": {"property_title": "B", "location": "Piassa"}},
+    ]}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.post("/api/v1/notifications/send-batch", json=payload)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 1
+    assert [r["index"] for r in body["results"]] == [0, 1, 2]
+    assert [r["status"] for r in body["results"]] == ["PENDING", "REJECTED", "PENDING"]
+    assert body["results"][0]["id"] is not None
+    assert "unknown_event" in body["results"][1]["error"]
+    mock_bulk_insert.assert_called_once()
+    assert len(mock_bulk_insert.call_args.args[1]) == 2
+    assert mock_rate_limit.call_args.kwargs["cost"] == 3
+    mock_notify.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_shared_http_client_is_reused_and_reports_pool_stats():
+    from unittest.mock import patch
+    from app.core.http_client import get_http_client, close_http_client, http_pool_stats
+    from app.core.metrics import collect_metrics
+    from app.config import settings
+
+    client = get_http_client()
+    try:
+        assert get_http_client() is client
+        assert client.timeout.connect == settings.HTTP_CONNECT_TIMEOUT_SECONDS
+        assert client.timeout.read == settings.HTTP_READ_TIMEOUT_SECONDS
+        stats = http_pool_stats()
+        assert stats["open"] is True
+        assert stats["connections"] == 0
+        assert stats["max_connections"] == settings.HTTP_MAX_CONNECTIONS
+        assert collect_metrics()["http_pool"] == stats
+        with patch.object(client._transport, "_pool", object()): # httpcore internals moved: still report what is public
+            assert http_pool_stats() == {"open": True, "max_connections": settings.HTTP_MAX_CONNECTIONS, "pool_stats_unavailable": True}
+    finally:
+        await close_http_client()
+    assert http_pool_stats() == {"open": False}
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_requires_an_admin_or_internal_user():
+    import httpx
+    from app.main import app
+    from app.dependencies.auth import get_admin_or_internal_user
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as ac:
+        assert (await ac.get("/metrics")).status_code == 401
+        app.dependency_overrides[get_admin_or_internal_user] = lambda: {"role": "Internal"}
+        try:
+            response = await ac.get("/metrics")
+        finally:
+            app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert "retry_decisions" in response.json()
+
+def test_ttl_cache_evicts_least_recently_used_and_expired_entries(mocker):
+    from app.utils.cache import TTLCache
+
+    clock = mocker.patch("app.utils.cache.time.monotonic", return_value=1000.0)
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1 # "a" is now most recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    cache.set("short", 4, ttl=1)
+    clock.return_value = 1002.0
+    assert cache.get("short") is None
+    clock.return_value = 1011.0
+    assert cache.get("a") is None
+
+@pytest.mark.asyncio
+async def test_get_current_user_verifies_token_once_and_honours_revocation(mocker):
+    import time
+    from jose import jwt
+    from app.config import settings
+    from app.core.auth_cache import verified_token_cache
+    from app.dependencies.auth import get_current_user
+
+    verified_token_cache.local.clear()
+    token = jwt.encode({"sub": "123e4567-e89b-12d3-a456-426614174000", "exp": int(time.time()) + 300}, settings.JWT_SECRET, algorithm=settings.ALGORITHM)
+    mock_response = mocker.Mock()
+    mock_response.json.return_value = {"user_id": "123e4567-e89b-12d3-a456-426614174000", "role": "Admin"}
+    mock_post = mocker.patch("httpx.AsyncClient.post", return_value=mock_response)
+
+    assert (await get_current_user(token))["role"] == "Admin"
+    assert (await get_current_user(token))["role"] == "Admin"
+    mock_post.assert_called_once()
+
+    await verified_token_cache.revoke(verified_token_cache.token_hash(token))
+    await get_current_user(token)
+    assert mock_post.call_count == 2
+
+@pytest.mark.asyncio
+async def test_user_details_concurrent_misses_coalesce_and_404_is_negatively_cached(mocker):
+    import httpx
+    from app.config import settings
+    from app.services.notification import get_user_details_from_user_management, user_details_cache
+
+    user_details_cache.clear()
+    mock_redis = mocker.AsyncMock()
+    mock_redis.get.return_value = None
+    mocker.patch("app.services.notification.redis_client", new=mock_redis)
+
+    user_id = uuid4()
+    async def slow_get(url, **kwargs):
+        await asyncio.sleep(0.01)
+        response = mocker.Mock()
+        response.json.return_value = {"email": "hot@example.com", "preferred_language": "en"}
+        return response
+    mock_get = mocker.patch("httpx.AsyncClient.get", side_effect=slow_get)
+
+    users = await asyncio.gather(*[get_user_details_from_user_management(user_id) for _ in range(5)])
+    assert all(user == {"email": "hot@example.com", "preferred_language": "en"} for user in users)
+    assert mock_get.call_count == 1
+    assert mock_redis.get.call_count == 1
+    await get_user_details_from_user_management(user_id) # In-process hit
+    assert mock_redis.get.call_count == 1
+
+    deleted_user_id = uuid4()
+    not_found = httpx.Response(404, request=httpx.Request("GET", f"http://um/api/v1/users/{deleted_user_id}"))
+    mock_get.side_effect = None
+    mock_get.return_value = not_found
+    assert await get_user_details_from_user_management(deleted_user_id) is None
+    assert await get_user_details_from_user_management(deleted_user_id) is None
+    assert mock_get.call_count == 2
+    mock_redis.setex.assert_called_with(f"user_details:{deleted_user_id}", timedelta(seconds=settings.USER_NEGATIVE_CACHE_TTL_SECONDS), "null")
+
+@pytest.mark.asyncio
+async def test_get_users_details_bulk_uses_one_mget_and_pipelined_setex(mocker):
+    from app.services.notification import get_users_details_bulk, user_details_cache
+
+    user_details_cache.clear()
+    local_user, redis_user, upstream_user, missing_user = uuid4(), uuid4(), uuid4(), uuid4()
+    user_details_cache.set(local_user, {"email": "local@example.com"})
+
+    mock_pipe = mocker.MagicMock()
+    mock_pipe.__aenter__.return_value = mock_pipe
+    mock_pipe.execute = mocker.AsyncMock()
+    mock_redis = mocker.Mock()
+    mock_redis.mget = mocker.AsyncMock(side_effect=lambda keys: [json.dumps({"email": "redis@example.com"}) if str(redis_user) in key else None for key in keys])
+    mock_redis.pipeline.return_value = mock_pipe
+    mocker.patch("app.services.notification.redis_client", new=mock_redis)
+    mock_fetch = mocker.patch("app.services.notification._fetch_user_details", side_effect=lambda user_id: ({"email": "upstream@example.com"}, True) if user_id == upstream_user else (None, True))
+
+    users = await get_users_details_bulk([local_user, redis_user, upstream_user, missing_user, local_user])
+
+    assert users == {
+        local_user: {"email": "local@example.com"},
+        redis_user: {"email": "redis@example.com"},
+        upstream_user: {"email": "upstream@example.com"},
+        missing_user: None,
+    }
+    mock_redis.mget.assert_called_once()
+    assert len(mock_redis.mget.call_args.args[0]) == 3
+    assert mock_fetch.call_count == 2
+    assert mock_pipe.setex.call_count == 2
+    mock_pipe.execute.assert_awaited_once()
+    assert user_details_cache.get(redis_user) == {"email": "redis@example.com"}
+
+def test_template_index_compiles_per_language_and_rejects_bad_requests():
+    from app.services.notification import template_registry, validate_notification_request
+    from app.services.templates import TemplateIndex, TemplateNotFoundError, MissingTemplateContextError
+
+    notification_template_index = template_registry.current
+    context = {"property_title": "Modern Apartment", "location": "Bole", "amount": 1500}
+    rendered = notification_template_index.render("payment_success", "am", context)
+    assert rendered["subject"] == "ክፍያ ተሳክቷል!"
+    assert "1500" in rendered["body"] and "Modern Apartment" in rendered["body"]
+    # Unknown languages fall back to English
+    assert notification_template_index.render("payment_success", "fr", context)["body"] == "Payment of 1500 ETB succeeded for Modern Apartment in Bole"
+    assert notification_template_index.placeholders("payment_success") == {"amount", "property_title", "location"}
+
+    with pytest.raises(TemplateNotFoundError):
+        validate_notification_request("tenant_update", {"property_title": "Family Home"})
+    with pytest.raises(MissingTemplateContextError, match="amount"):
+        validate_notification_request("payment_failed", {"property_title": "Studio Flat", "location": "Mexico"})
+
+    index = TemplateIndex({"version": "2", "reminder": {"en": "Due {amount:,} on {due.date} {{literal}}", "subject": {"en": "Reminder {amount}"}}})
+    class Due:
+        date = "Friday"
+    assert index.version == "2"
+    assert index.placeholders("reminder") == {"amount", "due"}
+    assert index.render("reminder", "en", {"amount": 12000, "due": Due()}) == {"subject": "Reminder 12000", "body": "Due 12,000 on Friday {literal}"}
+
+def test_template_registry_hot_reloads_and_keeps_previous_versions(tmp_path):
+    import os
+    from app.services.templates import TemplateRegistry
+
+    templates_file = tmp_path / "notifications.json"
+    templates_file.write_text(json.dumps({"version": "1", "welcome": {"en": "Hello {name}", "subject": {"en": "Hi"}}}))
+    registry = TemplateRegistry(templates_file, max_versions=2)
+    registry.load()
+    first = registry.current
+    assert registry.reload_if_changed() is False
+
+    templates_file.write_text(json.dumps({"version": "2", "welcome": {"en": "Welcome back {name}", "subject": {"en": "Hi"}}}))
+    os.utime(templates_file, (1, 1))
+    assert registry.reload_if_changed() is True
+    assert registry.current.version == "2"
+    assert registry.get("1") is first
+    assert registry.get("1").render("welcome", "en", {"name": "Abebe"})["body"] == "Hello Abebe"
+    assert registry.get("2").render("welcome", "en", {"name": "Abebe"})["body"] == "Welcome back Abebe"
+
+    # A broken file keeps the current version live; evicted versions fall back to current
+    templates_file.write_text("{not json")
+    os.utime(templates_file, (2, 2))
+    registry.reload_if_changed()
+    assert registry.current.version == "2"
+    templates_file.write_text(json.dumps({"version": "3", "welcome": {"en": "Hey {name}"}}))
+    os.utime(templates_file, (3, 3))
+    registry.reload_if_changed()
+    assert registry.versions == ["2", "3"]
+    assert registry.get("1").version == "3"
+    assert registry.stats()["version_misses"] == 1
+
+def test_template_registry_restores_versions_from_archive(tmp_path):
+    from app.services.templates import TemplateRegistry
+
+    templates_file = tmp_path / "notifications.json"
+    archive_dir = tmp_path / "archive"
+    templates_file.write_text(json.dumps({"version": "1/a", "welcome": {"en": "Hello {name}"}}))
+    TemplateRegistry(templates_file, max_versions=1, archive_dir=archive_dir).load()
+    templates_file.write_text(json.dumps({"version": "2", "welcome": {"en": "Welcome back {name}"}}))
+
+    # A new process only loads the current file
+    registry = TemplateRegistry(templates_file, max_versions=1, archive_dir=archive_dir)
+    registry.load()
+    assert registry.get("1/a").render("welcome", "en", {"name": "Abebe"})["body"] == "Hello Abebe"
+    assert registry.get("2").version == "2" # Evicted again by the restore, and restored again
+    assert registry.get("unknown").version == "2"
+    assert registry.stats() == {"current_version": "2", "versions_retained": 1, "versions_restored": 2, "version_misses": 1}
+
+@pytest.mark.asyncio
+async def test_get_notifications_page_uses_keyset_cursor(mocker):
+    from app.models.notification import Notification
+    from app.services.notification import get_notifications_page
+    from app.utils.pagination import encode_cursor, decode_cursor
+
+    now = datetime.utcnow()
+    rows = [Notification(id=uuid4(), created_at=now - timedelta(minutes=i)) for i in range(3)]
+    mock_db = mocker.AsyncMock()
+    mock_db.execute.return_value = mocker.Mock(scalars=mocker.Mock(return_value=mocker.Mock(all=mocker.Mock(return_value=rows))))
+
+    cursor = (now, uuid4())
+    page, last_key = await get_notifications_page(mock_db, 2, cursor, status="FAILED", created_after=now - timedelta(days=1))
+
+    assert page == rows[:2]
+    assert last_key == (rows[1].created_at, rows[1].id)
+    assert decode_cursor(encode_cursor(*last_key)) == last_key
+    sql = str(mock_db.execute.call_args.args[0])
+    assert "(notifications.created_at, notifications.id) < (" in sql
+    assert "ORDER BY notifications.created_at DESC, notifications.id DESC" in sql
+    assert "LIMIT" in sql
+
+    mock_db.execute.return_value.scalars.return_value.all.return_value = rows[:1]
+    page, last_key = await get_notifications_page(mock_db, 2)
+    assert page == rows[:1] and last_key is None
+
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+@pytest.mark.asyncio
+async def test_export_notifications_streams_ndjson_and_csv_in_chunks(mocker):
+    import csv
+    import io
+    from app.services import export
+
+    now = datetime.utcnow()
+    rows = [
+        {"id": uuid4(), "user_id": uuid4(), "event_type": "payment_success", "status": "SENT", "attempts": 0, "template_version": "1.0",
+         "context": {"amount": i, "location": "Bole"}, "sent_at": now, "created_at": now, "updated_at": now}
+        for i in range(5)
+    ]
+    async def fake_stream(db, batch_size, **filters):
+        assert filters["status"] == "SENT"
+        for row in rows:
+            yield row
+    mock_session = mocker.AsyncMock()
+    mock_session.__aenter__.return_value = mock_session
+    mocker.patch("app.services.export.AsyncSessionLocal", return_value=mock_session)
+    mocker.patch("app.services.export.stream_notification_rows", side_effect=fake_stream)
+    mocker.patch.object(export.settings, "EXPORT_CHUNK_ROWS", 2)
+
+    chunks = [chunk async for chunk in export.export_notifications("ndjson", status="SENT")]
+    assert len(chunks) == 3
+    records = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert [r["context"]["amount"] for r in records] == [0, 1, 2, 3, 4]
+    assert records[0]["id"] == str(rows[0]["id"]) and records[0]["created_at"] == now.isoformat()
+
+    chunks = [chunk async for chunk in export.export_notifications("csv", status="SENT")]
+    parsed = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(parsed) == 5
+    assert json.loads(parsed[4]["context"]) == {"amount": 4, "location": "Bole"}
+
+@pytest.mark.asyncio
+async def test_get_notification_stats_reads_counters_in_one_grouped_query(mocker):
+    from types import SimpleNamespace
+    from app.services.notification import get_notification_stats
+
+    rows = [
+        SimpleNamespace(channel=None, event_type="payment_success", status="SENT", count=7, grouping_level=0),
+        SimpleNamespace(channel=None, event_type="payment_success", status="FAILED", count=1, grouping_level=0),
+        SimpleNamespace(channel=None, event_type="listing_approved", status="PENDING", count=2, grouping_level=0),
+        SimpleNamespace(channel=None, event_type=None, status="SENT", count=7, grouping_level=2),
+        SimpleNamespace(channel=None, event_type=None, status="FAILED", count=1, grouping_level=2),
+        SimpleNamespace(channel=None, event_type=None, status="PENDING", count=2, grouping_level=2),
+        SimpleNamespace(channel=None, event_type=None, status=None, count=10, grouping_level=3),
+        SimpleNamespace(channel="email", event_type=None, status="SENT", count=7, grouping_level=0),
+        SimpleNamespace(channel="sms", event_type=None, status="FAILED", count=3, grouping_level=0),
+    ]
+    mock_db = mocker.AsyncMock()
+    mock_db.execute.return_value = rows
+
+    stats = await get_notification_stats(mock_db)
+
+    mock_db.execute.assert_called_once()
+    assert "GROUPING SETS" in str(mock_db.execute.call_args.args[0])
+    assert stats["total_notifications"] == 10
+    assert (stats["total_sent"], stats["total_failed"], stats["total_pending"]) == (7, 1, 2)
+    assert stats["by_event_type"]["payment_success"] == {"SENT": 7, "FAILED": 1, "PENDING": 0}
+    assert stats["by_event_type"]["listing_approved"] == {"SENT": 0, "FAILED": 0, "PENDING": 2}
+    assert stats["by_channel"] == {"email": {"SENT": 7, "FAILED": 0, "REJECTED": 0}, "sms": {"SENT": 0, "FAILED": 3, "REJECTED": 0}}
+
+def test_latency_histogram_buckets_and_quantiles():
+    from app.services.delivery_stats import latency_bucket, histogram_quantile, LATENCY_BUCKETS_MS, LATENCY_OVERFLOW_MS
+
+    assert latency_bucket(0) == 100
+    assert latency_bucket(100) == 100
+    assert latency_bucket(101) == 250
+    assert latency_bucket(10**12) == LATENCY_OVERFLOW_MS
+
+    histogram = {100: 50, 1_000: 40, 10_000: 10}
+    assert histogram_quantile(0.5, histogram) == 100
+    assert histogram_quantile(0.95, histogram) == 7_500 # Halfway through (5000, 10000]
+    assert histogram_quantile(0.99, {100: 1, LATENCY_OVERFLOW_MS: 99}) == LATENCY_BUCKETS_MS[-1]
+    assert histogram_quantile(0.5, {250: 30}) == 175 # (100, 250], though the 100 bucket is empty
+    assert histogram_quantile(0.5, {10_000: 10}) == 7_500
+    assert histogram_quantile(0.5, {}) is None
+
+@pytest.mark.asyncio
+async def test_delivery_timeseries_fills_buckets_from_rollups(mocker):
+    from types import SimpleNamespace
+    from app.services.delivery_stats import get_delivery_timeseries
+
+    start = datetime(2026, 1, 1, 12, 0)
+    rows = [
+        SimpleNamespace(bucket=start, event_type="payment_success", status="SENT", latency_le_ms=250, count=30),
+        SimpleNamespace(bucket=start, event_type="payment_success", status="FAILED", latency_le_ms=1_000, count=6),
+        SimpleNamespace(bucket=start + timedelta(minutes=2), event_type="listing_approved", status="SENT", latency_le_ms=100, count=2),
+    ]
+    mock_db = mocker.AsyncMock()
+    mock_db.execute.return_value = rows
+
+    buckets = await get_delivery_timeseries(mock_db, "minute", start, start + timedelta(minutes=3))
+
+    assert "notification_delivery_rollups" in str(mock_db.execute.call_args.args[0])
+    assert [bucket["bucket_start"] for bucket in buckets] == [start + timedelta(minutes=i) for i in range(3)]
+    first, empty, last = buckets
+    assert first["total"] == 36
+    assert first["by_event_type"] == {"payment_success": {"SENT": 30, "FAILED": 6}}
+    assert first["rate_per_second"] == {"SENT": 0.5, "FAILED": 0.1}
+    assert first["latency_ms"]["p50"] == 175 # Only SENT outcomes feed the latency percentiles
+    assert empty["total"] == 0 and empty["latency_ms"] == {"p50": None, "p95": None, "p99": None}
+    assert last["by_status"] == {"SENT": 2}
+
+def test_expired_partitions_keep_the_retention_window():
+    from datetime import date
+    from app.services.partitions import NotificationPartition, expired_partitions
+
+    partitions = [NotificationPartition(f"notifications_2026_{month:02d}", date(2026, month, 1), True) for month in range(1, 11)]
+
+    expired = expired_partitions(partitions, today=date(2026, 10, 18), retention_months=3)
+
+    assert [partition.name for partition in expired] == [f"notifications_2026_{month:02d}" for month in range(1, 8)]
+
+@pytest.mark.asyncio
+async def test_archive_partition_writes_gzip_ndjson(mocker, tmp_path):
+    import gzip
+    from types import SimpleNamespace
+    from app.services.partitions import archive_partition
+
+    created_at = datetime(2025, 1, 5, 8, 30)
+    rows = [
+        SimpleNamespace(_mapping={
+            "id": uuid4(), "user_id": uuid4(), "event_type": "payment_success", "status": "SENT", "attempts": 0,
+            "template_version": "1.0", "context": {"amount": i}, "sent_at": created_at, "created_at": created_at, "updated_at": created_at,
+        })
+        for i in range(3)
+    ]
+
+    async def stream_rows():
+        for row in rows:
+            yield row
+
+    mock_db = mocker.AsyncMock()
+    mock_db.stream.return_value = stream_rows()
+
+    archived = await archive_partition(mock_db, "notifications_2025_01", tmp_path, batch_size=2)
+
+    assert archived == 3
+    assert 'FROM "notifications_2025_01"' in str(mock_db.stream.call_args.args[0])
+    with gzip.open(tmp_path / "notifications_2025_01.ndjson.gz", "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["context"]["amount"] for record in records] == [0, 1, 2]
+    assert records[0]["created_at"] == "2025-01-05T08:30:00"
+    assert not list(tmp_path.glob("*.tmp"))
+
+@pytest.mark.asyncio
+async def test_retry_delivers_claimed_batch_concurrently_and_persists_in_bulk(mocker):
+    from types import SimpleNamespace
+    from app.services import notification as notification_service
+
+    now = datetime.utcnow()
+    lease = now + timedelta(minutes=5)
+    def claimed_row(attempts, context, user_id):
+        return SimpleNamespace(
+            id=uuid4(), user_id=user_id, event_type="payment_failed", status="FAILED", attempts=attempts,
+            context=context, template_version="1.0", created_at=now - timedelta(minutes=10), locked_until=lease
+        )
+    ok_user, failing_user = uuid4(), uuid4()
+    context = {"property_title": "Flat", "location": "Bole", "amount": 500}
+    already_sent = claimed_row(1, context, ok_user)
+    resend_ok = [claimed_row(2, context, ok_user) for _ in range(4)]
+    exhausted = claimed_row(3, context, failing_user)
+    claimed = [already_sent, *resend_ok, exhausted]
+
+    mocker.patch.object(notification_service.settings, "RETRY_CONCURRENCY", 2)
+    mocker.patch("app.services.notification.claim_retryable_notifications", return_value=claimed)
+    mocker.patch("app.services.notification.get_users_details_bulk", return_value={
+        ok_user: {"email": "ok@example.com", "preferred_language": "en"},
+        failing_user: {"email": "bounce@example.com", "preferred_language": "en"},
+    })
+    in_flight = 0
+    max_in_flight = 0
+    async def fake_send(recipient, subject, body):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if recipient.startswith("bounce"):
+            raise ClientError({"Error": {"Code": "MessageRejected"}}, "SendEmail")
+        return f"ses-{uuid4()}"
+    mock_send = mocker.patch("app.services.notification.send_email", side_effect=fake_send)
+    mock_alert = mocker.patch("app.services.notification.send_admin_alert_email", return_value="alert-id")
+    mock_db = mocker.AsyncMock()
+    mock_db.execute.return_value = [SimpleNamespace(notification_id=already_sent.id, channel="email", status="SENT")] # Its email went out
+
+    await notification_service.retry_failed_notifications(mock_db)
+
+    assert mock_send.await_count == 5 # The row whose email was already delivered is not resent
+    assert max_in_flight == 2
+    mock_alert.assert_awaited_once()
+    assert str(exhausted.id) in mock_alert.call_args.kwargs["subject"]
+
+    update_call = next(call for call in mock_db.execute.call_args_list if "UPDATE notifications" in str(call.args[0]))
+    outcomes = {outcome["b_id"]: outcome for outcome in update_call.args[1]}
+    assert outcomes[already_sent.id]["status"] == "SENT" and outcomes[already_sent.id]["locked_until"] is None
+    assert all(outcomes[row.id]["status"] == "SENT" for row in resend_ok)
+    delivery_call = next(call for call in mock_db.execute.call_args_list if call.args[0] is notification_service._UPSERT_DELIVERIES)
+    deliveries = {delivery["notification_id"]: delivery for delivery in delivery_call.args[1]}
+    assert already_sent.id not in deliveries
+    assert all(deliveries[row.id]["status"] == "SENT" and deliveries[row.id]["provider_message_id"].startswith("ses-") for row in resend_ok)
+    assert deliveries[exhausted.id]["status"] == "REJECTED" and "MessageRejected" in deliveries[exhausted.id]["last_error"]
+    assert all(outcome["next_attempt_at"] is None for outcome in outcomes.values()) # Sent, or out of attempts
+    assert outcomes[exhausted.id]["status"] == "FAILED" and outcomes[exhausted.id]["locked_until"] is None
+    assert mock_db.commit.await_count == 2 # The reads end before the sends; the batch's outcomes commit together
+
+def test_backoff_policy_grows_exponentially_with_jitter_and_caps():
+    from app.utils.retry import BackoffPolicy
+
+    policy = BackoffPolicy(base_delay=60, max_delay=600, multiplier=2, max_attempts=5)
+    for attempts, full_delay in [(0, 60), (1, 120), (2, 240), (3, 480), (4, 600)]:
+        delays = [policy.next_delay(attempts) for _ in range(200)]
+        assert all(full_delay / 2 <= delay <= full_delay for delay in delays)
+        assert len(set(delays)) > 1 # Jittered, so failures from one outage spread out
+    assert policy.next_delay(5) is None
+
+    now = datetime(2026, 1, 1, 12, 0)
+    assert now + timedelta(seconds=30) <= policy.next_attempt_at(0, now) <= now + timedelta(seconds=60)
+    assert policy.next_attempt_at(5, now) is None
+
+@pytest.mark.asyncio
+async def test_failed_retry_is_rescheduled_by_event_type_policy(mocker):
+    from types import SimpleNamespace
+    from app.services import notification as notification_service
+    from app.utils.retry import BackoffPolicy
+
+    mocker.patch.dict(notification_service.retry_policies, {"payment_failed": BackoffPolicy(base_delay=10, max_delay=10, max_attempts=5)})
+    mocker.patch("app.services.notification.send_email", side_effect=ClientError({"Error": {"Code": "Throttling"}}, "SendEmail"))
+    mock_alert = mocker.patch("app.services.notification.send_admin_alert_email")
+    row = SimpleNamespace(
+        id=uuid4(), user_id=uuid4(), event_type="payment_failed", status="FAILED", attempts=3,
+        context={"property_title": "Flat", "location": "Bole", "amount": 500}, template_version="1.0",
+        created_at=datetime.utcnow(), locked_until=None
+    )
+
+    before = datetime.utcnow()
+    outcome = await notification_service._retry_notification(row, {"email": "a@example.com"}, asyncio.Semaphore(1))
+
+    assert outcome["status"] == "FAILED"
+    assert before + timedelta(seconds=5) <= outcome["next_attempt_at"] <= datetime.utcnow() + timedelta(seconds=10)
+    mock_alert.assert_not_called() # 3 of this event type's 5 attempts used
+
+@pytest.mark.asyncio
+async def test_job_runner_skips_overlapping_runs_and_times_out():
+    from app.core.jobs import JobRunner
+
+    release = asyncio.Event()
+    calls = 0
+    async def slow_job():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+
+    runner = JobRunner("test_overlap_job", slow_job, timeout=0.2)
+    first = asyncio.create_task(runner.run())
+    await asyncio.sleep(0)
+    await runner.run() # Previous run still in progress
+    await first # Cancelled by the timeout
+
+    assert calls == 1
+    assert runner.stats["skipped_overlap"] == 1
+    assert runner.stats["timeouts"] == 1
+
+    async def failing_job():
+        raise RuntimeError("boom")
+    failing = JobRunner("test_failing_job", failing_job, timeout=1)
+    await failing.run()
+    await failing.run() # A failed run does not block the next one
+    assert failing.stats["runs"] == 2 and failing.stats["failures"] == 2
+
+@pytest.mark.asyncio
+async def test_job_runner_only_runs_on_the_advisory_lock_holder(mocker):
+    from contextlib import asynccontextmanager
+    from app.core import jobs
+
+    lock_results = iter([True, False])
+    conn = mocker.AsyncMock()
+    conn.execute.side_effect = lambda stmt, params: mocker.Mock(scalar=mocker.Mock(return_value=next(lock_results) if "try_advisory" in str(stmt) else True))
+    @asynccontextmanager
+    async def connect():
+        yield conn
+    mocker.patch.object(jobs, "engine", mocker.Mock(connect=connect))
+    job = mocker.AsyncMock()
+
+    runner = jobs.JobRunner("test_leader_job", job, timeout=1, leader=True)
+    await runner.run() # Lock acquired
+    await runner.run() # Another replica holds the lock
+
+    job.assert_awaited_once()
+    assert runner.stats["skipped_not_leader"] == 1
+    statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+    assert statements.count("SELECT pg_advisory_unlock(:key)") == 1
+    assert all(call.args[1] == {"key": runner.lock_key} for call in conn.execute.call_args_list)
+
+@pytest.mark.asyncio
+async def test_job_runner_discards_the_connection_when_unlock_fails(mocker):
+    from contextlib import asynccontextmanager
+    from sqlalchemy.exc import OperationalError
+    from app.core import jobs
+
+    conn = mocker.AsyncMock()
+    def execute(stmt, params):
+        if "unlock" in str(stmt):
+            raise OperationalError("SELECT pg_advisory_unlock", params, Exception("connection reset"))
+        return mocker.Mock(scalar=mocker.Mock(return_value=True))
+    conn.execute.side_effect = execute
+    @asynccontextmanager
+    async def connect():
+        yield conn
+    mocker.patch.object(jobs, "engine", mocker.Mock(connect=connect))
+    job = mocker.AsyncMock()
+
+    runner = jobs.JobRunner("test_unlock_failure_job", job, timeout=1, leader=True)
+    await runner.run()
+
+    job.assert_awaited_once()
+    conn.invalidate.assert_awaited_once()
+    assert runner.stats["failures"] == 1
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_counts_checkouts_and_timeouts(mocker):
+    from sqlalchemy import exc
+    from sqlalchemy.util import greenlet_spawn
+    from app.database import InstrumentedAsyncQueuePool, engine
+
+    def exhaust_pool():
+        pool = InstrumentedAsyncQueuePool(creator=mocker.Mock, pool_size=1, max_overflow=0, timeout=0.05)
+        held = pool.connect()
+        with pytest.raises(exc.TimeoutError):
+            pool.connect()
+        held.close()
+        pool.connect().close()
+        return pool.stats()
+
+    stats = await greenlet_spawn(exhaust_pool)
+
+    assert stats["checkouts"] == 2
+    assert stats["checkout_timeouts"] == 1
+    assert stats["checkout_wait_seconds_max"] >= 0.05
+    assert stats["checked_out"] == 0
+    assert isinstance(engine.pool, InstrumentedAsyncQueuePool)
+    assert engine.echo is False
+
+@pytest.mark.asyncio
+async def test_hot_statements_are_built_once_and_bound_per_call(mocker):
+    from app.services import notification as notification_service
+
+    stored = notification_service.Notification(id=uuid4(), user_id=uuid4(), event_type="payment_success", status="PENDING", context={})
+    mock_db = mocker.AsyncMock()
+    mock_db.scalars.return_value = mocker.Mock(one=mocker.Mock(return_value=stored))
+
+    record = await notification_service.enqueue_notification(mock_db, stored.user_id, "payment_success", {"amount": 1})
+
+    assert record is stored
+    stmt, rows = mock_db.scalars.call_args.args
+    assert stmt is notification_service._INSERT_NOTIFICATION and "RETURNING" in str(stmt)
+    assert rows[0]["user_id"] == stored.user_id and rows[0]["status"] == "PENDING"
+    mock_db.refresh.assert_not_called()
+
+    first_id, second_id = uuid4(), uuid4()
+    await notification_service.get_notification_by_id(mock_db, first_id)
+    await notification_service.get_notification_by_id(mock_db, second_id)
+    (first_stmt, first_params), (second_stmt, second_params) = [call.args for call in mock_db.execute.call_args_list]
+    assert first_stmt is second_stmt is notification_service._SELECT_NOTIFICATION_BY_ID
+    assert (first_params, second_params) == ({"notification_id": first_id}, {"notification_id": second_id})
+
+    mock_db.execute.reset_mock()
+    lease_until = datetime.utcnow() + timedelta(seconds=60)
+    mock_db.execute.return_value = [mocker.Mock(id=first_id, user_id=stored.user_id, locked_until=lease_until)]
+    claimed = await notification_service.claim_pending_notifications(mock_db, limit=5, lease_seconds=60)
+    assert claimed == [(first_id, stored.user_id, lease_until)]
+    mock_db.execute.assert_awaited_once() # Select and lease in one statement
+    assert mock_db.execute.call_args.args[0] is notification_service._CLAIM_PENDING
+    assert mock_db.execute.call_args.args[1]["limit"] == 5
+
+@pytest.mark.asyncio
+async def test_channels_are_sent_concurrently_and_recorded_as_separate_deliveries(mocker):
+    from types import SimpleNamespace
+    from app.services import notification as notification_service
+
+    user = {"email": "a@example.com", "phone_number": "+251900000000", "preferred_language": "en"}
+    mocker.patch("app.services.notification.get_user_details_from_user_management", return_value=user)
+    mocker.patch("app.services.notification.record_delivery_outcome")
+    async def slow_failing_email(recipient, subject, body):
+        await asyncio.sleep(0.2)
+        raise ClientError({"Error": {"Code": "Throttling"}}, "SendEmail")
+    mock_email = mocker.patch("app.services.notification.send_email", side_effect=slow_failing_email)
+    sms_finished_at = []
+    async def fast_sms(phone_number, message):
+        sms_finished_at.append(time.monotonic())
+        return "sms-1"
+    mock_sms = mocker.patch("app.services.notification.send_sms", side_effect=fast_sms)
+    notification = notification_service.Notification(
+        id=uuid4(), user_id=uuid4(), event_type="payment_failed", status="PENDING", attempts=0,
+        context={"property_title": "Flat", "location": "Bole", "amount": 500}, created_at=datetime.utcnow()
+    )
+
+    mock_db = mocker.AsyncMock()
+    started = time.monotonic()
+    await notification_service.deliver_notification(mock_db, notification)
+
+    assert sms_finished_at[0] - started < 0.1 # The SMS did not wait for the slow email
+    assert notification.status == "FAILED" and notification.next_attempt_at is not None
+    statement, rows = mock_db.execute.call_args.args
+    assert statement is notification_service._UPSERT_DELIVERIES
+    deliveries = {row["channel"]: row for row in rows}
+    assert deliveries["sms"]["status"] == "SENT" and deliveries["sms"]["provider_message_id"] == "sms-1"
+    assert deliveries["email"]["status"] == "FAILED" and "Throttling" in deliveries["email"]["last_error"]
+    assert {row["notification_created_at"] for row in rows} == {notification.created_at}
+
+    mock_email.side_effect = None
+    mock_email.return_value = "ses-1"
+    row = SimpleNamespace(
+        id=notification.id, user_id=notification.user_id, event_type="payment_failed", status="FAILED", attempts=1,
+        context=notification.context, template_version="1.0", created_at=notification.created_at, locked_until=None
+    )
+    outcome = await notification_service._retry_notification(row, user, asyncio.Semaphore(1), settled_channels={"sms": "SENT"})
+
+    assert outcome["status"] == "SENT"
+    mock_sms.assert_awaited_once() # Not resent on retry
+    assert [(delivery["channel"], delivery["status"], delivery["provider_message_id"]) for delivery in outcome["deliveries"]] == [("email", "SENT", "ses-1")]
+
+@pytest.mark.asyncio
+async def test_channel_providers_are_selected_through_settings(mocker):
+    from app.config import settings
+    from app.providers import base, get_provider, start_providers, close_providers
+    from app.providers.fake import FakeProvider
+    from app.providers.smtp import SMTPEmailProvider
+
+    mocker.patch.dict(base._active_providers, clear=True)
+    mocker.patch.object(settings, "EMAIL_PROVIDER", "smtp")
+    mocker.patch.object(settings, "SMS_PROVIDER", "fake")
+    mock_smtp = mocker.patch("app.providers.smtp.smtplib.SMTP")
+    server = mock_smtp.return_value.__enter__.return_value
+
+    await start_providers()
+    try:
+        email, sms = get_provider("email"), get_provider("sms")
+        assert isinstance(email, SMTPEmailProvider) and isinstance(sms, FakeProvider)
+        assert get_provider("email") is email
+
+        message_id = await email.send("tenant@example.com", "Payment received", "Thanks")
+        mock_smtp.assert_called_once_with(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        message = server.send_message.call_args.args[0]
+        assert (message["To"], message["Subject"], message["Message-ID"]) == ("tenant@example.com", "Payment received", message_id)
+        assert base.provider_stats()["email"] == {"provider": "smtp", "sent": 1, "failed": 0, "send_rate": None}
+    finally:
+        await close_providers()
+
+    mocker.patch.object(settings, "SMS_PROVIDER", "carrier-pigeon")
+    with pytest.raises(ValueError, match="Unknown sms provider 'carrier-pigeon'"):
+        get_provider("sms")
+
+@pytest.mark.asyncio
+async def test_send_rate_governor_spaces_sends_to_the_quota(mocker):
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    from app.providers.fake import FakeProvider
+    from app.providers.rate_governor import SendRateExceeded, SendRateGovernor
+
+    mocker.patch("app.providers.rate_governor.time.monotonic", return_value=1000.0) # Every send arrives at once
+    mock_sleep = mocker.patch("app.providers.rate_governor.asyncio.sleep")
+    governor = SendRateGovernor("send_rate:email:ses", rate=10, burst=2, max_wait=0.25)
+
+    for _ in range(4):
+        await governor.acquire()
+    with pytest.raises(SendRateExceeded):
+        await governor.acquire()
+
+    # The burst goes out immediately, then one send every 1/rate seconds
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [pytest.approx(0.1), pytest.approx(0.2)]
+    assert (governor.stats["acquired"], governor.stats["delayed"], governor.stats["rejected"]) == (4, 2, 1)
+
+    # Shared across replicas through the Redis script; pacing falls back to this replica if Redis is down
+    mock_redis = mocker.Mock()
+    mock_script = mock_redis.register_script.return_value = mocker.AsyncMock(side_effect=[50_000, RedisConnectionError("down")])
+    shared = SendRateGovernor("send_rate:email:ses", rate=10, burst=1, redis_client=mock_redis)
+    mock_sleep.reset_mock()
+    await shared.acquire()
+    await shared.acquire()
+    assert mock_script.call_args_list[0].kwargs == {"keys": ["send_rate:email:ses"], "args": [100_000, 0, 30_000_000]}
+    assert mock_sleep.call_args_list[0].args[0] == pytest.approx(0.05)
+    assert shared.stats["redis_errors"] == 1 and shared.stats["acquired"] == 2
+
+    # Providers wait for their slot before sending
+    provider = FakeProvider("email")
+    provider.latency_ms = 0
+    provider.governor = mocker.Mock(acquire=mocker.AsyncMock(side_effect=SendRateExceeded("saturated")))
+    with pytest.raises(SendRateExceeded):
+        await provider.send("a@example.com", "Subject", "Body")
+    assert provider.stats["failed"] == 1 and not provider.outbox
+
+@pytest.mark.asyncio
+async def test_async_retry_classifies_errors_and_counts_decisions(mocker):
+    import httpx
+    import smtplib
+    from app.utils import retry
+    from app.utils.retry import async_retry, classify_error, CircuitBreaker, PERMANENT, THROTTLED, TRANSIENT
+
+    def throttled(retry_after=None):
+        headers = {"retry-after": str(retry_after)} if retry_after else {}
+        return ClientError({"Error": {"Code": "Throttling"}, "ResponseMetadata": {"HTTPHeaders": headers}}, "SendEmail")
+    rejected = ClientError({"Error": {"Code": "MessageRejected"}}, "SendEmail")
+    assert classify_error(rejected).kind == PERMANENT
+    assert classify_error(throttled(7)) == (THROTTLED, 7.0)
+    assert classify_error(TimeoutError()).kind == TRANSIENT
+    too_many = httpx.HTTPStatusError("429", request=httpx.Request("POST", "http://sms"), response=httpx.Response(429, headers={"Retry-After": "3"}))
+    assert classify_error(too_many) == (THROTTLED, 3.0)
+    assert classify_error(smtplib.SMTPRecipientsRefused({"x@example.com": (550, b"No such user")})).kind == PERMANENT
+
+    mocker.patch.dict(retry._retry_decisions, clear=True)
+    mock_sleep = mocker.patch("app.utils.retry.asyncio.sleep")
+    breaker = CircuitBreaker(failure_threshold=1)
+    provider_send = mocker.AsyncMock(side_effect=[rejected, throttled(5), TimeoutError(), "message-id", throttled(60)])
+
+    async def send():
+        return await provider_send()
+
+    with pytest.raises(ClientError):
+        await async_retry(tries=3, circuit_breaker=breaker)(send)() # Permanent: one call, no sleep, and the breaker does not count it
+    assert provider_send.await_count == 1 and not mock_sleep.called and breaker.failures == 0
+
+    governed_send = async_retry(tries=3, delay=2, backoff=2, max_delay=30)(send)
+    assert await governed_send() == "message-id"
+    first_wait, second_wait = [call.args[0] for call in mock_sleep.call_args_list]
+    assert first_wait == 5 # The provider's retry-after
+    assert 2 <= second_wait <= 4 # Jittered delay * backoff
+
+    with pytest.raises(ClientError):
+        await governed_send() # Retry-after beyond max_delay is left to the scheduler
+    assert mock_sleep.call_count == 2
+    assert retry.retry_decision_stats()["send"] == {"permanent_fail_fast": 1, "throttled_retry": 1, "transient_retry": 1, "throttled_deferred": 1}
+
+@pytest.mark.asyncio
+async def test_permanent_rejection_is_not_rescheduled_and_throttling_honours_retry_after(mocker):
+    from types import SimpleNamespace
+    from app.services import notification as notification_service
+
+    user = {"email": "gone@example.com", "phone_number": "+251900000000", "preferred_language": "en"}
+    mocker.patch("app.services.notification.send_email", side_effect=ClientError({"Error": {"Code": "MessageRejected"}}, "SendEmail"))
+    mocker.patch("app.services.notification.send_sms", return_value="sms-1")
+    mock_alert = mocker.patch("app.services.notification.send_admin_alert_email")
+    row = SimpleNamespace(
+        id=uuid4(), user_id=uuid4(), event_type="payment_failed", status="FAILED", attempts=1,
+        context={"property_title": "Flat", "location": "Bole", "amount": 500}, template_version="1.0",
+        created_at=datetime.utcnow(), locked_until=None
+    )
+
+    outcome = await notification_service._retry_notification(row, user, asyncio.Semaphore(1))
+
+    assert outcome["status"] == "FAILED" and outcome["next_attempt_at"] is None # 1 of 3 attempts used, but retrying cannot help
+    assert {delivery["channel"]: delivery["status"] for delivery in outcome["deliveries"]} == {"email": "REJECTED", "sms": "SENT"}
+    mock_alert.assert_awaited_once()
+
+    # A later retry never resends a rejected channel, and the notification stays unscheduled
+    outcome = await notification_service._retry_notification(row, user, asyncio.Semaphore(1), settled_channels={"email": "REJECTED"})
+    assert outcome["status"] == "FAILED" and outcome["next_attempt_at"] is None
+    assert [delivery["channel"] for delivery in outcome["deliveries"]] == ["sms"]
+
+    throttled = ClientError({"Error": {"Code": "Throttling"}, "ResponseMetadata": {"HTTPHeaders": {"retry-after": "7200"}}}, "SendEmail")
+    mocker.patch("app.services.notification.send_email", side_effect=throttled)
+    before = datetime.utcnow()
+    outcome = await notification_service._retry_notification(row, user, asyncio.Semaphore(1))
+    assert outcome["next_attempt_at"] >= before + timedelta(seconds=7200) # Beyond the policy's own backoff
+
+@pytest.mark.asyncio
+async def test_first_send_rejected_outright_is_not_rescheduled_and_alerts(mocker):
+    from app.services import notification as notification_service
+
+    user = {"email": "no-such-user@example.com", "phone_number": "+251900000000", "preferred_language": "en"}
+    mocker.patch("app.services.notification.get_user_details_from_user_management", return_value=user)
+    mocker.patch("app.services.notification.record_delivery_outcome")
+    mocker.patch("app.services.notification.send_email", side_effect=ClientError({"Error": {"Code": "MessageRejected"}}, "SendEmail"))
+    mocker.patch("app.services.notification.send_sms", return_value="sms-1")
+    mock_alert = mocker.patch("app.services.notification.send_admin_alert_email")
+    notification = notification_service.Notification(
+        id=uuid4(), user_id=uuid4(), event_type="payment_failed", status="PENDING", attempts=0,
+        context={"property_title": "Flat", "location": "Bole", "amount": 500}, created_at=datetime.utcnow()
+    )
+
+    await notification_service.deliver_notification(mocker.AsyncMock(), notification)
+
+    assert notification.status == "FAILED" and notification.next_attempt_at is None
+    mock_alert.assert_awaited_once()
+    assert str(notification.id) in mock_alert.call_args.kwargs["subject"]
+
+@pytest.mark.asyncio
+async def test_saturated_send_rate_governor_does_not_open_the_email_circuit_breaker(mocker):
+    from app.providers.fake import FakeProvider
+    from app.providers.rate_governor import SendRateExceeded, SendRateGovernor
+    from app.services.notification import send_email, email_circuit_breaker
+
+    mocker.patch.object(email_circuit_breaker, "failures", 0)
+    mocker.patch.object(email_circuit_breaker, "state", "CLOSED")
+    mocker.patch("app.utils.retry.asyncio.sleep")
+    provider = FakeProvider("email")
+    provider.latency_ms = 0
+    provider.error_rate = 0.0
+    provider.governor = SendRateGovernor("send_rate:email:fake", rate=0.001, burst=1, max_wait=0) # One send, then a slot every 1000s
+    mocker.patch("app.services.notification.get_provider", return_value=provider)
+
+    await send_email("a@example.com", "Subject", "Body")
+    for _ in range(email_circuit_breaker.failure_threshold * 2):
+        with pytest.raises(SendRateExceeded):
+            await send_email("a@example.com", "Subject", "Body")
+
+    assert email_circuit_breaker.state == "CLOSED" and email_circuit_breaker.failures == 0
+    assert provider.governor.stats["rejected"] == email_circuit_breaker.failure_threshold * 2 # Deferred to the scheduler, not retried in-process
+
+@pytest.mark.asyncio
+async def test_delivery_outcome_is_dropped_once_the_lease_is_lost(mocker):
+    from app.services import notification as notification_service
+    from app.services.outbox import OutboxWorkerPool
+
+    user = {"email": "a@example.com", "phone_number": "+251900000000", "preferred_language": "en"}
+    mocker.patch("app.services.notification.get_user_details_from_user_management", return_value=user)
+    mock_record = mocker.patch("app.services.notification.record_delivery_outcome")
+    mocker.patch("app.services.notification.send_email", return_value="ses-1")
+    mocker.patch("app.services.notification.send_sms", return_value="sms-1")
+    lease_until = datetime.utcnow() + timedelta(seconds=60)
+    notification = notification_service.Notification(
+        id=uuid4(), user_id=uuid4(), event_type="payment_success", status="PENDING", attempts=0, locked_until=lease_until,
+        context={"property_title": "Flat", "location": "Bole", "amount": 500}, created_at=datetime.utcnow()
+    )
+
+    mock_db = mocker.AsyncMock()
+    mock_db.execute.return_value = mocker.Mock(rowcount=0) # Re-claimed by another worker while this one was sending
+    assert await notification_service.deliver_notification(mock_db, notification, lease_until) is None
+
+    statement, params = mock_db.execute.call_args.args
+    assert statement is notification_service._SETTLE_NOTIFICATION and mock_db.execute.await_count == 1
+    assert params["b_claimed_lease"] == lease_until and params["status"] == "SENT"
+    mock_db.rollback.assert_awaited_once()
+    mock_db.commit.assert_not_awaited()
+    mock_record.assert_not_called()
+
+    # A lease that expired while the id sat in the worker queue is not delivered at all
+    notification.status, notification.locked_until = "PENDING", lease_until
+    mock_session = mocker.AsyncMock()
+    mock_session.__aenter__.return_value = mock_session
+    mocker.patch("app.services.outbox.AsyncSessionLocal", return_value=mock_session)
+    mocker.patch("app.services.outbox.get_notification_by_id", return_value=notification)
+    mock_deliver = mocker.patch("app.services.outbox.deliver_notification")
+    pool = OutboxWorkerPool(workers=1, batch_size=1, poll_interval=1, lease_seconds=60)
+    await pool._deliver(notification.id, lease_until - timedelta(seconds=60))
+    mock_deliver.assert_not_called()
+    await pool._deliver(notification.id, lease_until)
+    mock_deliver.assert_awaited_once_with(mock_session, notification, lease_until)
+
+@pytest.mark.asyncio
+async def test_verified_token_cache_does_not_recache_a_revoked_token(mocker):
+    from app.core.auth_cache import VerifiedTokenCache
+
+    mock_redis = mocker.AsyncMock()
+    mock_redis.exists.return_value = 1
+    mock_redis.mget.return_value = [None, b"1"]
+    cache = VerifiedTokenCache(maxsize=10, local_ttl=60, shared_ttl=900, redis_client=mock_redis)
+
+    # Verification finished after another replica revoked the token
+    await cache.set("token", {"user_id": "u", "role": "Admin"})
+
+    mock_redis.exists.assert_awaited_once_with(f"auth_revoked:{cache.token_hash('token')}")
+    mock_redis.set.assert_not_called()
+    assert await cache.get("token") is None
@@ -0,0 +1,94 @@
+"""
+Query-plan regression tests for the hot notification queries.
+
+Each query is EXPLAINed against a throwaway schema built by the real migrations, with sequential
+scans disabled: if no index can serve the query the planner still falls back to a Seq Scan, so
+its presence means an index was dropped or the query stopped matching one. Needs the test database.
+"""
+import json
+import uuid
+import asyncpg
+import pytest
+import pytest_asyncio
+from app.config import settings
+from app.migrate import _asyncpg_dsn, apply_migrations
+
+TEST_DATABASE_URL = settings.DATABASE_URL.replace("public", "test_notifications")
+
+HOT_QUERIES = {
+    "retry_due": (
+        "SELECT id FROM notifications WHERE status = 'FAILED' AND next_attempt_at <= now() "
+        "AND (locked_until IS NULL OR locked_until < now()) ORDER BY next_attempt_at LIMIT 100 FOR UPDATE SKIP LOCKED",
+        {"idx_notifications_next_attempt"},
+    ),
+    "claim_pending": (
+        "SELECT id FROM notifications WHERE status = 'PENDING' AND (locked_until IS NULL OR locked_until < now()) "
+        "ORDER BY created_at LIMIT 50 FOR UPDATE SKIP LOCKED",
+        {"idx_notifications_pending"},
+    ),
+    "list_by_user": (
+        "SELECT * FROM notifications WHERE user_id = '123e4567-e89b-12d3-a456-426614174000' ORDER BY created_at, id LIMIT 50",
+        {"idx_notifications_user_created"},
+    ),
+    "list_by_event_and_status": (
+        "SELECT * FROM notifications WHERE event_type = 'payment_success' AND status = 'SENT' "
+        "AND created_at >= now() - interval '1 day' ORDER BY created_at, id LIMIT 50",
+        {"idx_notifications_event_status_created"},
+    ),
+    "time_range": (
+        "SELECT count(*) FROM notifications WHERE created_at >= now() - interval '2 hours' AND created_at < now() - interval '1 hour'",
+        {"idx_notifications_created_at_brin", "idx_notifications_created_at_id"},
+    ),
+}
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+@pytest_asyncio.fixture
+async def plan_conn():
+    try:
+        conn = await asyncpg.connect(_asyncpg_dsn(TEST_DATABASE_URL), timeout=5)
+    except (OSError, asyncpg.PostgresError) as e:
+        pytest.skip(f"Test database not available: {e}")
+    schema = f"query_plans_{uuid.uuid4().hex[:8]}"
+    await conn.execute(f"CREATE SCHEMA {schema}")
+    await conn.execute(f"SET search_path TO {schema}")
+    try:
+        await apply_migrations(conn)
+        await conn.execute("""
+            INSERT INTO notifications (id, user_id, event_type, status, attempts, context, created_at, updated_at)
+            SELECT gen_random_uuid(), ('123e4567-e89b-12d3-a456-4266141740' || lpad((i % 100)::text, 2, '0'))::uuid,
+                   (ARRAY['payment_success', 'payment_failed', 'listing_approved'])[1 + i % 3],
+                   (ARRAY['SENT', 'SENT', 'SENT', 'FAILED', 'PENDING'])[1 + i % 5],
+                   i % 4, '{}'::jsonb, now() - (i || ' seconds')::interval, now()
+            FROM generate_series(1, 5000) AS i
+        """)
+        await conn.execute("UPDATE notifications SET next_attempt_at = created_at + interval '1 hour' WHERE status = 'FAILED' AND attempts < 3")
+        await conn.execute("ANALYZE notifications")
+        await conn.execute("SET enable_seqscan = off")
+        yield conn
+    finally:
+        await conn.execute(f"DROP SCHEMA {schema} CASCADE")
+        await conn.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+async def test_hot_query_uses_index(plan_conn, name):
+    query, expected_indexes = HOT_QUERIES[name]
+    plan = json.loads(await plan_conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}"))[0]["Plan"]
+    nodes = list(_plan_nodes(plan))
+
+    assert not [node for node in nodes if node["Node Type"] == "Seq Scan"], f"{name} fell back to a sequential scan: {plan}"
+    # Plans name the per-partition indexes; map them back to the index declared on notifications
+    used = await plan_conn.fetch("""
+        SELECT parent.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE child.relname = ANY($1::text[])
+    """, [node["Index Name"] for node in nodes if "Index Name" in node])
+    assert {row["relname"] for row in used} & expected_indexes, f"{name} did not use {expected_indexes}: {plan}"